@@ -0,0 +1,107 @@
+import os
+import random
+from typing import List
+
+
+TOPICS = [
+    ("Map Pocket", "espacio libre entre el portaobjetos y los controles del asiento"),
+    ("Trim Foot", "zonas de interfaz con transición de {mm} mm"),
+    ("Pull Handle", "zona de agarre de 360 grados con al menos {n} sujetadores"),
+    ("Pull Cup", "integración en el panel con un solo tornillo de {mm} mm"),
+    ("Seat Belt Buckle", "gap mínimo de {mm} mm entre la pestaña y el panel"),
+    ("Label", "área plana con línea guía a {mm} mm del borde"),
+    ("Protective Tape", "cinta de {n}x{n} mm en las esquinas superiores para transporte en racks"),
+]
+
+SENTENCES = [
+    "El diseño del {topic} debe garantizar {detail}.",
+    "Según la Best Practice {bp}, el {topic} requiere validar {detail} en CAD antes del release.",
+    "La revisión de ingeniería confirma que el {topic} cumple con {detail}.",
+    "Para vehículos de exportación, el {topic} incluye {detail}.",
+    "Se recomienda verificar el {topic} en el panel de la puerta con {detail}.",
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    bp = rng.randint(1, len(TOPICS))
+    topic, detail = TOPICS[bp - 1]
+    detail = detail.format(mm=rng.choice([0, 1.5, 3, 5, 10, 100]), n=rng.choice([2, 3, 100]))
+    return rng.choice(SENTENCES).format(bp=bp, topic=topic, detail=detail)
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """
+    Write a minimal text-only PDF with one Helvetica line per entry.
+
+    Args:
+        path: Output file
+        pages: Lines of text for each page
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, filled once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_refs = []
+    for lines in pages:
+        commands = ["BT", "/F1 10 Tf", "12 TL", "50 800 Td"]
+        for line in lines:
+            commands.append(f"({_escape(line)}) Tj T*")
+        commands.append("ET")
+        stream = "\n".join(commands).encode("cp1252", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % ref for ref in page_refs)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_refs))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(output_dir: str, total_pages: int, pages_per_file: int = 10,
+                    lines_per_page: int = 40, seed: int = 0) -> List[str]:
+    """
+    Generate synthetic Best Practice PDFs for benchmarking.
+
+    Args:
+        output_dir: Directory the PDFs are written to
+        total_pages: Number of pages across all files
+        pages_per_file: Pages in each PDF
+        lines_per_page: Sentences on each page
+        seed: Random seed, so a given size always produces the same corpus
+
+    Returns:
+        Paths of the generated PDFs
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for file_number in range(0, total_pages, pages_per_file):
+        n_pages = min(pages_per_file, total_pages - file_number)
+        # Each page is one Best Practice section, as in the real documents
+        pages = [[f"Best Practice {rng.randint(1, len(TOPICS))}"] + [_sentence(rng) for _ in range(lines_per_page)]
+                 for _ in range(n_pages)]
+        path = os.path.join(output_dir, f"synthetic_{file_number // pages_per_file:05d}.pdf")
+        write_pdf(path, pages)
+        paths.append(path)
+    return paths
@@ -0,0 +1,148 @@
+import json
+import time
+import random
+import asyncio
+import threading
+
+from aiohttp import web
+
+
+DEFAULT_ANSWER = json.dumps({
+    "texto": "Según la Best Practice 4, la manija Pull Cup se integra en el panel de la puerta "
+             "y se sujeta a la lámina metálica con un solo tornillo. Verifica el espacio libre en CAD.",
+    "imagenes": ["bp4_pull_cup.png"]
+}, ensure_ascii=False)
+
+
+class StubLLMServer:
+    """
+    Local OpenAI-compatible chat completions endpoint with configurable speed.
+
+    Replaces the Nebius/DeepSeek endpoint during benchmarks: it waits
+    ``latency`` seconds before the first token and then emits tokens at
+    ``tokens_per_second``. A fraction of the requests can stall for
+    ``stall_latency`` seconds instead, to reproduce a provider's slow tail.
+    Point LLM_BASE_URL (or a backend of LLM_BACKENDS) at ``base_url`` to use it.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.5,
+                 tokens_per_second: float = 50, answer: str = DEFAULT_ANSWER,
+                 stall_fraction: float = 0.0, stall_latency: float = 10.0, seed: int = None):
+        """
+        Initialize the stub server.
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on. 0 picks a free port
+            latency: Seconds before the first token
+            tokens_per_second: Generation speed after the first token
+            answer: Completion returned for every request
+            stall_fraction: Fraction of requests that wait stall_latency before
+                the first token instead of latency
+            stall_latency: Seconds before the first token of a stalled request
+            seed: Seed choosing the stalled requests, for reproducible runs
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer = answer
+        self.stall_fraction = stall_fraction
+        self.stall_latency = stall_latency
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        """Start serving in a background thread."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        """Stop the server and its thread."""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _tokens(self):
+        # Roughly one token per word, keeping the separators
+        return [word + " " for word in self.answer.split(" ")]
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        tokens = self._tokens()
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        stalled = self._random.random() < self.stall_fraction
+        await asyncio.sleep(self.stall_latency if stalled else self.latency)
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+            return web.json_response({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "stub"), "system_fingerprint": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": self.answer.strip()}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                          "total_tokens": prompt_tokens + len(tokens)},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        try:
+            await response.prepare(request)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                chunk = {
+                    "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model", "stub"), "system_fingerprint": "stub",
+                    "choices": [{"index": 0, "delta": {"content": token if i < len(tokens) - 1 else token.rstrip()}}],
+                }
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model", "stub"), "system_fingerprint": "stub", "choices": [],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                              "total_tokens": prompt_tokens + len(tokens)},
+                }
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client gave up on this request, e.g. a hedged request answered first
+            pass
+        return response
@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import random
+import asyncio
+import platform
+import statistics
+from typing import Dict, List
+
+from pypdf import PdfReader
+
+from myapp.utils.rag_service import RAGService
+from .corpus import generate_corpus
+
+
+QUERIES = [
+    "¿Qué espacio libre necesita el portaobjetos respecto a los controles del asiento?",
+    "¿Cuáles son las zonas del Trim Foot y sus medidas?",
+    "¿Cuántos sujetadores necesita la manija Pull Handle?",
+    "¿Cómo se fija la manija Pull Cup al panel?",
+    "¿Qué gap se requiere entre la pestaña del cinturón y el panel?",
+    "¿Dónde se coloca la etiqueta de información?",
+    "¿Qué tamaño tiene la cinta protectora para transporte en racks?",
+    "¿Qué cobertura de cinta requieren los vehículos de exportación?",
+    "Best Practice 3",
+    "requisitos de CAD para el panel de la puerta",
+]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarize latencies in seconds as milliseconds."""
+    ordered = sorted(samples)
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": at(0.50),
+        "p90_ms": at(0.90),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def count_pages(data_dir: str) -> int:
+    """Number of PDF pages in a directory, used as the 1x corpus size."""
+    pages = 0
+    for name in os.listdir(data_dir):
+        if name.lower().endswith(".pdf"):
+            pages += len(PdfReader(os.path.join(data_dir, name)).pages)
+    return pages
+
+
+class BenchmarkSuite:
+    """
+    Offline benchmarks for the RAG chat pipeline.
+
+    Builds an index over a synthetic corpus for each scale and measures
+    index build time, query embedding time and search latency, then drives
+    get_bot_response concurrently against a local LLM stub.
+    """
+
+    def __init__(self, work_dir: str, scales: List[int], rag_options: Dict = None, base_pages: int = None,
+                 queries: int = 200, k: int = 3, seed: int = 0):
+        """
+        Initialize the suite.
+
+        Args:
+            work_dir: Directory for the synthetic corpora and their indexes
+            scales: Corpus sizes as multiples of base_pages
+            rag_options: Extra RAGService arguments (index_type, chunk_size, ...)
+            base_pages: Pages in the 1x corpus. Defaults to the pages in myapp/data
+            queries: Queries timed per measurement
+            k: Chunks retrieved per query
+            seed: Random seed for the corpus and the query order
+        """
+        self.work_dir = work_dir
+        self.scales = scales
+        self.rag_options = rag_options or {}
+        self.base_pages = base_pages or count_pages(RAGService().data_dir)
+        self.queries = queries
+        self.k = k
+        self.seed = seed
+        self.services = {}
+        self._embeddings = None
+
+    def _query_stream(self) -> List[str]:
+        rng = random.Random(self.seed)
+        return [rng.choice(QUERIES) for _ in range(self.queries)]
+
+    def load_model(self) -> Dict:
+        """Load the embedding model shared by every benchmark and time it."""
+        start = time.perf_counter()
+        self._embeddings = RAGService(**self.rag_options)._create_embeddings()
+        self._embeddings.embed_query("warm-up")
+        return {"model_load_s": time.perf_counter() - start}
+
+    def build_indexes(self) -> List[Dict]:
+        """Generate each corpus and time building its index."""
+        results = []
+        for scale in self.scales:
+            data_dir = os.path.join(self.work_dir, f"corpus_{scale}x")
+            pages = self.base_pages * scale
+            if not os.path.isdir(data_dir):
+                generate_corpus(data_dir, pages, seed=self.seed)
+
+            # Reuse the loaded model, so builds time only indexing
+            service = RAGService(embeddings=self._embeddings, data_dir=data_dir, **self.rag_options)
+            start = time.perf_counter()
+            service.build_vector_store()
+            elapsed = time.perf_counter() - start
+            self.services[scale] = service
+
+            chunks = sum(len(entry["ids"]) for entry in service.read_manifest()["files"].values())
+            results.append({
+                "scale": scale,
+                "pages": pages,
+                "chunks": chunks,
+                "build_s": elapsed,
+                "chunks_per_s": chunks / elapsed,
+            })
+        return results
+
+    def embed_queries(self) -> Dict:
+        """Time query embedding, which is independent of the corpus size."""
+        samples = []
+        for query in self._query_stream():
+            start = time.perf_counter()
+            self._embeddings.embed_query(query)
+            samples.append(time.perf_counter() - start)
+        return percentiles(samples)
+
+    def search(self) -> List[Dict]:
+        """Time retrieval with precomputed embeddings for each corpus size."""
+        queries = self._query_stream()
+        embeddings = {q: self._embeddings.embed_query(q) for q in set(queries)}
+        results = []
+        for scale, service in self.services.items():
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                service.get_relevant_context(query, k=self.k, query_embedding=embeddings[query])
+                samples.append(time.perf_counter() - start)
+            results.append({"scale": scale, **percentiles(samples)})
+        return results
+
+    def end_to_end(self, scale: int, requests: int, concurrency: int, stub, hedge_stub=None) -> Dict:
+        """
+        Drive get_bot_response with concurrent requests against the LLM stub.
+
+        Args:
+            scale: Corpus whose index serves the requests
+            requests: Total number of requests
+            concurrency: Requests in flight at once
+            stub: Running StubLLMServer
+            hedge_stub: Second running StubLLMServer, configured as a hedging
+                backend after stub
+
+        Returns:
+            Latency percentiles, throughput and error count
+        """
+        from django.test import AsyncClient, override_settings
+        from myapp import views
+
+        queries = self._query_stream()
+        client = AsyncClient()
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            samples, errors = [], 0
+
+            async def one(i):
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/get_response/",
+                        {"message": queries[i % len(queries)]},
+                        content_type="application/json"
+                    )
+                    samples.append(time.perf_counter() - start)
+                    if response.status_code != 200 or "text_response" not in response.json():
+                        errors += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            elapsed = time.perf_counter() - start
+            if views.llm_client is not None:
+                await views.llm_client.close()
+            return samples, errors, elapsed
+
+        previous = (views.rag_service, views.response_cache, views.faq_store, views.request_coalescer,
+                    views.llm_client, views.session_store, views.history_writer, views.intent_router,
+                    os.environ.get("HF_API_TOKEN"))
+        views.rag_service = self.services[scale]
+        views.response_cache = None
+        views.faq_store = None
+        views.request_coalescer = None
+        views.llm_client = None
+        views.session_store = None
+        views.history_writer = None
+        views.intent_router = None
+        os.environ.setdefault("HF_API_TOKEN", "benchmark")
+        try:
+            backends = [{"name": "stub", "base_url": stub.base_url}]
+            if hedge_stub is not None:
+                backends.append({"name": "hedge-stub", "base_url": hedge_stub.base_url})
+            with override_settings(LLM_BASE_URL=stub.base_url, LLM_BACKENDS=backends, RESPONSE_CACHE_ENABLED=False,
+                                   FAQ_ENABLED=False, REQUEST_COALESCING_ENABLED=False, CHAT_HISTORY_ENABLED=False,
+                                   INTENT_ROUTER_ENABLED=False, RAG_TOP_K=self.k):
+                samples, errors, elapsed = asyncio.run(run())
+        finally:
+            (views.rag_service, views.response_cache, views.faq_store, views.request_coalescer, views.llm_client,
+             views.session_store, views.history_writer, views.intent_router, token) = previous
+            if token is None:
+                os.environ.pop("HF_API_TOKEN", None)
+
+        return {
+            "scale": scale,
+            "requests": requests,
+            "concurrency": concurrency,
+            "errors": errors,
+            "throughput_rps": requests / elapsed,
+            "llm_latency_s": stub.latency,
+            "llm_tokens_per_s": stub.tokens_per_second,
+            "llm_stall_fraction": stub.stall_fraction,
+            "hedged": hedge_stub is not None,
+            "llm_requests": stub.requests + (hedge_stub.requests if hedge_stub is not None else 0),
+            **percentiles(samples),
+        }
+
+    def environment(self) -> Dict:
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "base_pages": self.base_pages,
+            "queries": self.queries,
+            "k": self.k,
+            "rag_options": self.rag_options,
+        }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = 10) -> List[str]:
+    """
+    Describe how the latency and throughput figures changed against a baseline.
+
+    Args:
+        current: Results of this run
+        baseline: Results of an earlier run, as written to JSON
+        tolerance: Percentage change treated as noise rather than a regression
+
+    Returns:
+        One line per figure present in both runs
+    """
+    lines = []
+
+    def delta(label, new, old, higher_is_better=False):
+        if not old:
+            return
+        change = (new - old) / old * 100
+        worse = -change > tolerance if higher_is_better else change > tolerance
+        lines.append(f"{label}: {old:.2f} -> {new:.2f} ({change:+.1f}%{' regression' if worse else ''})")
+
+    def by_scale(section):
+        return {row["scale"]: row for row in section or []}
+
+    old_builds = by_scale(baseline.get("index_build"))
+    for scale, row in by_scale(current.get("index_build")).items():
+        if scale in old_builds:
+            delta(f"index_build[{scale}x] build_s", row["build_s"], old_builds[scale]["build_s"])
+
+    if current.get("query_embedding") and baseline.get("query_embedding"):
+        for key in ("p50_ms", "p95_ms"):
+            delta(f"query_embedding {key}", current["query_embedding"][key], baseline["query_embedding"][key])
+
+    old_search = by_scale(baseline.get("search"))
+    for scale, row in by_scale(current.get("search")).items():
+        if scale in old_search:
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                delta(f"search[{scale}x] {key}", row[key], old_search[scale][key])
+
+    new_e2e, old_e2e = current.get("end_to_end"), baseline.get("end_to_end")
+    if new_e2e and old_e2e:
+        for key in ("p50_ms", "p95_ms"):
+            delta(f"end_to_end {key}", new_e2e[key], old_e2e[key])
+        delta("end_to_end throughput_rps", new_e2e["throughput_rps"], old_e2e["throughput_rps"], higher_is_better=True)
+    return lines
+
+
+def write_results(path: str, results: Dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,89 @@
+import os
+import json
+import tempfile
+import contextlib
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp.benchmarks.llm_stub import StubLLMServer
+from myapp.benchmarks.suite import BenchmarkSuite, compare, write_results
+
+
+class Command(BaseCommand):
+    help = "Mide el rendimiento del pipeline RAG sin red: indexación, embeddings, búsqueda y carga concurrente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1,10', help='Tamaños del corpus sintético como múltiplos del actual, p. ej. 1,10,100')
+        parser.add_argument('--base-pages', type=int, default=None, help='Páginas del corpus 1x (por defecto, las de myapp/data)')
+        parser.add_argument('--work-dir', default=None, help='Directorio para los corpus e índices (se reutilizan los corpus existentes)')
+        parser.add_argument('--queries', type=int, default=200, help='Consultas medidas por prueba')
+        parser.add_argument('--k', type=int, default=settings.RAG_TOP_K, help='Chunks recuperados por consulta')
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones de la prueba de carga')
+        parser.add_argument('--concurrency', type=int, default=20, help='Peticiones simultáneas de la prueba de carga')
+        parser.add_argument('--llm-latency', type=float, default=0.5, help='Segundos del stub hasta el primer token')
+        parser.add_argument('--llm-tokens-per-second', type=float, default=50, help='Velocidad de generación del stub')
+        parser.add_argument('--llm-stall-fraction', type=float, default=0.0, help='Fracción de peticiones en las que el stub se atasca')
+        parser.add_argument('--llm-stall-latency', type=float, default=10.0, help='Segundos hasta el primer token de una petición atascada')
+        parser.add_argument('--llm-hedge', action='store_true', help='Añade un segundo stub como backend de respaldo (peticiones duplicadas)')
+        parser.add_argument('--skip-load-test', action='store_true', help='Omite la prueba de carga de get_bot_response')
+        parser.add_argument('--output', default='benchmark_results.json', help='Archivo JSON de resultados')
+        parser.add_argument('--compare', default=None, help='JSON de una ejecución anterior para comparar')
+        parser.add_argument('--tolerance', type=float, default=10, help='Variación porcentual tolerada antes de marcar una regresión')
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options['scales'].split(',')]
+        work_dir = options['work_dir'] or tempfile.mkdtemp(prefix='rag-benchmark-')
+        os.makedirs(work_dir, exist_ok=True)
+
+        suite = BenchmarkSuite(
+            work_dir,
+            scales,
+            rag_options=settings.RAG_SERVICE_OPTIONS,
+            base_pages=options['base_pages'],
+            queries=options['queries'],
+            k=options['k']
+        )
+        results = {"environment": suite.environment()}
+
+        self.stdout.write("Cargando el modelo de embeddings...")
+        results.update(suite.load_model())
+
+        self.stdout.write(f"Construyendo índices para {scales} x {suite.base_pages} páginas en {work_dir}...")
+        results["index_build"] = suite.build_indexes()
+        for row in results["index_build"]:
+            self.stdout.write(f"  {row['scale']}x: {row['chunks']} chunks en {row['build_s']:.1f}s")
+
+        results["query_embedding"] = suite.embed_queries()
+        self.stdout.write(f"Embedding de consulta: p50 {results['query_embedding']['p50_ms']:.1f} ms")
+
+        results["search"] = suite.search()
+        for row in results["search"]:
+            self.stdout.write(f"  búsqueda {row['scale']}x: p50 {row['p50_ms']:.2f} ms, p99 {row['p99_ms']:.2f} ms")
+
+        if not options['skip_load_test']:
+            self.stdout.write(f"Prueba de carga: {options['requests']} peticiones, concurrencia {options['concurrency']}...")
+            stub = StubLLMServer(
+                latency=options['llm_latency'], tokens_per_second=options['llm_tokens_per_second'],
+                stall_fraction=options['llm_stall_fraction'], stall_latency=options['llm_stall_latency'], seed=0
+            )
+            hedge_stub = StubLLMServer(
+                latency=options['llm_latency'], tokens_per_second=options['llm_tokens_per_second']
+            ) if options['llm_hedge'] else None
+            with stub, hedge_stub or contextlib.nullcontext():
+                results["end_to_end"] = suite.end_to_end(scales[0], options['requests'], options['concurrency'], stub, hedge_stub)
+            e2e = results["end_to_end"]
+            self.stdout.write(
+                f"  {e2e['throughput_rps']:.1f} req/s, p50 {e2e['p50_ms']:.0f} ms, "
+                f"p95 {e2e['p95_ms']:.0f} ms, p99 {e2e['p99_ms']:.0f} ms, "
+                f"{e2e['llm_requests']} llamadas al LLM, errores {e2e['errors']}"
+            )
+
+        write_results(options['output'], results)
+        self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            for line in compare(results, baseline, options['tolerance']):
+                self.stdout.write(self.style.WARNING(line) if line.endswith('regression)') else line)
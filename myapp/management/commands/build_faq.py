@@ -0,0 +1,76 @@
+import os
+import json
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import views
+from myapp.utils.document_processor import faq_questions
+from myapp.utils.faq_store import FaqStore
+
+
+class Command(BaseCommand):
+    help = "Precalcula las respuestas a las preguntas frecuentes con el pipeline RAG completo y DeepSeek"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', default=settings.FAQ_QUESTIONS_PATH, help='JSON con la lista de preguntas curadas')
+        parser.add_argument('--no-auto', action='store_true', help='No genera preguntas para cada Best Practice de los documentos')
+        parser.add_argument('--concurrency', type=int, default=4, help='Preguntas enviadas al modelo a la vez')
+
+    def handle(self, *args, **options):
+        hf_token = os.getenv('HF_API_TOKEN')
+        if not hf_token:
+            raise CommandError("HF_API_TOKEN no está configurado")
+
+        service = views.new_rag_service()
+        service.initialize_vector_store(sync=False)
+
+        questions = []
+        if options['questions'] and os.path.exists(options['questions']):
+            with open(options['questions'], encoding='utf-8') as f:
+                questions.extend(json.load(f))
+        if not options['no_auto']:
+            questions.extend(faq_questions(doc.page_content for doc in service.load_documents()))
+        questions = list(dict.fromkeys(q.strip() for q in questions if q.strip()))
+        if not questions:
+            raise CommandError("No hay preguntas que precalcular")
+
+        self.stdout.write(f"Generando {len(questions)} respuestas...")
+        entries = asyncio.run(self._answer_all(service, hf_token, questions, options['concurrency']))
+
+        FaqStore(settings.FAQ_STORE_PATH).replace(entries, service.index_version)
+        skipped = len(questions) - len(entries)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(entries)} respuestas guardadas en {settings.FAQ_STORE_PATH} ({skipped} sin respuesta en los documentos)"
+        ))
+
+    async def _answer_all(self, service, hf_token, questions, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(question):
+            query_embedding = service.embed_query(question)
+            context, retrieved_docs = views.retrieve_context(service, question, query_embedding)
+            selected_images = views.select_images(service, query_embedding, retrieved_docs)
+            async with semaphore:
+                try:
+                    result, complete = await views.generate_answer(hf_token, context, question, selected_images)
+                except Exception as e:
+                    self.stderr.write(f"Error en '{question}': {str(e)}")
+                    return None
+            # An answer the documents do not support is not worth serving instantly
+            if result['text_response'].strip().startswith(views.NO_INFO_ANSWER):
+                return None
+            if not complete:
+                self.stderr.write(f"Respuesta truncada o mal formada en '{question}'; no se guarda")
+                return None
+            self.stdout.write(f"  {question}")
+            return {"question": question, "embedding": query_embedding, "response": result}
+
+        try:
+            results = await asyncio.gather(*(answer(question) for question in questions))
+        finally:
+            if views.llm_client is not None:
+                await views.llm_client.close()
+                views.llm_client = None
+        return [entry for entry in results if entry is not None]
@@ -0,0 +1,30 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp.utils.image_variants import VARIANT_FORMATS, build_variants
+
+
+class Command(BaseCommand):
+    help = "Genera miniaturas WebP/AVIF con nombre por hash de contenido para las imágenes de las Best Practices"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formats', default=','.join(VARIANT_FORMATS), help='Formatos a generar, separados por comas')
+        parser.add_argument('--force', action='store_true', help='Regenera también las imágenes sin cambios')
+
+    def handle(self, *args, **options):
+        formats = [fmt.strip() for fmt in options['formats'].split(',') if fmt.strip() in VARIANT_FORMATS]
+        manifest = build_variants(settings.IMAGE_DIR, settings.IMAGE_VARIANTS_DIR, formats, force=options['force'])
+
+        original = thumbnails = 0
+        for name, entry in manifest.items():
+            original += os.path.getsize(os.path.join(settings.IMAGE_DIR, name))
+            thumbnails += min(variants[0]["bytes"] for variants in entry["variants"].values())
+            self.stdout.write(f"  {name} ({entry['width']}x{entry['height']}): " + ", ".join(
+                f"{fmt} {len(variants)}" for fmt, variants in entry["variants"].items()
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(manifest)} imágenes en {settings.IMAGE_VARIANTS_DIR} "
+            f"(miniaturas: {thumbnails / 1024:.0f} KB frente a {original / 1024:.0f} KB en los PNG originales)"
+        ))
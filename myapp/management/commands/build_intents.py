@@ -0,0 +1,42 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import views
+from myapp.utils.intent_router import build_intent_centroids, save_intent_centroids, section_texts
+
+
+class Command(BaseCommand):
+    help = "Precalcula los centroides de intención (saludo, agradecimiento, fuera de tema y cada Best Practice)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intents', default=settings.INTENTS_PATH, help='JSON con los ejemplos y respuestas de cada intención')
+        parser.add_argument('--output', default=settings.INTENT_CENTROIDS_PATH, help='Archivo de centroides')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['intents'], encoding='utf-8') as f:
+                intents = json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f"No existe el archivo de intenciones {options['intents']}")
+
+        service = views.new_rag_service()
+        service.initialize_vector_store(sync=False)
+        sections = section_texts(service.load_documents())
+        if not sections:
+            self.stdout.write(self.style.WARNING("Los documentos no tienen secciones 'Best Practice N'; no se enrutará por sección"))
+
+        centroids = build_intent_centroids(service.embed_query, intents, sections, service.index_version)
+        save_intent_centroids(options['output'], centroids)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(centroids['intents'])} intenciones y {len(centroids['sections'])} secciones guardadas en {options['output']}"
+        ))
+
+        # The examples should route to their own intent with the configured thresholds
+        router = views.new_intent_router(centroids)
+        for name, intent in intents.items():
+            routed = Counter(router.classify(example, service.embed_query(example))['intent'] for example in intent.get('examples', []))
+            misrouted = ", ".join(f"{other}: {count}" for other, count in routed.items() if other != name)
+            self.stdout.write(f"  {name}: {routed[name]}/{sum(routed.values())} ejemplos reconocidos" + (f" ({misrouted})" if misrouted else ""))
@@ -0,0 +1,10 @@
+from django.contrib.staticfiles.management.commands.collectstatic import Command as CollectStaticCommand
+from django.core.management import call_command
+
+
+class Command(CollectStaticCommand):
+    help = "Genera las variantes de las imágenes (build_image_variants) y recopila los archivos estáticos"
+
+    def handle(self, **options):
+        call_command('build_image_variants', verbosity=options['verbosity'])
+        return super().handle(**options)
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.utils.chunking import split_documents
+from myapp.utils.embeddings import EMBEDDING_MODEL, OnnxEmbeddings, compare_embeddings, export_onnx
+from myapp.utils.rag_service import RAGService
+
+
+class Command(BaseCommand):
+    help = "Exporta el modelo de embeddings a ONNX cuantizado int8 y comprueba que sus vectores son compatibles con el índice"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.EMBEDDING_MODEL_DIR, help='Directorio del modelo exportado')
+        parser.add_argument('--model', default=EMBEDDING_MODEL, help='Modelo sentence-transformers a exportar')
+        parser.add_argument('--min-cosine', type=float, default=0.99, help='Similitud coseno mínima con los vectores de torch')
+        parser.add_argument('--top-k', type=int, default=settings.RAG_TOP_K, help='Resultados comparados por pregunta en el índice')
+        parser.add_argument('--skip-export', action='store_true', help='Solo comprueba un modelo ya exportado')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        if not options['skip_export']:
+            self.stdout.write(f"Exportando {options['model']} a {output}...")
+            config = export_onnx(output, options['model'])
+            self.stdout.write(f"Modelo exportado ({config['dimension']} dimensiones)")
+
+        # The index was built with the torch backend: compare against it
+        service = RAGService(**{**settings.RAG_SERVICE_OPTIONS, 'embedding_backend': 'torch', 'query_batch_size': 1})
+        service.initialize_vector_store(sync=False)
+        reference = service.embeddings
+        candidate = OnnxEmbeddings(output, threads=service.torch_threads)
+
+        chunks = split_documents(service.load_documents(), service.chunker, service.chunk_size, service.chunk_overlap)
+        texts = [chunk.page_content for chunk in chunks]
+        reference_vectors, reference_s = self._timed(reference.embed_documents, texts)
+        candidate_vectors, candidate_s = self._timed(candidate.embed_documents, texts)
+        parity = compare_embeddings(reference_vectors, candidate_vectors)
+        self.stdout.write(
+            f"{len(texts)} chunks: coseno mínimo {parity['min_cosine']:.4f}, medio {parity['mean_cosine']:.4f}, "
+            f"distancia L2 máxima {parity['max_l2']:.4f}"
+        )
+        self.stdout.write(f"Tiempo de embedding: torch {reference_s:.2f}s, ONNX int8 {candidate_s:.2f}s")
+
+        questions = self._questions()
+        if questions:
+            k = options['top_k']
+            agreement = 0
+            for question in questions:
+                expected = self._top_passages(service, reference.embed_query(question), k)
+                found = self._top_passages(service, candidate.embed_query(question), k)
+                agreement += len(expected & found) / len(expected)
+            self.stdout.write(f"Coincidencia top-{k} en el índice: {agreement / len(questions):.1%} ({len(questions)} preguntas)")
+
+        if parity['min_cosine'] < options['min_cosine']:
+            raise CommandError(
+                f"El modelo ONNX no es compatible con el índice: coseno mínimo {parity['min_cosine']:.4f} < {options['min_cosine']}"
+            )
+        self.stdout.write(self.style.SUCCESS("Modelo ONNX compatible. Actívalo con EMBEDDING_BACKEND=onnx"))
+
+    @staticmethod
+    def _timed(embed, texts):
+        start = time.perf_counter()
+        vectors = embed(texts)
+        return vectors, time.perf_counter() - start
+
+    @staticmethod
+    def _questions():
+        if not os.path.exists(settings.FAQ_QUESTIONS_PATH):
+            return []
+        with open(settings.FAQ_QUESTIONS_PATH, encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _top_passages(service, query_embedding, k):
+        results = service.vector_store.similarity_search_with_score_by_vector(query_embedding, k=k)
+        return {doc.page_content for doc, score in results}
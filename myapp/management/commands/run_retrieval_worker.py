@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.views import new_rag_service
+from myapp.utils.retrieval_worker import RetrievalServer, parse_address
+
+
+class Command(BaseCommand):
+    help = "Inicia el worker de recuperación que comparte el modelo de embeddings y el índice FAISS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--address',
+            default=settings.RETRIEVAL_WORKER_ADDRESS,
+            help='Ruta de socket Unix (recomendado) o host:puerto donde escuchar',
+        )
+
+    def handle(self, *args, **options):
+        if not options['address']:
+            self.stderr.write("Configura RETRIEVAL_WORKER_ADDRESS o usa --address")
+            return
+        if isinstance(parse_address(options['address']), tuple) and not settings.RETRIEVAL_WORKER_AUTHKEY:
+            raise CommandError("Escuchar en TCP exige RETRIEVAL_WORKER_AUTHKEY; usa un socket Unix o define una clave")
+
+        rag_service = new_rag_service()
+        rag_service.initialize_vector_store(sync=False)
+
+        # Pre-warm the model and index so the first real query is not slow
+        rag_service.get_relevant_context("Best Practice", k=1)
+        self.stdout.write(self.style.SUCCESS("Modelo e índice cargados"))
+
+        RetrievalServer(rag_service, options['address'], settings.RETRIEVAL_WORKER_AUTHKEY).serve_forever()
@@ -0,0 +1,95 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.utils.corpora import discover_corpora
+from myapp.utils.faq_store import FaqStore
+from myapp.utils.intent_router import load_intent_centroids
+from myapp.utils.rag_service import RAGService
+from myapp.views import new_rag_service
+
+
+class Command(BaseCommand):
+    help = "Actualiza el índice FAISS procesando solo los PDFs nuevos, modificados o eliminados"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Reconstruye el índice completo en lugar de actualizarlo incrementalmente',
+        )
+        parser.add_argument('--batch-size', type=int, default=64, help='Chunks por lote de embeddings')
+        parser.add_argument('--workers', type=int, default=None, help='Procesos para leer los PDFs')
+        parser.add_argument('--torch-threads', type=int, default=None, help='Hilos de torch para los embeddings')
+        parser.add_argument('--corpus', default=None, help='Actualiza solo este corpus de RAG_CORPORA_DIR en lugar del principal')
+        parser.add_argument('--skip-faq', action='store_true', help='No regenera las respuestas precalculadas (build_faq)')
+
+    def handle(self, *args, **options):
+        data_dir = {}
+        if options['corpus']:
+            corpora = discover_corpora(settings.RAG_CORPORA_DIR)
+            if options['corpus'] not in corpora:
+                raise CommandError(f"No existe el corpus '{options['corpus']}' en {settings.RAG_CORPORA_DIR}")
+            data_dir = {'data_dir': corpora[options['corpus']]['data_dir']}
+
+        rag_service = RAGService(**{
+            **settings.RAG_SERVICE_OPTIONS,
+            **data_dir,
+            'batch_size': options['batch_size'],
+            'ingest_workers': options['workers'],
+            'torch_threads': options['torch_threads'],
+        })
+
+        if options['rebuild']:
+            rag_service.initialize_vector_store(force_rebuild=True)
+            self.stdout.write(self.style.SUCCESS("Índice FAISS reconstruido"))
+            self._refresh_faq(rag_service, options)
+            self._refresh_intents(rag_service)
+            return
+
+        rag_service.initialize_vector_store(sync=False)
+        if rag_service.read_manifest() is None:
+            rag_service.build_vector_store()
+            self.stdout.write(self.style.SUCCESS("Índice FAISS reconstruido con manifiesto"))
+            self._refresh_faq(rag_service, options)
+            self._refresh_intents(rag_service)
+            return
+
+        changes = rag_service.sync_documents()
+        for action in ('added', 'updated', 'deleted'):
+            for name in changes[action]:
+                self.stdout.write(f"{action}: {name}")
+        self.stdout.write(self.style.SUCCESS("Índice FAISS actualizado"))
+        self._refresh_faq(rag_service, options)
+        self._refresh_intents(rag_service)
+
+    def _refresh_faq(self, rag_service, options):
+        """Regenera las respuestas precalculadas si se construyeron con otra versión del índice."""
+        if not settings.FAQ_ENABLED or options['skip_faq']:
+            return
+        if FaqStore(settings.FAQ_STORE_PATH).index_version() == self._index_version(rag_service):
+            return
+        if not os.getenv('HF_API_TOKEN'):
+            self.stdout.write(self.style.WARNING(
+                "Las respuestas precalculadas no corresponden al índice y no se servirán; ejecuta 'python manage.py build_faq'"
+            ))
+            return
+        call_command('build_faq', stdout=self.stdout, stderr=self.stderr)
+
+    def _refresh_intents(self, rag_service):
+        """Recalcula los centroides de las Best Practices si se calcularon con otra versión del índice."""
+        if not settings.INTENT_ROUTER_ENABLED:
+            return
+        centroids = load_intent_centroids(settings.INTENT_CENTROIDS_PATH)
+        if centroids is not None and centroids.get('index_version') == self._index_version(rag_service):
+            return
+        call_command('build_intents', stdout=self.stdout, stderr=self.stderr)
+
+    @staticmethod
+    def _index_version(rag_service):
+        if discover_corpora(settings.RAG_CORPORA_DIR):
+            # Tied to the combined version of every corpus
+            return new_rag_service().index_version
+        return rag_service.index_version
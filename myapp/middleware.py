@@ -0,0 +1,26 @@
+import re
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+
+# name.<hash>.ext, as written by build_image_variants
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+class StaticCacheControlMiddleware(MiddlewareMixin):
+    """
+    Cache-Control para los archivos estáticos servidos por Django.
+
+    Los archivos con hash de contenido en el nombre no cambian nunca, así que
+    se marcan como inmutables durante un año; el resto se revalida pasados
+    STATIC_MAX_AGE segundos.
+    """
+
+    def process_response(self, request, response):
+        if request.path.startswith(settings.STATIC_URL_PATH) and response.status_code == 200:
+            if HASHED_NAME.search(request.path):
+                response['Cache-Control'] = 'public, max-age=31536000, immutable'
+            else:
+                response['Cache-Control'] = f'public, max-age={settings.STATIC_MAX_AGE}'
+        return response
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    # El modo WAL se guarda en el propio fichero: basta con activarlo una vez
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        if cursor.fetchone()[0].lower() != 'wal':
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+
+class Migration(migrations.Migration):
+    # PRAGMA journal_mode=WAL no se puede ejecutar dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('myapp', '0002_chat_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,21 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class ChatMessage(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Conversación del navegador (sessionStorage); vacío para mensajes sin sesión
+    session_id = models.CharField(max_length=64, blank=True, default='')
     message = models.TextField()
     response = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Se asigna al recibir el mensaje, no al guardarlo en lote
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['session_id', 'created_at'], name='chatmessage_session_time'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username}: {self.message[:20]}..."
\ No newline at end of file
+        author = self.user.username if self.user else self.session_id
+        return f"{author}: {self.message[:20]}..."
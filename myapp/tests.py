@@ -1,3 +1,880 @@
-from django.test import TestCase
+import gc
+import json
+import os
+import time
+import socket
+import threading
+import asyncio
+import shutil
+import tempfile
+import weakref
+from unittest import mock
 
-# Create your tests here.
+import aiohttp
+from django.test import SimpleTestCase, override_settings
+from filelock import FileLock
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from myapp.benchmarks.llm_stub import StubLLMServer
+from myapp.benchmarks.suite import compare
+from myapp.utils.chunking import split_sections
+from myapp.utils.coalescing import RequestCoalescer
+from myapp.utils.conversation import SessionStore
+from myapp.utils.corpora import ShardedRAGService
+from myapp.utils.document_processor import section_for_query
+from myapp.utils.faq_store import FaqStore
+from myapp.utils.intent_router import IntentRouter
+from myapp.utils.llm_client import LLMClient
+from myapp.utils import metrics
+from myapp.utils.llm_dispatch import CircuitBreaker, HedgedLLMClient, LLMBackend
+from myapp.utils.micro_batch import MicroBatcher
+from myapp.utils.prompt_context import TokenCounter, build_context
+from myapp.utils.rag_service import RAGService
+from myapp.utils.response_cache import SemanticResponseCache
+from myapp.utils.stream_parser import parse_llm_output
+
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), 'data', 'GM-bp.pdf')
+
+
+class ShardedRAGServiceTests(SimpleTestCase):
+    """Carga y descarga de corpus con índices propios."""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+
+        # Embeddings deterministas: sin descargar el modelo
+        embeddings = DeterministicFakeEmbedding(size=384)
+        patcher = mock.patch.object(RAGService, '_create_embeddings', lambda service: embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        corpora = {}
+        for name in ('gm', 'asientos', 'paneles'):
+            data_dir = os.path.join(root, name)
+            os.makedirs(data_dir)
+            shutil.copy(SAMPLE_PDF, data_dir)
+            if name != 'gm':
+                corpora[name] = {'data_dir': data_dir, 'keywords': [name], 'default': False}
+
+        self.service = ShardedRAGService(
+            'gm', corpora, max_loaded=1, data_dir=os.path.join(root, 'gm'),
+            index_type='flat', ingest_workers=1, query_batch_size=4
+        )
+        self.service.initialize_vector_store(sync=False)
+
+    def test_evicted_corpus_is_closed_and_collected(self):
+        self.service.get_relevant_context('pull cup', k=2, corpora=['asientos'])
+        shard = self.service._shards['asientos']
+        thread = shard._search_batcher._thread
+        shard_ref = weakref.ref(shard)
+        del shard
+
+        # Cargar otro corpus descarga el primero (max_loaded=1)
+        self.service.get_relevant_context('pull cup', k=2, corpora=['paneles'])
+        gc.collect()
+
+        self.assertEqual(list(self.service._shards), ['paneles'])
+        self.assertIsNone(shard_ref())
+        self.assertFalse(thread.is_alive())
+
+    def test_corpus_in_use_is_closed_after_its_search(self):
+        shard = self.service._shard('asientos')
+        self.service._release(self.service._shard('paneles'))
+
+        # Descargado, pero una búsqueda todavía lo usa
+        self.assertNotIn('asientos', self.service._shards)
+        self.assertIsNotNone(shard.vector_store)
+
+        self.service._release(shard)
+        self.assertIsNone(shard.vector_store)
+
+
+def _free_port():
+    """Puerto libre en el que no escucha nadie: las conexiones se rechazan."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class HedgedLLMClientTests(SimpleTestCase):
+    """Reparto de peticiones entre varios backends de LLM."""
+
+    messages = [{'role': 'user', 'content': '¿Cómo se sujeta la manija Pull Cup?'}]
+
+    def setUp(self):
+        self.now = 0.0
+
+    def _stub(self, answer, port=0, **kwargs):
+        stub = StubLLMServer(port=port, latency=0.05, tokens_per_second=1000, answer=answer, **kwargs)
+        stub.start()
+        self.addCleanup(stub.stop)
+        return stub
+
+    def _backend(self, name, port, failure_threshold=1):
+        # Sin reintentos propios, como los crea get_llm_client() con varios backends
+        client = LLMClient(api_key='t', model='m', base_url=f'http://127.0.0.1:{port}/v1', max_retries=0)
+        breaker = CircuitBreaker(failure_threshold, cooldown=30, clock=lambda: self.now)
+        return LLMBackend(name, client, breaker)
+
+    def _fake_backend(self, name, delay, result=None, error=None):
+        """Backend con un cliente falso que responde (o falla) tras delay segundos."""
+        client = mock.Mock()
+        client.is_retryable = lambda e: not isinstance(e, ValueError)
+
+        async def chat(messages, **params):
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return result
+
+        client.chat = chat
+        return LLMBackend(name, client, CircuitBreaker(clock=lambda: self.now))
+
+    def _answer(self, completion):
+        return completion.choices[0].message.content
+
+    def test_fails_over_to_next_backend(self):
+        secundario = self._stub('secundario')
+        down = self._backend('caido', _free_port())
+        client = HedgedLLMClient([down, self._backend('secundario', secundario.port)])
+
+        async def run():
+            try:
+                return await client.chat(self.messages)
+            finally:
+                await client.close()
+
+        self.assertEqual(self._answer(asyncio.run(run())), 'secundario')
+        self.assertEqual(down.breaker.failures, 1)
+        self.assertEqual(secundario.requests, 1)
+
+    def test_open_circuit_is_skipped_and_probed_after_cooldown(self):
+        port = _free_port()
+        secundario = self._stub('secundario')
+        down = self._backend('primario', port)
+        client = HedgedLLMClient([down, self._backend('secundario', secundario.port)])
+
+        async def run():
+            try:
+                first = await client.chat(self.messages)
+                # Con el circuito abierto el primario no se intenta
+                second = await client.chat(self.messages)
+                state, failures = down.breaker.state, down.breaker.failures
+                self.now += 31
+                self.assertEqual(down.breaker.state, 'half_open')
+                # El backend vuelve: la petición de prueba cierra el circuito
+                primario = await asyncio.to_thread(self._stub, 'primario', port)
+                third = await client.chat(self.messages)
+                return first, second, third, state, failures, primario
+            finally:
+                await client.close()
+
+        first, second, third, state, failures, primario = asyncio.run(run())
+        self.assertEqual(state, 'open')
+        self.assertEqual(failures, 1)
+        self.assertEqual([self._answer(r) for r in (first, second, third)], ['secundario', 'secundario', 'primario'])
+        self.assertEqual(secundario.requests, 2)
+        self.assertEqual(primario.requests, 1)
+        self.assertEqual(down.breaker.state, 'closed')
+
+    def test_hedged_request_cancels_stalled_backend(self):
+        lento = self._stub('primario', stall_fraction=1, stall_latency=2)
+        rapido = self._stub('secundario')
+        primary = self._backend('primario', lento.port, failure_threshold=5)
+        client = HedgedLLMClient(
+            [primary, self._backend('secundario', rapido.port)],
+            hedge_delay=0.1, min_hedge_delay=0.01, hedge_budget=1
+        )
+
+        async def run():
+            try:
+                started = time.perf_counter()
+                completion = await client.chat(self.messages)
+                chat_seconds = time.perf_counter() - started
+                open_sessions = len(primary.client.client._sessions)
+
+                started = time.perf_counter()
+                chunks = [chunk async for chunk in client.chat_stream(self.messages)]
+                stream_seconds = time.perf_counter() - started
+                text = ''.join(chunk.choices[0].delta.content or '' for chunk in chunks if chunk.choices)
+                return completion, chat_seconds, open_sessions, text, stream_seconds
+            finally:
+                await client.close()
+
+        completion, chat_seconds, open_sessions, text, stream_seconds = asyncio.run(run())
+        self.assertEqual(self._answer(completion), 'secundario')
+        self.assertEqual(text, 'secundario')
+        self.assertLess(chat_seconds, 1)
+        self.assertLess(stream_seconds, 1)
+        # La petición adelantada se cancela y cuenta como fallo del primario
+        self.assertEqual(open_sessions, 0)
+        self.assertEqual(len(primary.client.client._sessions), 0)
+        self.assertEqual(primary.breaker.failures, 2)
+
+    def test_rejected_request_waits_for_running_hedge(self):
+        # El primario rechaza la petición (error no reintentable) mientras el duplicado sigue en curso
+        primary = self._fake_backend('primario', 0.2, error=ValueError('rechazada'))
+        hedge = self._fake_backend('secundario', 0.2, result='secundario')
+        client = HedgedLLMClient([primary, hedge], hedge_delay=0.05, min_hedge_delay=0.01, hedge_budget=1)
+
+        self.assertEqual(asyncio.run(client.chat(self.messages)), 'secundario')
+        self.assertEqual(primary.breaker.failures, 0)
+
+    def test_rejected_request_is_not_sent_to_other_backends(self):
+        primary = self._fake_backend('primario', 0, error=ValueError('rechazada'))
+        other = self._fake_backend('secundario', 0, result='secundario')
+        other.client.chat = mock.AsyncMock(return_value='secundario')
+        client = HedgedLLMClient([primary, other])
+
+        with self.assertRaisesRegex(ValueError, 'rechazada'):
+            asyncio.run(client.chat(self.messages))
+        other.client.chat.assert_not_called()
+
+    def test_no_backend_accepts_request(self):
+        backend = self._fake_backend('primario', 0, result='primario')
+        client = HedgedLLMClient([backend])
+
+        with mock.patch.object(backend.breaker, 'allow', return_value=False):
+            with self.assertRaisesRegex(RuntimeError, 'No LLM backend'):
+                asyncio.run(client.chat(self.messages))
+
+
+class LLMClientTests(SimpleTestCase):
+    """Rechazos de response_format por parte del proveedor."""
+
+    def _error(self, status, payload):
+        error = aiohttp.ClientResponseError(mock.Mock(), (), status=status, message='Bad Request')
+        error.response_error_payload = payload
+        return error
+
+    def test_other_bad_requests_keep_response_format(self):
+        client = LLMClient(api_key='t', model='m', base_url='http://127.0.0.1:1/v1')
+        params = {'response_format': {'type': 'json_object'}}
+
+        self.assertFalse(client._drop_rejected_format(self._error(400, {'error': 'prompt is too long'}), params))
+        self.assertIn('response_format', params)
+        self.assertTrue(client.response_format_supported)
+
+    def test_response_format_disabled_after_repeated_rejections(self):
+        client = LLMClient(api_key='t', model='m', base_url='http://127.0.0.1:1/v1')
+        rejection = self._error(422, {'error': 'response_format json_schema is not supported'})
+
+        for _ in range(LLMClient.FORMAT_REJECTIONS_TO_DISABLE - 1):
+            params = {'response_format': {'type': 'json_object'}}
+            self.assertTrue(client._drop_rejected_format(rejection, params))
+            self.assertNotIn('response_format', params)
+        self.assertTrue(client.response_format_supported)
+
+        # Una petición aceptada con el formato reinicia la cuenta
+        client._format_accepted({'response_format': {'type': 'json_object'}})
+        client._drop_rejected_format(rejection, {'response_format': {}})
+        self.assertTrue(client.response_format_supported)
+
+        for _ in range(LLMClient.FORMAT_REJECTIONS_TO_DISABLE - 1):
+            client._drop_rejected_format(rejection, {'response_format': {}})
+        self.assertFalse(client.response_format_supported)
+
+
+class SessionStoreTests(SimpleTestCase):
+    """Turnos en memoria combinados con los guardados en ChatMessage."""
+
+    def _turn(self, message, created_at):
+        return {'message': message, 'response': 'r', 'created_at': created_at}
+
+    def test_pending_turns_are_merged_with_stored_rows(self):
+        store = SessionStore(max_turns=3)
+        store.add_turn('s', 'b', 'r', 2)
+        store.add_turn('s', 'd', 'r', 4)
+
+        # 'b' ya está guardado, 'd' todavía no; 'a' y 'c' los respondió otro worker
+        rows = [self._turn('a', 1), self._turn('b', 2), self._turn('c', 3)]
+        self.assertEqual([t['message'] for t in store.merge_turns('s', rows)], ['b', 'c', 'd'])
+
+    def test_turn_from_other_worker_resets_retrieval(self):
+        store = SessionStore()
+        store.add_turn('s', 'a', 'r', 1)
+        store.set_retrieval('s', [1.0], 'contexto', [])
+
+        store.merge_turns('s', [self._turn('a', 1)])
+        self.assertIsNotNone(store.get_retrieval('s'))
+
+        store.merge_turns('s', [self._turn('a', 1), self._turn('b', 2)])
+        self.assertIsNone(store.get_retrieval('s'))
+
+
+class RAGServiceReloadTests(SimpleTestCase):
+    """Workers que leen el índice mientras update_index lo sustituye."""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        shutil.copy(SAMPLE_PDF, self.data_dir)
+
+        embeddings = DeterministicFakeEmbedding(size=384)
+        patcher = mock.patch.object(RAGService, '_create_embeddings', lambda service: embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.writer = self._service()
+        self.writer.initialize_vector_store()
+        self.reader = self._service()
+        self.reader.initialize_vector_store(sync=False)
+
+    def _service(self):
+        service = RAGService(data_dir=self.data_dir, index_type='flat', ingest_workers=1)
+        self.addCleanup(service.close)
+        return service
+
+    def _rebuild(self):
+        # El mtime del índice nuevo debe cambiar aunque el sistema de ficheros tenga poca resolución
+        time.sleep(0.01)
+        self.writer.build_vector_store()
+
+    def test_reader_reloads_swapped_index(self):
+        self.assertFalse(self.reader.reload_if_changed())
+        self._rebuild()
+
+        self.assertNotEqual(self.reader.index_version, self.writer.index_version)
+        self.assertTrue(self.reader.reload_if_changed())
+        self.assertEqual(self.reader.index_version, self.writer.index_version)
+        _, docs = self.reader.get_relevant_context('pull cup', k=2)
+        self.assertEqual(len(docs), 2)
+
+    def test_faq_answers_follow_reloaded_index(self):
+        faq = FaqStore(os.path.join(self.data_dir, 'faq.sqlite3'))
+        self.addCleanup(faq._conn.close)
+        embedding = self.reader.embed_query('¿Qué es la Best Practice 4?')
+
+        # update_index sustituye el índice y regenera la FAQ para la versión nueva
+        self._rebuild()
+        faq.replace([{'question': '¿Qué es la Best Practice 4?', 'embedding': embedding,
+                      'response': {'text_response': 'BP4', 'images': []}}], self.writer.index_version)
+        self.assertIsNone(faq.lookup(embedding, self.reader.index_version, 'BP4'))
+
+        self.reader.reload_if_changed()
+        self.assertEqual(faq.lookup(embedding, self.reader.index_version, 'BP4')['text_response'], 'BP4')
+
+    def test_reader_waits_while_index_is_being_written(self):
+        self._rebuild()
+        with self.writer._write_lock():
+            # Otro hilo/proceso con el lock: se sigue usando el índice cargado
+            result = []
+            thread = threading.Thread(target=lambda: result.append(self.reader.reload_if_changed()))
+            thread.start()
+            thread.join()
+            self.assertEqual(result, [False])
+        self.assertTrue(self.reader.reload_if_changed())
+
+
+class SemanticResponseCacheTests(SimpleTestCase):
+    """Caché semántica: umbral, sección, caducidad y versión del índice."""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = os.path.join(root, 'cache.sqlite3')
+        self.cache = self._open()
+        self.embeddings = DeterministicFakeEmbedding(size=64)
+
+    def _open(self):
+        cache = SemanticResponseCache(self.path, threshold=0.95, max_entries=10, ttl_seconds=3600)
+        self.addCleanup(cache._conn.close)
+        return cache
+
+    def _store(self, cache, query, version='v1'):
+        cache.store(query, self.embeddings.embed_query(query), {'text_response': query, 'images': []}, version)
+
+    def _lookup(self, cache, query, version='v1', section=None):
+        answer = cache.lookup(self.embeddings.embed_query(query), version, section)
+        return answer['text_response'] if answer else None
+
+    def test_hit_requires_same_section(self):
+        self._store(self.cache, '¿Qué dice la Best Practice 3?')
+
+        self.assertEqual(self._lookup(self.cache, '¿Qué dice la Best Practice 3?', section='BP3'),
+                         '¿Qué dice la Best Practice 3?')
+        self.assertIsNone(self._lookup(self.cache, '¿Qué dice la Best Practice 3?', section='BP4'))
+        self.assertIsNone(self._lookup(self.cache, 'otra pregunta distinta', section='BP3'))
+
+    def test_expired_answer_is_not_served(self):
+        self._store(self.cache, 'pull cup')
+        with mock.patch('myapp.utils.response_cache.time.time', return_value=time.time() + 7200):
+            self.assertIsNone(self._lookup(self.cache, 'pull cup'))
+
+    def test_workers_on_different_index_versions_keep_their_answers(self):
+        other_worker = self._open()
+        self._store(self.cache, 'pull cup', 'v1')
+        self._store(other_worker, 'manija', 'v2')
+
+        self.assertEqual(self._lookup(self.cache, 'pull cup', 'v1'), 'pull cup')
+        self.assertIsNone(self._lookup(self.cache, 'pull cup', 'v2'))
+        self.assertEqual(self._lookup(self.cache, 'manija', 'v2'), 'manija')
+
+        # Solo se conservan las respuestas de las dos versiones más recientes
+        self._store(other_worker, 'tornillo', 'v3')
+        self.assertIsNone(self._lookup(self.cache, 'pull cup', 'v1'))
+        self.assertEqual(self._lookup(self.cache, 'manija', 'v2'), 'manija')
+
+    def test_hits_do_not_write_on_every_lookup(self):
+        other_worker = self._open()
+        self._store(self.cache, 'pull cup')
+        self._lookup(other_worker, 'pull cup')
+        data_version = other_worker._conn.execute('PRAGMA data_version').fetchone()[0]
+
+        for _ in range(5):
+            self.assertEqual(self._lookup(self.cache, 'pull cup'), 'pull cup')
+        self.assertEqual(other_worker._conn.execute('PRAGMA data_version').fetchone()[0], data_version)
+
+
+class RequestCoalescerStreamTests(SimpleTestCase):
+    """Streams compartidos entre workers a través de lock_dir."""
+
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lock_dir, ignore_errors=True)
+        self.calls = []
+
+    def _worker(self):
+        # Cada worker tiene su propio coalescer; solo comparten el directorio
+        return RequestCoalescer(self.lock_dir, wait_timeout=5, poll_interval=0.01)
+
+    def _produce(self, name, delay=0.05):
+        async def produce():
+            self.calls.append(name)
+            for i in range(3):
+                await asyncio.sleep(delay)
+                yield f'{name}-{i}'
+        return produce
+
+    async def _collect(self, coalescer, name, delay=0.05):
+        return [event async for event in coalescer.stream('pull cup', self._produce(name, delay))]
+
+    def test_follower_replays_leader_events(self):
+        async def run():
+            leader = asyncio.ensure_future(self._collect(self._worker(), 'a'))
+            await asyncio.sleep(0.07)
+            return await asyncio.gather(leader, self._collect(self._worker(), 'b'))
+
+        self.assertEqual(asyncio.run(run()), [['a-0', 'a-1', 'a-2']] * 2)
+        self.assertEqual(self.calls, ['a'])
+
+    def test_follower_leads_when_generation_ends_before_it_reads(self):
+        coalescer = self._worker()
+        # Un líder que termina (y borra su fichero) justo cuando llega el seguidor
+        lock = FileLock(coalescer._path('pull cup') + '.stream.lock')
+        lock.acquire()
+
+        async def run():
+            follower = asyncio.ensure_future(self._collect(coalescer, 'b', delay=0))
+            await asyncio.sleep(0.05)
+            lock.release()
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), ['b-0', 'b-1', 'b-2'])
+        self.assertEqual(self.calls, ['b'])
+
+    def test_follower_of_failed_leader_raises(self):
+        async def failing():
+            yield 'a-0'
+            await asyncio.sleep(0.05)
+            raise ValueError('fallo del LLM')
+
+        async def lead():
+            with self.assertRaises(ValueError):
+                async for _ in self._worker().stream('pull cup', failing):
+                    pass
+
+        async def run():
+            leader = asyncio.ensure_future(lead())
+            await asyncio.sleep(0.01)
+            events = []
+            started = time.monotonic()
+            with self.assertRaisesRegex(RuntimeError, 'interrumpió'):
+                async for event in self._worker().stream('pull cup', self._produce('b')):
+                    events.append(event)
+            await leader
+            return events, time.monotonic() - started
+
+        events, seconds = asyncio.run(run())
+        self.assertEqual(events, ['a-0'])
+        # Se entera por el fichero de eventos, sin esperar a wait_timeout
+        self.assertLess(seconds, 1)
+
+
+class MetricsTests(SimpleTestCase):
+    """Endpoint /metrics/ y suma de las métricas de varios workers."""
+
+    def test_endpoint_disabled_by_default(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_ALLOWED_IPS=['10.0.0.1'], METRICS_MULTIPROC_DIR='')
+    def test_endpoint_only_for_allowed_ips(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    def test_metrics_of_all_workers_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        patcher = mock.patch.object(metrics, '_multiprocess_dir', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Otro worker ya ha escrito sus métricas
+        with open(os.path.join(directory, 'metrics-1.json'), 'w') as f:
+            json.dump({metrics.CACHE_REQUESTS.name: [[['hit'], 3]],
+                       metrics.REQUEST_SECONDS.name: [[['otro'], [1] + [0] * 13 + [0.004, 1]]]}, f)
+        own_hits = metrics.CACHE_REQUESTS.value(result='hit')
+
+        text = metrics.render_metrics()
+        self.assertIn(f'chatbot_response_cache_requests_total{{result="hit"}} {own_hits + 3}', text)
+        self.assertIn('chatbot_request_duration_seconds_count{endpoint="otro"} 1', text)
+        self.assertTrue(os.path.exists(os.path.join(directory, f'metrics-{os.getpid()}.json')))
+
+
+class TokenCounterTests(SimpleTestCase):
+    """Elección del tokenizador con el que se cuentan los tokens del prompt."""
+
+    def test_first_locally_cached_tokenizer_is_used(self):
+        tokenizer = mock.Mock()
+
+        def from_pretrained(name, local_files_only=False):
+            if name != 'embeddings':
+                raise OSError('no está en la caché')
+            return tokenizer
+
+        with mock.patch('transformers.AutoTokenizer.from_pretrained', side_effect=from_pretrained) as loader:
+            counter = TokenCounter(None, local_tokenizers=['llm', 'embeddings'])
+
+        self.assertIs(counter.tokenizer, tokenizer)
+        # Sin PROMPT_TOKENIZER nunca se descarga nada
+        self.assertTrue(all(call.kwargs['local_files_only'] for call in loader.call_args_list))
+
+    def test_length_estimate_when_nothing_is_cached(self):
+        with mock.patch('transformers.AutoTokenizer.from_pretrained', side_effect=OSError('offline')):
+            counter = TokenCounter(None, local_tokenizers=['llm'])
+        self.assertIsNone(counter.tokenizer)
+        self.assertGreater(counter.count('Espacio libre entre el portaobjetos y el asiento'), 0)
+
+
+class ParseLLMOutputTests(SimpleTestCase):
+    """Lectura de la respuesta JSON del LLM."""
+
+    def test_fenced_json(self):
+        output = '```json\n{"texto": "Deja 25 mm de holgura.", "imagenes": ["bp1.png"]}\n```'
+        self.assertEqual(parse_llm_output(output), ('Deja 25 mm de holgura.', ['bp1.png']))
+
+    def test_truncated_json_keeps_decoded_text_and_complete_images(self):
+        output = '{"imagenes": ["bp1.png", "bp2.p'
+        self.assertEqual(parse_llm_output(output), (output, []))
+        output = '{"imagenes": ["bp1.png"], "texto": "Deja 25 mm de hol'
+        self.assertEqual(parse_llm_output(output), ('Deja 25 mm de hol', ['bp1.png']))
+
+    def test_unexpected_types_fall_back_to_raw_text(self):
+        output = '{"texto": {"respuesta": "sí"}, "imagenes": "bp1.png"}'
+        self.assertEqual(parse_llm_output(output), (output, []))
+        self.assertEqual(parse_llm_output('{"texto": "sí", "imagenes": ["a.png", 3]}'), ('sí', ['a.png']))
+
+    def test_plain_text(self):
+        self.assertEqual(parse_llm_output('Sin JSON'), ('Sin JSON', []))
+
+
+class DocumentSyncTests(SimpleTestCase):
+    """sync_documents solo aplica los ficheros añadidos, modificados o borrados."""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        shutil.copy(SAMPLE_PDF, self.data_dir)
+
+        embeddings = DeterministicFakeEmbedding(size=384)
+        patcher = mock.patch.object(RAGService, '_create_embeddings', lambda service: embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.service = RAGService(data_dir=self.data_dir, index_type='flat', ingest_workers=1)
+        self.addCleanup(self.service.close)
+        self.service.initialize_vector_store()
+        self.docx_path = os.path.join(self.data_dir, 'asientos.docx')
+
+    def _write_docx(self, text):
+        import docx
+        document = docx.Document()
+        document.add_paragraph(text)
+        document.save(self.docx_path)
+
+    def _ids(self, name):
+        return set(self.service.read_manifest()['files'][name]['ids'])
+
+    def test_added_modified_and_deleted_files(self):
+        pdf_ids = self._ids('GM-bp.pdf')
+
+        self._write_docx('Best Practice 9: Los raíles del asiento no deben rozar la moqueta.')
+        self.assertEqual(self.service.sync_documents(), {'added': ['asientos.docx'], 'updated': [], 'deleted': []})
+        first_ids = self._ids('asientos.docx')
+        _, docs = self.service.get_relevant_context('raíles del asiento', k=100)
+        self.assertIn(self.docx_path, {doc.metadata['source'] for doc in docs})
+
+        self._write_docx('Best Practice 9: Los raíles del asiento quedan a 10 mm de la moqueta.')
+        self.assertEqual(self.service.sync_documents(), {'added': [], 'updated': ['asientos.docx'], 'deleted': []})
+        self.assertFalse(first_ids & self._ids('asientos.docx'))
+
+        os.remove(self.docx_path)
+        self.assertEqual(self.service.sync_documents(), {'added': [], 'updated': [], 'deleted': ['asientos.docx']})
+        manifest = self.service.read_manifest()
+        self.assertEqual(list(manifest['files']), ['GM-bp.pdf'])
+        # El PDF no cambió: sus fragmentos no se volvieron a generar
+        self.assertEqual(self._ids('GM-bp.pdf'), pdf_ids)
+        _, docs = self.service.get_relevant_context('raíles del asiento', k=100)
+        self.assertNotIn(self.docx_path, {doc.metadata['source'] for doc in docs})
+
+    def test_unchanged_files_are_not_reindexed(self):
+        version = self.service.index_version
+        self.assertEqual(self.service.sync_documents(), {'added': [], 'updated': [], 'deleted': []})
+        self.assertEqual(self.service.index_version, version)
+
+
+class SectionChunkerTests(SimpleTestCase):
+    """Troceado por secciones "Best Practice N" y sección nombrada en la consulta."""
+
+    def test_one_chunk_per_section(self):
+        pages = [
+            Document(page_content='Guía de interiores\nBest Practice 1: Etiquetas\nCriteria: visibles', metadata={'page': 0}),
+            Document(page_content='desde el asiento.\nBest Practice 2\nConsequences: reclamaciones', metadata={'page': 1}),
+        ]
+        chunks = split_sections(pages, chunk_size=1000)
+
+        self.assertEqual([chunk.metadata.get('section') for chunk in chunks], [None, 'BP1', 'BP2'])
+        # Una sección que sigue en la página siguiente no se corta
+        self.assertIn('desde el asiento.', chunks[1].page_content)
+        self.assertEqual(chunks[1].metadata['page'], 0)
+        self.assertEqual(chunks[2].metadata['page'], 1)
+
+    def test_long_section_pieces_repeat_heading(self):
+        text = 'Best Practice 3: Holguras\n' + '\n\n'.join(['Criteria: holgura mínima de 25 mm.'] * 6)
+        chunks = split_sections([Document(page_content=text, metadata={})], chunk_size=80)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertEqual(chunk.metadata['section'], 'BP3')
+            self.assertTrue(chunk.page_content.startswith('Best Practice 3: Holguras'))
+
+    def test_section_for_query(self):
+        self.assertEqual(section_for_query('¿Qué dice la Best Practice 3?'), 'BP3')
+        self.assertEqual(section_for_query('criterios de la bp #12'), 'BP12')
+        self.assertIsNone(section_for_query('Compara las Best Practices 3 y 4'))
+        self.assertIsNone(section_for_query('¿Qué holgura necesita el portaobjetos?'))
+
+
+class RequestCoalescerTests(SimpleTestCase):
+    """Peticiones idénticas y simultáneas dentro de un proceso."""
+
+    def test_concurrent_runs_share_one_call(self):
+        coalescer = RequestCoalescer()
+        calls = []
+
+        async def produce():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {'text_response': 'BP4'}
+
+        async def run():
+            return await asyncio.gather(*(coalescer.run('pull cup', produce) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [{'text_response': 'BP4'}] * 5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(coalescer._flights, {})
+
+    def test_leader_error_reaches_waiting_callers(self):
+        coalescer = RequestCoalescer()
+
+        async def produce():
+            await asyncio.sleep(0.05)
+            raise ValueError('fallo del LLM')
+
+        async def run():
+            return await asyncio.gather(*(coalescer.run('pull cup', produce) for _ in range(3)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(coalescer._flights, {})
+
+    def test_late_stream_subscriber_receives_earlier_events(self):
+        coalescer = RequestCoalescer()
+        calls = []
+
+        async def produce():
+            calls.append(1)
+            for i in range(3):
+                await asyncio.sleep(0.03)
+                yield f'e{i}'
+
+        async def collect():
+            return [event async for event in coalescer.stream('pull cup', produce)]
+
+        async def run():
+            leader = asyncio.ensure_future(collect())
+            await asyncio.sleep(0.05)
+            return await asyncio.gather(leader, collect())
+
+        self.assertEqual(asyncio.run(run()), [['e0', 'e1', 'e2']] * 2)
+        self.assertEqual(calls, [1])
+        # Una vez terminado, la siguiente petición genera de nuevo
+        self.assertEqual(asyncio.run(collect()), ['e0', 'e1', 'e2'])
+        self.assertEqual(calls, [1, 1])
+
+
+class MicroBatcherTests(SimpleTestCase):
+    """Agrupación de llamadas concurrentes en lotes."""
+
+    def _submit_all(self, batcher, items):
+        results = {}
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, batcher.submit(i))) for i in items]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_are_batched(self):
+        batches = []
+        release = threading.Event()
+
+        def process(items):
+            # El primer lote espera para que los demás se acumulen en la cola
+            release.wait(1)
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait=0.5)
+        self.addCleanup(batcher.close)
+        threading.Timer(0.1, release.set).start()
+        results = self._submit_all(batcher, range(9))
+
+        self.assertEqual(results, {i: i * 2 for i in range(9)})
+        self.assertLessEqual(max(len(batch) for batch in batches), 4)
+        self.assertLess(len(batches), 9)
+
+    def test_lone_call_is_not_delayed(self):
+        batcher = MicroBatcher(lambda items: items, max_wait=5)
+        self.addCleanup(batcher.close)
+        started = time.monotonic()
+        self.assertEqual(batcher.submit('a'), 'a')
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_errors_reach_every_caller_of_the_batch(self):
+        def process(items):
+            raise ValueError('lote inválido')
+
+        batcher = MicroBatcher(process)
+        self.addCleanup(batcher.close)
+        with self.assertRaisesRegex(ValueError, 'lote inválido'):
+            batcher.submit(1)
+
+    def test_closed_batcher_rejects_calls(self):
+        batcher = MicroBatcher(lambda items: items)
+        self.assertEqual(batcher.submit(1), 1)
+        batcher.close()
+        self.assertFalse(batcher._thread.is_alive())
+        with self.assertRaises(RuntimeError):
+            batcher.submit(2)
+
+
+class BuildContextTests(SimpleTestCase):
+    """Contexto del prompt: fusión, frases repetidas y presupuesto de tokens."""
+
+    def _doc(self, text, page, start=None):
+        metadata = {'source': 'GM-bp.pdf', 'page': page}
+        if start is not None:
+            metadata['start_index'] = start
+        return Document(page_content=text, metadata=metadata)
+
+    def test_overlapping_chunks_of_a_page_are_merged(self):
+        page = 'El portaobjetos deja 25 mm de holgura. Los controles del asiento quedan accesibles.'
+        first, second = self._doc(page[:50], 3, 0), self._doc(page[30:], 3, 30)
+
+        context, _ = build_context([(first, 0.1), (second, 0.2)], max_tokens=1000)
+        self.assertEqual(context, 'El portaobjetos deja 25 mm de holgura.\nLos controles del asiento quedan accesibles.')
+
+    def test_repeated_sentences_are_dropped(self):
+        repeated = 'La etiqueta debe verse desde el asiento del conductor.'
+        docs = [(self._doc(f'{repeated} Criterio uno.', 1), 0.1),
+                (self._doc(f'{repeated.upper()} Criterio dos.', 7), 0.2)]
+
+        context, _ = build_context(docs, max_tokens=1000)
+        self.assertEqual(context.lower().count(repeated.lower()), 1)
+        self.assertIn('Criterio dos.', context)
+
+    def test_budget_is_respected_in_retrieval_order(self):
+        docs = [(self._doc(f'Frase número {i} de la página.', i), 0.1 * i) for i in range(10)]
+        count_words = lambda text: len(text.split())
+
+        context, used = build_context(docs, max_tokens=20, count_tokens=count_words)
+        self.assertLessEqual(used, 20)
+        self.assertEqual(context, 'Frase número 0 de la página.\n\nFrase número 1 de la página.')
+
+
+class IntentRouterTests(SimpleTestCase):
+    """Clasificación de la pregunta antes de la búsqueda."""
+
+    def setUp(self):
+        self.router = IntentRouter({
+            'intents': {
+                'greeting': {'centroid': [1, 0, 0, 0], 'response': '¡Hola!'},
+                'out_of_scope': {'centroid': [0, 1, 0, 0], 'response': 'Solo hablo de Best Practices.'},
+            },
+            'sections': {'BP1': [0, 0, 1, 0], 'BP2': [0, 0, 0.6, 0.8]},
+        })
+
+    def test_canned_intent(self):
+        result = self.router.classify('hola', [1, 0.1, 0, 0])
+        self.assertEqual((result['intent'], result['response']), ('greeting', '¡Hola!'))
+
+    def test_long_message_is_never_a_greeting(self):
+        query = 'hola, ¿cuánta holgura necesita el portaobjetos de la puerta del conductor?'
+        self.assertEqual(self.router.classify(query, [1, 0.1, 0, 0])['intent'], 'in_scope')
+
+    def test_clear_section_is_routed(self):
+        result = self.router.classify('holgura de la etiqueta', [0, 0, 1, 0.1])
+        self.assertEqual((result['intent'], result['section']), ('best_practice', 'BP1'))
+
+    def test_ambiguous_section_searches_everything(self):
+        result = self.router.classify('holgura', [0, 0, 2, 1])
+        self.assertEqual((result['intent'], result['section']), ('in_scope', None))
+
+    def test_named_best_practice_wins(self):
+        result = self.router.classify('hola, ¿qué es la BP2?', [1, 0, 0, 0])
+        self.assertEqual((result['intent'], result['section']), ('best_practice', 'BP2'))
+
+    def test_embedding_of_another_model_is_not_routed(self):
+        self.assertEqual(self.router.classify('hola', [1, 0, 0])['intent'], 'in_scope')
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+    """Comparación de los resultados del benchmark con una ejecución anterior."""
+
+    def test_regressions_beyond_tolerance_are_flagged(self):
+        baseline = {
+            'search': [{'scale': 1, 'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30}],
+            'end_to_end': {'p50_ms': 100, 'p95_ms': 200, 'throughput_rps': 50},
+        }
+        current = {
+            'search': [{'scale': 1, 'p50_ms': 10.5, 'p95_ms': 30, 'p99_ms': 30},
+                       {'scale': 10, 'p50_ms': 50, 'p95_ms': 60, 'p99_ms': 70}],
+            'end_to_end': {'p50_ms': 90, 'p95_ms': 200, 'throughput_rps': 40},
+        }
+
+        lines = compare(current, baseline, tolerance=10)
+        self.assertIn('search[1x] p50_ms: 10.00 -> 10.50 (+5.0%)', lines)
+        self.assertIn('search[1x] p95_ms: 20.00 -> 30.00 (+50.0% regression)', lines)
+        self.assertIn('end_to_end p50_ms: 100.00 -> 90.00 (-10.0%)', lines)
+        # Menos peticiones por segundo es peor
+        self.assertIn('end_to_end throughput_rps: 50.00 -> 40.00 (-20.0% regression)', lines)
+        # La escala 10 no estaba en la ejecución anterior
+        self.assertFalse(any('10x' in line for line in lines))
+
+    def test_missing_sections_are_skipped(self):
+        self.assertEqual(compare({'search': [{'scale': 1, 'p50_ms': 1, 'p95_ms': 1, 'p99_ms': 1}]}, {}), [])
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.chat_view, name='chat'),
     path('get_response/', views.get_bot_response, name='get_response'),
+    path('stream_response/', views.stream_bot_response, name='stream_response'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,113 @@
+import os
+from typing import List
+
+import docx
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+from .document_processor import SECTION_PATTERN, section_id
+
+
+SOURCE_EXTENSIONS = (".pdf", ".docx")
+CHUNKERS = ("recursive", "sections")
+
+
+def load_source(path: str) -> List[Document]:
+    """
+    Load a PDF (one document per page) or a DOCX (one document) as plain text.
+
+    Args:
+        path: Path to a .pdf or .docx file
+
+    Returns:
+        Documents with "source" (and "page" for PDFs) metadata
+    """
+    if path.lower().endswith(".docx"):
+        paragraphs = [para.text.strip() for para in docx.Document(path).paragraphs]
+        text = "\n".join(p for p in paragraphs if p)
+        return [Document(page_content=text, metadata={"source": path})]
+    return PyPDFLoader(path).load()
+
+
+def split_recursive(documents: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """Split documents into overlapping fixed-size chunks, recording each chunk's offset in its page."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        add_start_index=True,
+    )
+    return text_splitter.split_documents(documents)
+
+
+def split_sections(documents: List[Document], chunk_size: int) -> List[Document]:
+    """
+    Split documents on "Best Practice N" headings.
+
+    Each section becomes one chunk with a ``section`` metadata entry such as
+    "BP3". Sections longer than chunk_size are split further on paragraph
+    boundaries without overlap, and every piece after the first repeats the
+    heading so it can still be attributed. Text before the first heading is
+    kept as its own chunk without a section.
+
+    Args:
+        documents: Pages (PDF) or whole documents (DOCX) in reading order
+        chunk_size: Maximum size of a chunk
+
+    Returns:
+        Chunks in reading order
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0, length_function=len)
+    chunks = []
+
+    def flush(lines, metadata, heading):
+        text = "\n".join(lines).strip()
+        if not text:
+            return
+        for i, piece in enumerate(text_splitter.split_text(text)):
+            if i and heading:
+                piece = f"{heading}\n{piece}"
+            chunks.append(Document(page_content=piece, metadata=dict(metadata)))
+
+    lines, metadata, heading = [], None, None
+    for document in documents:
+        for line in document.page_content.splitlines():
+            match = SECTION_PATTERN.match(line.strip())
+            if match:
+                if metadata is not None:
+                    flush(lines, metadata, heading)
+                heading = line.strip()
+                lines = []
+                metadata = {**document.metadata, "section": section_id(match.group(1))}
+            elif metadata is None:
+                metadata = dict(document.metadata)
+            lines.append(line)
+    if metadata is not None:
+        flush(lines, metadata, heading)
+    return chunks
+
+
+def split_documents(documents: List[Document], chunker: str, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """
+    Split loaded documents with the configured chunker.
+
+    Args:
+        documents: Documents returned by load_source()
+        chunker: "recursive" for fixed-size overlapping chunks, or "sections"
+            for one chunk per Best Practice section
+        chunk_size: Maximum size of a chunk
+        chunk_overlap: Overlap between recursive chunks
+
+    Returns:
+        Chunks in reading order
+    """
+    if chunker == "sections":
+        return split_sections(documents, chunk_size)
+    if chunker == "recursive":
+        return split_recursive(documents, chunk_size, chunk_overlap)
+    raise ValueError(f"Unknown chunker '{chunker}'. Expected one of {CHUNKERS}")
+
+
+def is_source_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in SOURCE_EXTENSIONS
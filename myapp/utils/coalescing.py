@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import unicodedata
+import concurrent.futures
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from filelock import FileLock, Timeout
+
+
+_END = object()
+
+
+class _LeaderGone(Exception):
+    """The events file being followed was removed before the stream ended."""
+
+# Lock and result files untouched for this long belong to finished requests
+STALE_FILE_SECONDS = 3600
+
+
+def normalize_query(query: str) -> str:
+    """Key under which identical questions are coalesced: case, accents, spacing and ¿?¡! are ignored."""
+    text = unicodedata.normalize("NFKD", query).casefold()
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" ¿?¡!.")
+
+
+class _Broadcast:
+    """Events of one stream, replayed to late subscribers and pushed live to the rest."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, event: str):
+        with self._lock:
+            self.events.append(event)
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def close(self):
+        with self._lock:
+            self.done = True
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, _END)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        # Subscribers may run on other event loops (one per request under WSGI)
+        queue = asyncio.Queue()
+        with self._lock:
+            backlog = list(self.events)
+            done = self.done
+            if not done:
+                self._subscribers.append((asyncio.get_running_loop(), queue))
+        for event in backlog:
+            yield event
+        if done:
+            return
+        while True:
+            event = await queue.get()
+            if event is _END:
+                return
+            yield event
+
+
+class RequestCoalescer:
+    """
+    Single-flight execution of identical requests.
+
+    Concurrent calls with the same key share one upstream generation: the
+    first caller (the leader) runs it and every other caller receives its
+    result, or for streams the same sequence of events. Inside a process the
+    callers wait on a future or a broadcast; across worker processes the
+    leader holds a file lock in lock_dir and publishes the result (or the
+    events as they are produced) to a file next to it.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, wait_timeout: float = 90, poll_interval: float = 0.02):
+        """
+        Initialize the coalescer.
+
+        Args:
+            lock_dir: Directory for the lock and result files shared between
+                workers, or None to coalesce only within this process
+            wait_timeout: Seconds a caller waits on another process before
+                generating the answer itself
+            poll_interval: Seconds between checks of another process's progress
+        """
+        self.lock_dir = lock_dir
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+        self._flights: Dict[str, concurrent.futures.Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    async def run(self, key: str, produce: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return produce()'s result, sharing one call among concurrent callers.
+
+        Args:
+            key: Identity of the request, e.g. normalize_query(question)
+            produce: Coroutine function generating a JSON-serializable result
+
+        Returns:
+            The result of the leader's call
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = concurrent.futures.Future()
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await self._run_shared(key, produce)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # A cancelled leader (client gone) must not cancel the requests waiting on it
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("La generación compartida se canceló"))
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    async def stream(self, key: str, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Yield produce()'s events, sharing one stream among concurrent callers.
+
+        Callers that join late first receive the events already produced.
+
+        Args:
+            key: Identity of the request, e.g. normalize_query(question)
+            produce: Function returning an async iterator of string events
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._streams[key] = _Broadcast()
+        if not leader:
+            async for event in broadcast.subscribe():
+                yield event
+            return
+
+        try:
+            async for event in self._stream_shared(key, produce):
+                broadcast.publish(event)
+                yield event
+        finally:
+            with self._lock:
+                self._streams.pop(key, None)
+            broadcast.close()
+
+    def _path(self, key: str) -> str:
+        self._sweep()
+        return os.path.join(self.lock_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32])
+
+    def _sweep(self):
+        """Remove files of questions nobody has asked for a while, at most once per STALE_FILE_SECONDS."""
+        now = time.monotonic()
+        if now - self._last_sweep < STALE_FILE_SECONDS:
+            return
+        self._last_sweep = now
+        cutoff = time.time() - STALE_FILE_SECONDS
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    async def _run_shared(self, key: str, produce: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.lock_dir:
+            return await produce()
+
+        path = self._path(key)
+        lock = FileLock(path + ".lock")
+        waiting_since = time.time()
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                lock.acquire(timeout=0)
+                break
+            except Timeout:
+                pass
+            if time.monotonic() > deadline:
+                return await produce()
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            # Another worker answered while this one waited for the lock
+            result_path = path + ".json"
+            if os.path.exists(result_path) and os.path.getmtime(result_path) >= waiting_since:
+                with open(result_path, encoding="utf-8") as f:
+                    return json.load(f)
+
+            result = await produce()
+            with open(result_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(result_path + ".tmp", result_path)
+            return result
+        finally:
+            lock.release()
+
+    async def _stream_shared(self, key: str, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        if not self.lock_dir:
+            async for event in produce():
+                yield event
+            return
+
+        path = self._path(key)
+        lock = FileLock(path + ".stream.lock")
+        events_path = path + ".events"
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                lock.acquire(timeout=0)
+                break
+            except Timeout:
+                pass
+
+            # Another worker is generating: follow its events file
+            try:
+                events_file = open(events_path, encoding="utf-8")
+            except FileNotFoundError:
+                # Not created yet, or the generation has just ended: try to lead again
+                if time.monotonic() > deadline:
+                    async for event in produce():
+                        yield event
+                    return
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            followed = False
+            try:
+                with events_file:
+                    async for event in self._follow(events_file, deadline):
+                        followed = True
+                        yield event
+                return
+            except _LeaderGone:
+                if followed:
+                    raise RuntimeError("La generación compartida se interrumpió")
+
+        try:
+            # A new file: followers of a previous, interrupted generation see theirs removed
+            try:
+                os.remove(events_path)
+            except FileNotFoundError:
+                pass
+            with open(events_path, "w", encoding="utf-8") as events_file:
+                completed = False
+                try:
+                    async for event in produce():
+                        events_file.write(json.dumps(event, ensure_ascii=False) + "\n")
+                        events_file.flush()
+                        yield event
+                    completed = True
+                finally:
+                    # null ends the stream for followers, false tells them it failed
+                    events_file.write(json.dumps(None if completed else False) + "\n")
+        finally:
+            # Followers keep reading their open handle; newcomers start a new generation
+            try:
+                os.remove(events_path)
+            except OSError:
+                pass
+            lock.release()
+
+    async def _follow(self, events_file, deadline: float) -> AsyncIterator[str]:
+        """
+        Yield the events another worker writes to events_file until it ends the stream.
+
+        Raises:
+            _LeaderGone: The file was removed or replaced without being
+                ended, i.e. its generation was interrupted
+        """
+        pending = ""
+        while True:
+            pending += events_file.read()
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                event = json.loads(line)
+                if event is None:
+                    return
+                if event is False:
+                    raise RuntimeError("La generación compartida se interrumpió")
+                yield event
+            if os.fstat(events_file.fileno()).st_nlink == 0:
+                # Removed: read what was written before, then give up if it has no end
+                rest = events_file.read()
+                if not rest:
+                    raise _LeaderGone()
+                pending += rest
+                continue
+            if time.monotonic() > deadline:
+                raise RuntimeError("La generación compartida se interrumpió")
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,204 @@
+import time
+import queue
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for budgeting."""
+    return max(1, len(text) // 4)
+
+
+def history_messages(turns: List[Dict], max_tokens: int,
+                     count_tokens: Callable[[str], int] = estimate_tokens) -> List[Dict]:
+    """
+    Turn recent conversation turns into chat messages within a token budget.
+
+    The newest turns are kept first; a turn that does not fit ends the window.
+
+    Args:
+        turns: Turns with "message" and "response", oldest first
+        max_tokens: Token budget for the whole history
+        count_tokens: Token counter, e.g. TokenCounter.count
+
+    Returns:
+        Alternating user/assistant messages, oldest first
+    """
+    messages = []
+    used = 0
+    for turn in reversed(turns):
+        cost = count_tokens(turn["message"]) + count_tokens(turn["response"])
+        if used + cost > max_tokens:
+            break
+        used += cost
+        messages[:0] = [
+            {"role": "user", "content": turn["message"]},
+            {"role": "assistant", "content": turn["response"]},
+        ]
+    return messages
+
+
+class SessionStore:
+    """
+    Recent turns and the last retrieval of each conversation, kept in memory.
+
+    Bounded by an LRU over sessions. Turns answered by this process are added
+    at once, before the background writer has saved them; merge_turns()
+    combines them with the rows read from the database, so turns answered by
+    another worker are not missed either. Turns are identified by created_at.
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_turns: int = 10):
+        """
+        Initialize the store.
+
+        Args:
+            max_sessions: Sessions kept before the least recently used is dropped
+            max_turns: Turns kept per session
+        """
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id: str) -> Dict[str, Any]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"turns": [], "retrieval": None}
+            self._sessions[session_id] = session
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def merge_turns(self, session_id: str, rows: List[Dict]) -> List[Dict]:
+        """
+        Recent turns, oldest first: the given database rows plus this process's
+        turns that are not among them yet.
+
+        Args:
+            session_id: Conversation
+            rows: The session's newest ChatMessage rows, oldest first, with
+                "message", "response" and "created_at"
+
+        Returns:
+            Up to max_turns turns with "message", "response" and "created_at"
+        """
+        with self._lock:
+            session = self._session(session_id)
+            known = {turn["created_at"] for turn in session["turns"]}
+            if rows and session["turns"] and rows[-1]["created_at"] not in known \
+                    and rows[-1]["created_at"] > session["turns"][-1]["created_at"]:
+                # Another worker answered since: the last retrieval is no longer the previous question's
+                session["retrieval"] = None
+            stored = {row["created_at"] for row in rows}
+            pending = [turn for turn in session["turns"] if turn["created_at"] not in stored]
+            turns = sorted(list(rows) + pending, key=lambda turn: turn["created_at"])[-self.max_turns:]
+            session["turns"] = turns
+            return list(turns)
+
+    def add_turn(self, session_id: str, message: str, response: str, created_at: Any):
+        """Record a turn answered by this process, whether or not it has been written yet."""
+        with self._lock:
+            session = self._session(session_id)
+            turn = {"message": message, "response": response, "created_at": created_at}
+            session["turns"] = (session["turns"] + [turn])[-self.max_turns:]
+
+    def get_retrieval(self, session_id: str) -> Optional[Dict]:
+        """The last retrieval of the session: query embedding, context and documents."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session["retrieval"] if session is not None else None
+
+    def set_retrieval(self, session_id: str, query_embedding: List[float], context: str, documents: List):
+        with self._lock:
+            self._session(session_id)["retrieval"] = {
+                "query_embedding": query_embedding,
+                "context": context,
+                "documents": documents,
+            }
+
+
+def is_follow_up(query_embedding: List[float], previous_embedding: List[float], threshold: float) -> bool:
+    """Whether a query is close enough to the previous one to answer from the same chunks."""
+    a = np.asarray(query_embedding, dtype=np.float32)
+    b = np.asarray(previous_embedding, dtype=np.float32)
+    denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return denominator > 0 and float(a @ b) / denominator >= threshold
+
+
+class BatchWriter:
+    """
+    Buffers records and writes them in bulk from a background thread.
+
+    Records are flushed when batch_size have accumulated or flush_interval
+    seconds after the first pending record, so callers never wait for the
+    database.
+    """
+
+    def __init__(self, write: Callable[[List[Any]], None], batch_size: int = 100,
+                 flush_interval: float = 1.0, max_pending: int = 10000):
+        """
+        Initialize the writer. The thread starts with the first record.
+
+        Args:
+            write: Called from the writer thread with each batch
+            batch_size: Records written per batch
+            flush_interval: Maximum seconds a record waits before being written
+            max_pending: Records buffered before new ones are dropped
+        """
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def add(self, record: Any):
+        """Queue a record for writing, without blocking."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            print("Chat history buffer full; dropping a record")
+
+    def close(self, timeout: float = 5.0):
+        """Write what is still pending and stop the thread."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Collect the rest of the batch until it is full or the interval ends
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception as e:
+                print(f"Error writing {len(batch)} chat history records: {str(e)}")
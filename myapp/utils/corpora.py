@@ -0,0 +1,303 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from .coalescing import normalize_query
+from .rag_service import RAGService
+
+
+CORPUS_CONFIG_FILE = "corpus.json"
+
+
+def read_corpus_config(data_dir: str) -> Dict:
+    """Read a corpus's optional corpus.json."""
+    config_path = os.path.join(data_dir, CORPUS_CONFIG_FILE)
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def discover_corpora(corpora_dir: Optional[str]) -> Dict[str, Dict]:
+    """
+    Find the additional corpora: one subdirectory of corpora_dir per corpus.
+
+    Each subdirectory holds the corpus's PDFs/DOCX files, its own faiss_index
+    and optionally a corpus.json such as
+    {"keywords": ["asiento", "seat"], "default": false}. Keywords route
+    questions to the corpus; default corpora are searched when no keyword
+    matches.
+
+    Args:
+        corpora_dir: Directory containing one subdirectory per corpus
+
+    Returns:
+        Dict mapping each corpus name to its data_dir, keywords and default flag
+    """
+    corpora = {}
+    if not corpora_dir or not os.path.isdir(corpora_dir):
+        return corpora
+    for name in sorted(os.listdir(corpora_dir)):
+        data_dir = os.path.join(corpora_dir, name)
+        if not os.path.isdir(data_dir) or name.startswith("."):
+            continue
+        config = read_corpus_config(data_dir)
+        corpora[name] = {
+            "data_dir": data_dir,
+            "keywords": [name] + list(config.get("keywords", [])),
+            "default": bool(config.get("default", False)),
+        }
+    return corpora
+
+
+class ShardedRAGService:
+    """
+    Retrieval across several corpora, each with its own independently built index.
+
+    The primary corpus (the main data directory) is loaded at start-up and
+    provides the embedding model; the other corpora are loaded on first use
+    with the same model, and the least recently used ones are dropped once
+    more than max_loaded are in memory. A question is routed to the corpora
+    whose keywords it mentions (or to the primary and default corpora), and
+    the routed indexes are searched in parallel with their results merged by
+    score. Scores are comparable because every corpus uses the same
+    embedding model (L2 distances) or rank-based fusion (hybrid mode).
+
+    Exposes the retrieval part of the RAGService API, so views, the retrieval
+    worker and the caches use it unchanged.
+    """
+
+    def __init__(self, primary_name: str, corpora: Dict[str, Dict], max_loaded: int = 4,
+                 fanout_workers: int = 4, **rag_options):
+        """
+        Initialize the sharded service. Nothing is loaded until initialize_vector_store().
+
+        Args:
+            primary_name: Name of the primary corpus, used in routing and results
+            corpora: Additional corpora, as returned by discover_corpora()
+            max_loaded: Additional corpora kept in memory at once
+            fanout_workers: Threads searching corpora in parallel
+            **rag_options: RAGService options of the primary corpus (data_dir,
+                retrieval_mode, ...), also applied to the other corpora
+        """
+        self.primary_name = primary_name
+        self.corpora = corpora
+        self.max_loaded = max_loaded
+        self.rag_options = rag_options
+        self.primary = RAGService(**rag_options)
+        self._shards: "OrderedDict[str, RAGService]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in corpora}
+        # Searches using each loaded corpus, and evicted corpora still in use
+        self._users: Dict[RAGService, int] = {}
+        self._retired = set()
+        self._executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix="corpus-search")
+        # The primary corpus can also declare keywords in a corpus.json of its data_dir
+        keywords = {primary_name: read_corpus_config(self.primary.data_dir).get("keywords", [])}
+        keywords.update((name, corpus["keywords"]) for name, corpus in corpora.items())
+        self._keywords = [
+            (name, re.compile(r"\b(?:" + "|".join(re.escape(normalize_query(k)) for k in words) + r")\b"))
+            for name, words in keywords.items() if words
+        ]
+
+    @property
+    def retrieval_mode(self) -> str:
+        return self.primary.retrieval_mode
+
+    def initialize_vector_store(self, **kwargs):
+        """Load the primary corpus (see RAGService.initialize_vector_store). Other corpora are loaded on first use."""
+        self.primary.initialize_vector_store(**kwargs)
+
+    def reload_if_changed(self) -> bool:
+        """Reload the primary and loaded corpora whose index changed on disk (see RAGService.reload_if_changed)."""
+        with self._lock:
+            loaded = list(self._shards.values())
+        reloaded = [shard.reload_if_changed() for shard in [self.primary] + loaded]
+        return any(reloaded)
+
+    def load_documents(self) -> List[Document]:
+        """Load the documents of every corpus."""
+        documents = self.primary.load_documents()
+        for name in self.corpora:
+            documents.extend(self._new_shard(name).load_documents())
+        return documents
+
+    @property
+    def index_version(self) -> str:
+        """Combined version of every corpus's index; changes when any of them is rebuilt."""
+        versions = [f"{self.primary_name}={self.primary.index_version or self._disk_version(self.primary.data_dir)}"]
+        with self._lock:
+            loaded = dict(self._shards)
+        for name, corpus in self.corpora.items():
+            shard = loaded.get(name)
+            version = shard.index_version if shard is not None else self._disk_version(corpus["data_dir"])
+            versions.append(f"{name}={version}")
+        return hashlib.sha256("|".join(versions).encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _disk_version(data_dir: str) -> str:
+        try:
+            return RAGService._read_index_version(os.path.join(data_dir, "faiss_index"))
+        except OSError:
+            return "missing"
+
+    def route(self, query: str) -> List[str]:
+        """
+        Corpora to search for a question.
+
+        Args:
+            query: User question
+
+        Returns:
+            The corpora whose keywords the question mentions, or else the
+            primary corpus and the default corpora
+        """
+        text = normalize_query(query)
+        matched = [name for name, pattern in self._keywords if pattern.search(text)]
+        if matched:
+            return matched
+        return [self.primary_name] + [name for name, corpus in self.corpora.items() if corpus["default"]]
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.primary.embed_query(query)
+
+    def get_relevant_context(self, query: str, k: int = 4, query_embedding: List[float] = None,
+                             section: str = None, corpora: List[str] = None) -> Tuple[str, List[Document]]:
+        """Retrieve relevant context, see get_relevant_context_with_scores()."""
+        context, docs_with_scores = self.get_relevant_context_with_scores(query, k, query_embedding, section, corpora)
+        return context, [doc for doc, score in docs_with_scores]
+
+    def get_relevant_context_with_scores(self, query: str, k: int = 4, query_embedding: List[float] = None,
+                                         section: str = None, corpora: List[str] = None
+                                         ) -> Tuple[str, List[Tuple[Document, float]]]:
+        """
+        Retrieve relevant context from the routed corpora.
+
+        Args:
+            query: User query
+            k: Number of relevant chunks to retrieve in total
+            query_embedding: Precomputed embedding of the query, if available
+            section: Restrict the search to chunks of this section (e.g. "BP3")
+            corpora: Corpora to search instead of routing the query
+
+        Returns:
+            Tuple of (concatenated context string, list of (document, score)
+            tuples), best first. Each document's metadata names its "corpus"
+        """
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        names = corpora or self.route(query)
+
+        def search(name):
+            shard = self._shard(name)
+            try:
+                _, docs_with_scores = shard.get_relevant_context_with_scores(
+                    query, k=k, query_embedding=query_embedding, section=section
+                )
+            finally:
+                self._release(shard)
+            return [(Document(page_content=doc.page_content, metadata={**doc.metadata, "corpus": name}, id=doc.id), score)
+                    for doc, score in docs_with_scores]
+
+        if len(names) == 1:
+            results = search(names[0])
+        else:
+            results = [hit for hits in self._executor.map(search, names) for hit in hits]
+
+        # L2 distances: lower is better; fused RRF scores: higher is better
+        results.sort(key=lambda hit: hit[1], reverse=self.retrieval_mode == "hybrid")
+        results = results[:k]
+        return "\n\n".join(doc.page_content for doc, score in results), results
+
+    def _new_shard(self, name: str) -> RAGService:
+        return RAGService(**{**self.rag_options, "data_dir": self.corpora[name]["data_dir"]},
+                          embeddings=self.primary.embeddings)
+
+    def _shard(self, name: str) -> RAGService:
+        """Return a loaded corpus, marked as in use until passed to _release()."""
+        if name == self.primary_name:
+            return self.primary
+        if name not in self.corpora:
+            raise ValueError(f"Unknown corpus '{name}'")
+
+        with self._lock:
+            shard = self._checkout(name)
+        if shard is not None:
+            return shard
+
+        # Load outside the main lock so searches on loaded corpora are not blocked
+        with self._load_locks[name]:
+            with self._lock:
+                shard = self._checkout(name)
+            if shard is not None:
+                return shard
+            print(f"Loading corpus '{name}'...")
+            shard = self._new_shard(name)
+            shard.initialize_vector_store(sync=False)
+
+            evicted = []
+            with self._lock:
+                self._shards[name] = shard
+                self._users[shard] = 1
+                while len(self._shards) > self.max_loaded:
+                    evicted_name, evicted_shard = self._shards.popitem(last=False)
+                    print(f"Unloading corpus '{evicted_name}'")
+                    if self._users.get(evicted_shard):
+                        # Closed by the last search still using it
+                        self._retired.add(evicted_shard)
+                    else:
+                        evicted.append(evicted_shard)
+        for evicted_shard in evicted:
+            evicted_shard.close()
+        return shard
+
+    def _checkout(self, name: str) -> Optional[RAGService]:
+        # Called with self._lock held
+        shard = self._shards.get(name)
+        if shard is not None:
+            self._shards.move_to_end(name)
+            self._users[shard] = self._users.get(shard, 0) + 1
+        return shard
+
+    def _release(self, shard: RAGService):
+        """End a use of a corpus returned by _shard(), closing it if it was evicted meanwhile."""
+        if shard is self.primary:
+            return
+        with self._lock:
+            self._users[shard] -= 1
+            if self._users[shard]:
+                return
+            del self._users[shard]
+            if shard not in self._retired:
+                return
+            self._retired.discard(shard)
+        shard.close()
+
+
+def create_rag_service(rag_options: Dict, corpora_dir: str = None, primary_name: str = "gm",
+                       max_loaded: int = 4, fanout_workers: int = 4):
+    """
+    Create the retrieval service for the configured corpora.
+
+    Args:
+        rag_options: RAGService options (settings.RAG_SERVICE_OPTIONS)
+        corpora_dir: Directory of additional corpora, see discover_corpora()
+        primary_name: Name of the corpus in the main data directory
+        max_loaded: Additional corpora kept in memory at once
+        fanout_workers: Threads searching corpora in parallel
+
+    Returns:
+        A RAGService when there are no additional corpora, otherwise a
+        ShardedRAGService. Call initialize_vector_store() before use
+    """
+    corpora = discover_corpora(corpora_dir)
+    if not corpora:
+        return RAGService(**rag_options)
+    return ShardedRAGService(primary_name, corpora, max_loaded=max_loaded, fanout_workers=fanout_workers, **rag_options)
@@ -1,8 +1,60 @@
 import os
 from docx import Document
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Iterable, List, Optional
 import re
 
+# Encabezado de sección: "Best Practice 3", "Best Practice 3: Título"
+SECTION_PATTERN = re.compile(r'^(Best Practice \d+)[:\-]?\s*(.*)', re.IGNORECASE)
+# Mención de Best Practices dentro de un texto: "Best Practice 3", "BP3", "BP #3", "Best Practices 3 y 4"
+BP_MENTION = re.compile(r'\b(?:best\s+practices?|bps?)\s*#?\s*(\d+(?:\s*(?:,|y|e|and|&)\s*\d+)*)\b', re.IGNORECASE)
+# Título de una Best Practice: "BP Title: Door trim label location"
+BP_TITLE = re.compile(r'^BP Title:\s*(.+)', re.IGNORECASE)
+
+# Preguntas frecuentes generadas para cada Best Practice del documento
+FAQ_TEMPLATES = (
+    "¿Qué es la Best Practice {n}?",
+    "¿Cuáles son los criterios de la Best Practice {n}?",
+    "¿Qué consecuencias tiene no cumplir la Best Practice {n}?",
+)
+FAQ_TITLE_TEMPLATE = "¿Qué dice la Best Practice sobre {title}?"
+
+def section_id(heading: str) -> str:
+    """Identificador corto de una sección: "Best Practice 3" -> "BP3"."""
+    number = int(re.search(r'\d+', heading).group())
+    return f"BP{number}"
+
+def best_practice_numbers(texts: Iterable[str]) -> set:
+    """Números de las Best Practices mencionadas en los textos."""
+    numbers = set()
+    for text in texts:
+        for mention in BP_MENTION.findall(text):
+            numbers.update(int(n) for n in re.findall(r'\d+', mention))
+    return numbers
+
+def section_for_query(query: str) -> Optional[str]:
+    """Sección a la que se limita una búsqueda si la consulta nombra exactamente una Best Practice."""
+    numbers = best_practice_numbers([query])
+    if len(numbers) == 1:
+        return f"BP{numbers.pop()}"
+    return None
+
+def faq_questions(texts: Iterable[str]) -> List[str]:
+    """Preguntas frecuentes para cada Best Practice encontrada en los textos, en orden de aparición."""
+    questions = []
+    number = None
+    for text in texts:
+        for line in text.splitlines():
+            line = line.strip()
+            heading = SECTION_PATTERN.match(line)
+            title = BP_TITLE.match(line)
+            if heading:
+                number = int(re.search(r'\d+', heading.group(1)).group())
+                questions.extend(template.format(n=number) for template in FAQ_TEMPLATES)
+            elif title and number is not None:
+                questions.append(FAQ_TITLE_TEMPLATE.format(title=title.group(1).strip()))
+                number = None
+    return list(dict.fromkeys(questions))
+
 def get_document_path():
     """Obtiene la ruta absoluta correcta al documento"""
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -33,7 +85,7 @@ def load_document_contents() -> Tuple[str, Dict[str, str]]:
                 continue
                 
             # Detectar Best Practices
-            section_match = re.match(r'^(Best Practice \d+)[:\-]?\s*(.*)', text, re.IGNORECASE)
+            section_match = SECTION_PATTERN.match(text)
             if section_match:
                 current_section = section_match.group(1).title()
                 sections[current_section] = section_match.group(2)
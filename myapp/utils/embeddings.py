@@ -0,0 +1,201 @@
+import os
+import json
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "embedding_config.json"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed with ONNX Runtime on the CPU.
+
+    Loads a model exported by export_onnx() from a local directory, with no
+    Hugging Face hub lookup and without importing torch or transformers. The
+    pooling (mean over tokens, optionally L2-normalized) reproduces the
+    sentence-transformers model it was exported from, so its vectors can be
+    searched against an index built with the torch backend.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, batch_size: int = 64, threads: int = None):
+        """
+        Load the exported model.
+
+        Args:
+            model_dir: Directory written by export_onnx()
+            quantized: Use the int8 quantized model instead of the float32 one
+            batch_size: Texts encoded per forward pass
+            threads: Intra-op threads of the ONNX Runtime session. Defaults to
+                ONNX Runtime's own setting
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(self.config["max_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = ONNX_QUANTIZED_FILE if quantized else ONNX_MODEL_FILE
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        vectors = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def create_embeddings(backend: str = "torch", model_dir: str = None, batch_size: int = 64,
+                      threads: int = None) -> Embeddings:
+    """
+    Create the embedding model for the chosen backend.
+
+    Args:
+        backend: "torch" for sentence-transformers on PyTorch (downloads the
+            model from the hub), or "onnx" for the int8 model exported to model_dir
+        model_dir: Directory written by export_onnx(), required for "onnx"
+        batch_size: Texts encoded per forward pass
+        threads: CPU threads of the ONNX Runtime session. The torch backend
+            reads its thread count from torch
+
+    Returns:
+        A LangChain Embeddings instance
+    """
+    if backend == "onnx":
+        if not model_dir or not os.path.exists(os.path.join(model_dir, CONFIG_FILE)):
+            raise RuntimeError(
+                f"No exported ONNX embedding model in '{model_dir}'. Run 'python manage.py export_embeddings' first."
+            )
+        return OnnxEmbeddings(model_dir, batch_size=batch_size, threads=threads)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, encode_kwargs={"batch_size": batch_size})
+
+
+def export_onnx(output_dir: str, model_name: str = EMBEDDING_MODEL, quantize: bool = True) -> Dict:
+    """
+    Export a sentence-transformers model to ONNX, plus an int8 quantized copy.
+
+    Requires torch, sentence-transformers and onnx; the exported model only
+    needs onnxruntime and tokenizers.
+
+    Args:
+        output_dir: Directory for the model, tokenizer and config files
+        model_name: Hugging Face id or local path of the sentence-transformers model
+        quantize: Also write the dynamically quantized int8 model
+
+    Returns:
+        The config saved next to the model
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    sample = tokenizer(["Best Practice export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, module):
+            super().__init__()
+            self.module = module
+
+        def forward(self, *inputs):
+            return self.module(**dict(zip(input_names, inputs))).last_hidden_state
+
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer), tuple(sample[name] for name in input_names), model_path,
+            input_names=input_names, output_names=["last_hidden_state"], dynamic_axes=dynamic_axes,
+            opset_version=17, dynamo=False
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(output_dir, ONNX_QUANTIZED_FILE), weight_type=QuantType.QInt8)
+
+    # Renamed in recent sentence-transformers releases
+    dimension = getattr(model, "get_embedding_dimension", None) or model.get_sentence_embedding_dimension
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+    config = {
+        "model_name": model_name,
+        "dimension": dimension(),
+        "max_length": model.max_seq_length,
+        "pad_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+        # Models ending in a Normalize module (all-MiniLM-L6-v2 does) return unit vectors
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return config
+
+
+def compare_embeddings(reference: Sequence[Sequence[float]], candidate: Sequence[Sequence[float]]) -> Dict:
+    """
+    Measure how closely candidate vectors reproduce reference vectors of the same texts.
+
+    Args:
+        reference: Vectors of the model the index was built with
+        candidate: Vectors of the model under test, in the same order
+
+    Returns:
+        Dict with the minimum and mean cosine similarity and the maximum L2
+        distance between paired vectors
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    cosine = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_l2": float(np.linalg.norm(reference - candidate, axis=1).max()),
+    }
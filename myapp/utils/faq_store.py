@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .document_processor import section_for_query
+
+
+class FaqStore:
+    """
+    Answers to frequent questions, generated offline and served without the LLM.
+
+    Each entry holds a question, its query embedding, the Best Practice it
+    names and the full response dict. Questions generated from the same
+    template for different Best Practices embed almost identically, so a
+    match is only served when the query names the same Best Practice (or
+    none, like the question). The table is rebuilt as a whole for one FAISS index version; when
+    the index changes the stored answers stop matching until the store is
+    regenerated, so stale answers are never served.
+    """
+
+    def __init__(self, db_path: str, threshold: float = 0.92):
+        """
+        Open (or create) the answer store.
+
+        Args:
+            db_path: SQLite file holding the precomputed answers
+            threshold: Minimum cosine similarity between a query and a stored question
+        """
+        self.db_path = db_path
+        self.threshold = threshold
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS faq_answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                section TEXT
+            );
+            CREATE TABLE IF NOT EXISTS faq_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(faq_answers)")}
+        if "section" not in columns:
+            # Stores built before sections were recorded
+            self._conn.execute("ALTER TABLE faq_answers ADD COLUMN section TEXT")
+            self._conn.executemany(
+                "UPDATE faq_answers SET section = ? WHERE id = ?",
+                [(section_for_query(question), row_id)
+                 for row_id, question in self._conn.execute("SELECT id, question FROM faq_answers").fetchall()]
+            )
+        self._conn.commit()
+
+        # In-memory copy of the table, reloaded when the store is regenerated
+        self._responses: List[Dict] = []
+        self._sections: List[Optional[str]] = []
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._index_version = None
+        self._data_version = None
+
+    def lookup(self, query_embedding: List[float], index_version: str, section: str = None) -> Optional[Dict]:
+        """
+        Find the precomputed answer for a query.
+
+        Args:
+            query_embedding: Embedding of the incoming query
+            index_version: Version of the FAISS index currently in use
+            section: Best Practice the query names, as returned by
+                section_for_query(). Only questions naming the same one match
+
+        Returns:
+            Stored response dict, or None if no question of the same section is
+            close enough or the store was built for another index version
+        """
+        with self._lock:
+            self._refresh()
+            if not self._responses or self._index_version != index_version:
+                return None
+
+            query = np.asarray(query_embedding, dtype=np.float32)
+            similarities = self._matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+            similarities[[entry_section != section for entry_section in self._sections]] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            return dict(self._responses[best])
+
+    def replace(self, entries: List[Dict], index_version: str):
+        """
+        Replace every stored answer in a single transaction.
+
+        Args:
+            entries: Dicts with "question", "embedding" and "response"
+            index_version: Version of the FAISS index the answers were built from
+        """
+        rows = []
+        for entry in entries:
+            vector = np.asarray(entry["embedding"], dtype=np.float32)
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+            rows.append((entry["question"], vector.tobytes(), json.dumps(entry["response"], ensure_ascii=False),
+                         section_for_query(entry["question"])))
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM faq_answers")
+                self._conn.executemany("INSERT INTO faq_answers (question, embedding, response, section) VALUES (?, ?, ?, ?)", rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO faq_meta (key, value) VALUES ('index_version', ?)",
+                    (index_version or "",)
+                )
+            self._data_version = None
+
+    def index_version(self) -> Optional[str]:
+        """Index version the stored answers were built from, or None if the store is empty."""
+        row = self._conn.execute("SELECT value FROM faq_meta WHERE key = 'index_version'").fetchone()
+        return row[0] if row is not None else None
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM faq_answers").fetchone()[0]
+
+    def _refresh(self):
+        # data_version only changes on commits from other connections
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+
+        rows = self._conn.execute("SELECT embedding, response, section FROM faq_answers ORDER BY id").fetchall()
+        self._responses = [json.loads(row[1]) for row in rows]
+        self._sections = [row[2] for row in rows]
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = np.empty((0, 0), dtype=np.float32)
+        row = self._conn.execute("SELECT value FROM faq_meta WHERE key = 'index_version'").fetchone()
+        self._index_version = row[0] if row is not None else None
+        self._data_version = data_version
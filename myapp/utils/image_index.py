@@ -0,0 +1,72 @@
+import re
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+from .document_processor import best_practice_numbers
+
+
+BP_FILENAME = re.compile(r"^bp(\d+)_", re.IGNORECASE)
+
+
+class ImageIndex:
+    """
+    Selects reference images for an answer by embedding similarity.
+
+    Each image's Best Practice number, title and description are embedded
+    once with the retrieval model. A query is matched against them by cosine
+    similarity, with a boost for images of the Best Practices that appear in
+    the retrieved chunks.
+    """
+
+    def __init__(self, metadata: Dict[str, Dict], embed: Callable[[str], List[float]],
+                 min_score: float = 0.4, max_images: int = 3, bp_boost: float = 0.15):
+        """
+        Embed the image descriptions.
+
+        Args:
+            metadata: Image filename -> {"title", "description"}
+            embed: Function embedding one text, e.g. RAGService.embed_query
+            min_score: Minimum boosted similarity for an image to be selected
+            max_images: Maximum number of images returned
+            bp_boost: Added to the similarity of images whose Best Practice is
+                mentioned in the retrieved chunks
+        """
+        self.min_score = min_score
+        self.max_images = max_images
+        self.bp_boost = bp_boost
+        self.filenames = list(metadata)
+        self.best_practices = []
+        texts = []
+        for filename in self.filenames:
+            match = BP_FILENAME.match(filename)
+            bp = int(match.group(1)) if match else None
+            self.best_practices.append(bp)
+            prefix = f"Best Practice {bp}: " if bp is not None else ""
+            texts.append(f"{prefix}{metadata[filename].get('title', '')}. {metadata[filename].get('description', '')}")
+
+        vectors = np.asarray([embed(text) for text in texts], dtype=np.float32)
+        self.vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def select(self, query_embedding: List[float], context_texts: Iterable[str] = ()) -> List[str]:
+        """
+        Choose the images that illustrate an answer.
+
+        Args:
+            query_embedding: Embedding of the user query
+            context_texts: Retrieved chunks, used to boost their Best Practices
+
+        Returns:
+            Image filenames, best match first
+        """
+        if not self.filenames:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = self.vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+
+        mentioned = best_practice_numbers(context_texts)
+        if mentioned:
+            scores = scores + self.bp_boost * np.array([bp in mentioned for bp in self.best_practices], dtype=np.float32)
+
+        ranked = np.argsort(-scores)[:self.max_images]
+        return [self.filenames[i] for i in ranked if scores[i] >= self.min_score]
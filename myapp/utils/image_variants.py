@@ -0,0 +1,148 @@
+import os
+import io
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+
+MANIFEST_FILE = "manifest.json"
+
+# Thumbnail widths: the chat shows images 200px wide, 400px covers 2x screens
+VARIANT_WIDTHS = (200, 400)
+
+# Formats in order of preference, with their MIME type and Pillow save options
+VARIANT_FORMATS = {
+    "avif": ("image/avif", {"quality": 55}),
+    "webp": ("image/webp", {"quality": 80, "method": 6}),
+    "png": ("image/png", {"optimize": True}),
+}
+
+
+def _file_hash(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def load_manifest(output_dir: str) -> Dict:
+    """
+    Read the manifest written by build_variants().
+
+    Args:
+        output_dir: Directory of the variants
+
+    Returns:
+        Dict mapping each source filename to its size and variants, empty if
+        the variants have not been built
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _encode(image, fmt: str) -> bytes:
+    if fmt == "png":
+        image = image.convert("RGBA") if "A" in image.getbands() else image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **VARIANT_FORMATS[fmt][1])
+    return buffer.getvalue()
+
+
+def _build_image(source_path: str, output_dir: str, formats: List[str]) -> Dict:
+    from PIL import Image
+
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    with Image.open(source_path) as source:
+        source.load()
+        width, height = source.size
+        widths = [w for w in VARIANT_WIDTHS if w < width] + [width]
+
+        variants = {}
+        for fmt in formats:
+            variants[fmt] = []
+            for variant_width in widths:
+                variant_height = max(1, round(height * variant_width / width))
+                image = source if variant_width == width else source.resize((variant_width, variant_height), Image.LANCZOS)
+                data = _encode(image, fmt)
+                # Content-hashed names can be cached forever: a new image gets a new URL
+                filename = f"{stem}.{variant_width}w.{hashlib.sha256(data).hexdigest()[:12]}.{fmt}"
+                with open(os.path.join(output_dir, filename), "wb") as f:
+                    f.write(data)
+                variants[fmt].append({"file": filename, "width": variant_width, "height": variant_height, "bytes": len(data)})
+
+    return {"width": width, "height": height, "variants": variants}
+
+
+def build_variants(source_dir: str, output_dir: str, formats: Optional[List[str]] = None, force: bool = False) -> Dict:
+    """
+    Generate resized, re-encoded and content-hashed variants of every PNG.
+
+    Images whose content has not changed since the last build are skipped,
+    and variant files no longer referenced by the manifest are removed.
+
+    Args:
+        source_dir: Directory of the original PNG images
+        output_dir: Directory for the variants and their manifest
+        formats: Subset of VARIANT_FORMATS to generate. Defaults to all
+        force: Regenerate every image even if unchanged
+
+    Returns:
+        The new manifest
+    """
+    from PIL import features
+
+    formats = [fmt for fmt in (formats or VARIANT_FORMATS) if fmt == "png" or features.check(fmt)]
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_manifest(output_dir)
+
+    manifest = {}
+    for name in sorted(os.listdir(source_dir)):
+        source_path = os.path.join(source_dir, name)
+        if not name.lower().endswith(".png") or not os.path.isfile(source_path):
+            continue
+        source_hash = _file_hash(source_path)
+        entry = previous.get(name)
+        if (not force and entry is not None and entry.get("source_hash") == source_hash
+                and sorted(entry["variants"]) == sorted(formats)
+                and all(os.path.exists(os.path.join(output_dir, v["file"])) for vs in entry["variants"].values() for v in vs)):
+            manifest[name] = entry
+            continue
+        manifest[name] = {"source_hash": source_hash, **_build_image(source_path, output_dir, formats)}
+
+    with open(os.path.join(output_dir, MANIFEST_FILE + ".tmp"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(output_dir, MANIFEST_FILE + ".tmp"), os.path.join(output_dir, MANIFEST_FILE))
+
+    referenced = {v["file"] for entry in manifest.values() for vs in entry["variants"].values() for v in vs}
+    for name in os.listdir(output_dir):
+        if name != MANIFEST_FILE and name not in referenced:
+            os.remove(os.path.join(output_dir, name))
+    return manifest
+
+
+def responsive_sources(entry: Dict, url_for) -> Dict:
+    """
+    srcset attributes for an image's variants.
+
+    Args:
+        entry: Manifest entry of the image
+        url_for: Maps a variant filename to its URL
+
+    Returns:
+        Dict with "sources" (a list of {"type", "srcset"} for the modern
+        formats, most efficient first) and "srcset" for the PNG fallback
+    """
+    def srcset(variants):
+        return ", ".join(f"{url_for(v['file'])} {v['width']}w" for v in variants)
+
+    sources = [
+        {"type": VARIANT_FORMATS[fmt][0], "srcset": srcset(entry["variants"][fmt])}
+        for fmt in VARIANT_FORMATS if fmt != "png" and entry["variants"].get(fmt)
+    ]
+    return {"sources": sources, "srcset": srcset(entry["variants"].get("png", []))}
@@ -0,0 +1,345 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+INDEX_TYPES = ("flat", "ivf_sq8", "ivf_pq", "hnsw_sq8")
+
+
+class CompactFaissStore:
+    """
+    FAISS vector store with a trained index and an on-disk SQLite docstore.
+
+    Unlike the LangChain FAISS store, the index is written with
+    ``faiss.write_index`` and read back memory-mapped, so several processes
+    share the same pages, and documents are kept in SQLite instead of a
+    pickled docstore. Supported index types:
+
+    - ``flat``: exact search, no training
+    - ``ivf_sq8``: inverted lists with 8-bit scalar quantization
+    - ``ivf_pq``: inverted lists with product quantization
+    - ``hnsw_sq8``: HNSW graph with 8-bit scalar quantization (no deletions)
+
+    Trained index types buffer vectors until ``train_size`` are available,
+    train on them and then add vectors directly.
+    """
+
+    INDEX_FILE = "index.faiss"
+    DOCSTORE_FILE = "docstore.sqlite3"
+
+    def __init__(self, embeddings: Embeddings, path: str, index_type: str = "ivf_sq8",
+                 nprobe: int = 16, train_size: int = 20000, index: faiss.Index = None):
+        """
+        Initialize an empty store, or wrap an index read by load_local.
+
+        Args:
+            embeddings: Embedding model used for the stored vectors
+            path: Directory holding the index and docstore files
+            index_type: One of INDEX_TYPES
+            nprobe: Inverted lists (IVF) or graph candidates (HNSW) visited per search
+            train_size: Number of vectors collected before training the index
+            index: Existing FAISS index, used when loading from disk
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}. Expected one of {INDEX_TYPES}")
+
+        self.embeddings = embeddings
+        self.path = path
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.index = index
+        self._read_only = False
+        self._pending = []
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, self.DOCSTORE_FILE), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                faiss_id INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+        if index is None and self._conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+            # Readers may still use the index saved here; build new stores in an empty directory
+            self._conn.close()
+            raise ValueError(f"{path} already holds a docstore; create new stores in an empty directory")
+        self._next_id = (self._conn.execute("SELECT MAX(faiss_id) FROM chunks").fetchone()[0] or -1) + 1
+        self._apply_search_params()
+
+    @classmethod
+    def load_local(cls, path: str, embeddings: Embeddings, index_type: str, nprobe: int = 16, mmap: bool = True) -> "CompactFaissStore":
+        """
+        Load a store saved with save_local.
+
+        Args:
+            path: Directory holding the index and docstore files
+            embeddings: Embedding model used for the stored vectors
+            index_type: Index type the store was built with
+            nprobe: Inverted lists (IVF) or graph candidates (HNSW) visited per search
+            mmap: Memory-map the index read-only instead of reading it into RAM
+
+        Returns:
+            Loaded CompactFaissStore
+        """
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(os.path.join(path, cls.INDEX_FILE), flags)
+        store = cls(embeddings, path, index_type=index_type, nprobe=nprobe, index=index)
+        store._read_only = mmap
+        return store
+
+    @property
+    def supports_delete(self) -> bool:
+        """Whether delete() can remove vectors (HNSW graphs cannot)."""
+        return self.index_type != "hnsw_sq8"
+
+    def close(self):
+        """Release the index and close the docstore connection."""
+        with self._lock:
+            self.index = None
+            self._pending = []
+            self._conn.close()
+
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]],
+                       metadatas: List[Dict] = None, ids: List[str] = None) -> List[str]:
+        """
+        Add precomputed embeddings and their documents.
+
+        Args:
+            text_embeddings: Pairs of (text, embedding)
+            metadatas: Metadata of each document
+            ids: Stable document ID of each document
+
+        Returns:
+            Document IDs that were added
+        """
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        texts, vectors = zip(*text_embeddings)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(self._next_id + i) for i in range(len(texts))]
+
+        with self._lock:
+            if self.index is not None and self.index.is_trained:
+                self._writable_index()
+            faiss_ids = np.arange(self._next_id, self._next_id + len(texts), dtype=np.int64)
+            self._next_id += len(texts)
+
+            self._conn.executemany(
+                "INSERT INTO chunks (faiss_id, doc_id, page_content, metadata) VALUES (?, ?, ?, ?)",
+                [(int(fid), doc_id, text, json.dumps(metadata, ensure_ascii=False))
+                 for fid, doc_id, text, metadata in zip(faiss_ids, ids, texts, metadatas)]
+            )
+            self._conn.commit()
+
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if self.index is not None and self.index.is_trained:
+                self.index.add_with_ids(vectors, faiss_ids)
+            else:
+                self._pending.append((vectors, faiss_ids))
+                if sum(len(v) for v, _ in self._pending) >= self.train_size:
+                    self._train()
+        return list(ids)
+
+    def delete(self, ids: List[str]) -> bool:
+        """
+        Delete documents by their stable ID.
+
+        Args:
+            ids: Document IDs to delete
+
+        Returns:
+            True once the documents were removed
+        """
+        with self._lock:
+            self._train()
+            index = self._writable_index()
+            placeholders = ",".join("?" * len(ids))
+            rows = self._conn.execute(f"SELECT faiss_id FROM chunks WHERE doc_id IN ({placeholders})", ids).fetchall()
+            if len(rows) != len(ids):
+                raise ValueError("Some specified ids do not exist in the current store")
+
+            # HNSW indexes cannot remove vectors (see supports_delete)
+            index.remove_ids(np.array([row[0] for row in rows], dtype=np.int64))
+            self._conn.execute(f"DELETE FROM chunks WHERE doc_id IN ({placeholders})", ids)
+            self._conn.commit()
+        return True
+
+    def save_local(self, path: str = None):
+        """
+        Write the index next to the docstore, training it first if needed.
+
+        Args:
+            path: Must be the directory the store was created in
+        """
+        if path is not None and os.path.abspath(path) != os.path.abspath(self.path):
+            raise ValueError("CompactFaissStore can only be saved to the directory it was created in")
+
+        with self._lock:
+            self._train()
+            index_path = os.path.join(self.path, self.INDEX_FILE)
+            faiss.write_index(self.index, index_path + ".tmp")
+            os.replace(index_path + ".tmp", index_path)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter: Dict = None,
+                                               fetch_k: int = 20, **kwargs) -> List[Tuple[Document, float]]:
+        """
+        Return the k nearest documents and their L2 distances.
+
+        Args:
+            embedding: Query embedding
+            k: Number of documents to return
+            filter: Metadata values the documents must have, as in LangChain's FAISS
+            fetch_k: Candidates searched before filtering, when a filter is given
+
+        Returns:
+            List of (document, distance) tuples, closest first
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return []
+
+        search_k = max(k, fetch_k) if filter else k
+        distances, faiss_ids = self.index.search(np.asarray([embedding], dtype=np.float32), search_k)
+        found = [(int(fid), float(dist)) for fid, dist in zip(faiss_ids[0], distances[0]) if fid != -1]
+        documents = self._get_documents([fid for fid, _ in found])
+        results = [(documents[fid], dist) for fid, dist in found if fid in documents]
+        if filter:
+            results = [(doc, dist) for doc, dist in results
+                       if all(doc.metadata.get(key) == value for key, value in filter.items())]
+        return results[:k]
+
+    def similarity_search_with_score_by_vectors(self, embeddings: List[List[float]], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """
+        Search several queries with a single FAISS call.
+
+        Args:
+            embeddings: Query embeddings
+            k: Number of documents to return per query
+
+        Returns:
+            One list of (document, distance) tuples per query, closest first
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return [[] for _ in embeddings]
+
+        distances, faiss_ids = self.index.search(np.asarray(embeddings, dtype=np.float32), k)
+        documents = self._get_documents(sorted({int(fid) for fid in faiss_ids.ravel() if fid != -1}))
+        return [
+            [(documents[int(fid)], float(dist)) for fid, dist in zip(row_ids, row_distances) if int(fid) in documents]
+            for row_ids, row_distances in zip(faiss_ids, distances)
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        """
+        Return the k nearest documents.
+
+        Args:
+            embedding: Query embedding
+            k: Number of documents to return
+
+        Returns:
+            List of documents, closest first
+        """
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        """
+        Return documents by their stable ID, skipping unknown IDs.
+
+        Args:
+            ids: Document IDs to look up
+
+        Returns:
+            Documents in the order of ``ids``
+        """
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = self._conn.execute(
+            f"SELECT doc_id, page_content, metadata FROM chunks WHERE doc_id IN ({placeholders})", list(ids)
+        ).fetchall()
+        documents = {
+            doc_id: Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+            for doc_id, content, metadata in rows
+        }
+        return [documents[doc_id] for doc_id in ids if doc_id in documents]
+
+    def _get_documents(self, faiss_ids: List[int]) -> Dict[int, Document]:
+        if not faiss_ids:
+            return {}
+        placeholders = ",".join("?" * len(faiss_ids))
+        rows = self._conn.execute(
+            f"SELECT faiss_id, doc_id, page_content, metadata FROM chunks WHERE faiss_id IN ({placeholders})",
+            faiss_ids
+        ).fetchall()
+        return {
+            fid: Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+            for fid, doc_id, content, metadata in rows
+        }
+
+    def _train(self):
+        """Create and train the index from the buffered vectors, then add them."""
+        if self.index is not None and self.index.is_trained:
+            return
+        if not self._pending:
+            if self.index is None:
+                raise ValueError("Cannot build an index without vectors")
+            return
+
+        vectors = np.vstack([v for v, _ in self._pending])
+        faiss_ids = np.concatenate([i for _, i in self._pending])
+        self._pending = []
+
+        self.index = faiss.index_factory(vectors.shape[1], self._factory_string(len(vectors), vectors.shape[1]))
+        print(f"Training {self.index_type} FAISS index on {len(vectors)} vectors...")
+        self.index.train(vectors)
+        self.index.add_with_ids(vectors, faiss_ids)
+        self._apply_search_params()
+
+    def _factory_string(self, n: int, dimension: int) -> str:
+        # k-means trains well with ~39 points per centroid (FAISS warns below that)
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        if self.index_type == "ivf_pq" and nlist >= 8:
+            if n >= 39 * 256:
+                m = next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dimension % m == 0)
+                return f"IVF{nlist},PQ{m}x8"
+            print(f"Too few vectors ({n}) to train product quantizers; using scalar quantization")
+            return f"IVF{nlist},SQ8"
+        if self.index_type == "ivf_sq8" and nlist >= 8:
+            return f"IVF{nlist},SQ8"
+        if self.index_type == "hnsw_sq8":
+            return "IDMap,HNSW32,SQ8"
+        if self.index_type != "flat":
+            print(f"Too few vectors ({n}) to train a {self.index_type} index; using exact search")
+        return "IDMap,Flat"
+
+    def _writable_index(self) -> faiss.Index:
+        # Memory-mapped indexes are read-only: load a private copy before modifying
+        if self._read_only:
+            self.index = faiss.read_index(os.path.join(self.path, self.INDEX_FILE))
+            self._apply_search_params()
+            self._read_only = False
+        return self.index
+
+    def _apply_search_params(self):
+        if self.index is None:
+            return
+        try:
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+        except RuntimeError:
+            pass
+        hnsw = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexIDMap) else None
+        if hnsw is not None and hasattr(hnsw, "hnsw"):
+            hnsw.hnsw.efSearch = 4 * self.nprobe
@@ -0,0 +1,171 @@
+import os
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .chunking import load_source, split_documents
+from .embeddings import OnnxEmbeddings
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's contents, used to detect changed documents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_file_chunks(pdf_file: str, chunk_size: int, chunk_overlap: int,
+                     chunker: str = "recursive") -> Tuple[str, List[Document], Optional[Dict]]:
+    """
+    Load and split one PDF or DOCX, assigning a stable ID to each chunk.
+
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Args:
+        pdf_file: Path to the PDF or DOCX file
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        chunker: "recursive" or "sections" (see chunking.split_documents)
+
+    Returns:
+        Tuple of (pdf_file, chunks, manifest entry). The entry is None when
+        the file could not be loaded.
+    """
+    name = os.path.basename(pdf_file)
+    try:
+        sha256 = file_hash(pdf_file)
+        documents = load_source(pdf_file)
+        print(f"Loaded {len(documents)} pages from {name}")
+    except Exception as e:
+        print(f"Error loading {pdf_file}: {str(e)}")
+        return pdf_file, [], None
+
+    chunks = split_documents(documents, chunker, chunk_size, chunk_overlap)
+    ids = [f"{name}:{sha256[:16]}:{i}" for i in range(len(chunks))]
+    for chunk, chunk_id in zip(chunks, ids):
+        chunk.id = chunk_id
+    return pdf_file, chunks, {"sha256": sha256, "ids": ids}
+
+
+class IngestionPipeline:
+    """
+    Streaming PDF ingestion: parse in a process pool, embed in batches, add in bulk.
+
+    PDFs are parsed and split by worker processes while the main process
+    embeds the chunks already available, so parsing overlaps embedding. Only
+    a bounded number of parsed files and one batch of vectors are held in
+    memory at a time.
+    """
+
+    def __init__(self, embeddings: Embeddings, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 batch_size: int = 64, workers: int = None, torch_threads: int = None, chunker: str = "recursive"):
+        """
+        Initialize the ingestion pipeline.
+
+        Args:
+            embeddings: Embedding model used for the chunks
+            chunk_size: Size of text chunks for splitting
+            chunk_overlap: Overlap between chunks
+            batch_size: Number of chunks embedded per forward pass
+            workers: Number of PDF parsing processes. Defaults to the CPU count
+            torch_threads: Threads used by torch for embedding. Defaults to torch's own setting
+            chunker: "recursive" or "sections" (see chunking.split_documents)
+        """
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.torch_threads = torch_threads
+        self.chunker = chunker
+
+    def iter_chunks(self, pdf_files: List[str], on_file: Callable[[str, Optional[Dict]], None] = None) -> Iterator[Document]:
+        """
+        Parse PDFs in parallel and yield their chunks as each file completes.
+
+        Args:
+            pdf_files: Paths of the PDFs to ingest
+            on_file: Called with (pdf_file, manifest entry) in the calling
+                process before the file's chunks are yielded
+
+        Yields:
+            Chunks with their stable ID set
+        """
+        if not pdf_files:
+            return
+
+        pending_files = list(pdf_files)
+        max_in_flight = self.workers * 2
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(pdf_files))) as executor:
+            in_flight = set()
+            while pending_files or in_flight:
+                while pending_files and len(in_flight) < max_in_flight:
+                    in_flight.add(executor.submit(load_file_chunks, pending_files.pop(0), self.chunk_size, self.chunk_overlap, self.chunker))
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_file, chunks, entry = future.result()
+                    if on_file is not None:
+                        on_file(pdf_file, entry)
+                    yield from chunks
+
+    def iter_batches(self, chunks: Iterable[Document]) -> Iterator[Tuple[List[Document], List[List[float]]]]:
+        """
+        Group chunks into batches and embed each batch in one pass.
+
+        Args:
+            chunks: Chunks to embed
+
+        Yields:
+            Tuple of (batch of chunks, their embeddings)
+        """
+        # ONNX embeddings take their thread count when the session is created
+        if self.torch_threads and not isinstance(self.embeddings, OnnxEmbeddings):
+            import torch
+            torch.set_num_threads(self.torch_threads)
+
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= self.batch_size:
+                yield batch, self.embeddings.embed_documents([doc.page_content for doc in batch])
+                batch = []
+        if batch:
+            yield batch, self.embeddings.embed_documents([doc.page_content for doc in batch])
+
+    def run(self, pdf_files: List[str], vector_store: FAISS = None,
+            on_file: Callable[[str, Optional[Dict]], None] = None,
+            on_batch: Callable[[List[Document]], None] = None) -> Tuple[Optional[FAISS], int]:
+        """
+        Ingest PDFs into a FAISS vector store.
+
+        Args:
+            pdf_files: Paths of the PDFs to ingest
+            vector_store: Existing store to add to. A new one is created if omitted
+            on_file: Called with (pdf_file, manifest entry) as each file is parsed
+            on_batch: Called with each batch of chunks once it has been indexed
+
+        Returns:
+            Tuple of (vector store, number of chunks added). The store is None
+            when no store was given and no chunks were produced.
+        """
+        total = 0
+        for batch, vectors in self.iter_batches(self.iter_chunks(pdf_files, on_file)):
+            text_embeddings = [(doc.page_content, vector) for doc, vector in zip(batch, vectors)]
+            metadatas = [doc.metadata for doc in batch]
+            ids = [doc.id for doc in batch]
+            if vector_store is None:
+                vector_store = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+            else:
+                vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            if on_batch is not None:
+                on_batch(batch)
+            total += len(batch)
+            print(f"Indexed {total} chunks")
+        return vector_store, total
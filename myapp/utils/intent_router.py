@@ -0,0 +1,191 @@
+import os
+import re
+import json
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .chunking import split_sections
+from .document_processor import BP_TITLE, section_for_query
+
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def _matrix(rows) -> np.ndarray:
+    return _unit(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+
+def section_texts(documents: List[Document], chunk_size: int = 1000) -> Dict[str, List[str]]:
+    """
+    Texts describing each Best Practice section of the documents.
+
+    Args:
+        documents: Documents returned by RAGService.load_documents()
+        chunk_size: Maximum size of each section piece
+
+    Returns:
+        Dict mapping each section id ("BP3") to its title and chunks
+    """
+    sections = {}
+    for chunk in split_sections(documents, chunk_size):
+        section = chunk.metadata.get("section")
+        if section is None:
+            continue
+        texts = sections.setdefault(section, [])
+        for line in chunk.page_content.splitlines():
+            title = BP_TITLE.match(line.strip())
+            if title:
+                texts.append(title.group(1).strip())
+        texts.append(chunk.page_content)
+    return sections
+
+
+def build_intent_centroids(embed: Callable[[str], List[float]], intents: Dict[str, Dict],
+                           sections: Dict[str, List[str]], index_version: str = None) -> Dict:
+    """
+    Compute the centroid of every intent.
+
+    Args:
+        embed: Function embedding one text, e.g. RAGService.embed_query
+        intents: Canned intents, {"name": {"response", "examples", "threshold"?}}
+        sections: Best Practice section texts, as returned by section_texts()
+        index_version: Version of the index the sections were read from
+
+    Returns:
+        JSON-serializable dict with the canned intents (response, threshold and
+        centroid) and the section centroids
+    """
+    def centroid(texts):
+        return _unit(_unit([embed(text) for text in texts]).mean(axis=0)).tolist()
+
+    return {
+        "index_version": index_version,
+        "intents": {
+            name: {
+                "response": intent["response"],
+                "threshold": intent.get("threshold"),
+                "centroid": centroid(intent["examples"]),
+            }
+            for name, intent in intents.items() if intent.get("examples")
+        },
+        "sections": {section: centroid(texts) for section, texts in sections.items() if texts},
+    }
+
+
+def save_intent_centroids(path: str, centroids: Dict):
+    """Write centroids computed by build_intent_centroids() atomically."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(centroids, f)
+    os.replace(path + ".tmp", path)
+
+
+def load_intent_centroids(path: str) -> Optional[Dict]:
+    """Read the centroids saved by save_intent_centroids(), or None if they have not been built."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class IntentRouter:
+    """
+    Classifies a question before retrieval by similarity to intent centroids.
+
+    Canned intents (greetings, thanks, out-of-scope questions) are answered
+    with a fixed response, skipping retrieval and the LLM. Other questions are
+    in scope, and when one Best Practice section is clearly the closest its
+    id is returned so retrieval can be limited to it. Each centroid is the
+    normalized mean embedding of its examples, computed offline, so routing
+    costs one small matrix product on the query embedding already computed
+    for retrieval.
+    """
+
+    def __init__(self, centroids: Dict, threshold: float = 0.6, margin: float = 0.05,
+                 section_threshold: float = 0.5, section_margin: float = 0.03, max_canned_words: int = 8):
+        """
+        Initialize the router.
+
+        Args:
+            centroids: Centroids computed by build_intent_centroids()
+            threshold: Minimum cosine similarity to a canned intent, unless the
+                intent sets its own
+            margin: How much closer the question must be to the canned intent
+                than to the closest Best Practice section
+            section_threshold: Minimum cosine similarity to route to a section
+            section_margin: How much closer the closest section must be than
+                the second one
+            max_canned_words: Longer messages are never greetings or thanks
+                (a greeting followed by a real question must be answered)
+        """
+        self.threshold = threshold
+        self.margin = margin
+        self.section_threshold = section_threshold
+        self.section_margin = section_margin
+        self.max_canned_words = max_canned_words
+
+        intents = centroids.get("intents", {})
+        self.intents = list(intents)
+        self.responses = [intents[name]["response"] for name in self.intents]
+        self.thresholds = np.array([
+            intents[name].get("threshold") or threshold for name in self.intents
+        ], dtype=np.float32)
+        self.sections = list(centroids.get("sections", {}))
+        self.intent_vectors = _matrix([intents[name]["centroid"] for name in self.intents])
+        self.section_vectors = _matrix([centroids["sections"][section] for section in self.sections])
+        self.index_version = centroids.get("index_version")
+
+    @property
+    def dimension(self) -> Optional[int]:
+        for vectors in (self.intent_vectors, self.section_vectors):
+            if vectors.size:
+                return vectors.shape[1]
+        return None
+
+    def classify(self, query: str, query_embedding: Iterable[float]) -> Dict:
+        """
+        Route a question.
+
+        Args:
+            query: User question
+            query_embedding: Embedding of the question
+
+        Returns:
+            Dict with "intent" (a canned intent, "best_practice" when a section
+            was chosen, or "in_scope"), its similarity "score", the canned
+            "response" (None unless the intent is canned) and the "section"
+            to search (None for every section)
+        """
+        query_vector = _unit(query_embedding)
+        if query_vector.shape[0] != self.dimension:
+            return {"intent": "in_scope", "score": 0.0, "response": None, "section": None}
+
+        # A question naming a Best Practice is in scope whatever it resembles
+        explicit = section_for_query(query)
+        if explicit is not None:
+            return {"intent": "best_practice", "score": 1.0, "response": None, "section": explicit}
+
+        section_scores = self.section_vectors @ query_vector if self.sections else np.zeros(0, dtype=np.float32)
+        best_section = float(section_scores.max()) if self.sections else -1.0
+
+        if self.intents:
+            intent_scores = self.intent_vectors @ query_vector
+            i = int(np.argmax(intent_scores))
+            score = float(intent_scores[i])
+            short = len(re.findall(r"\w+", query)) <= self.max_canned_words
+            if (score >= self.thresholds[i] and score - best_section >= self.margin
+                    and (short or self.intents[i] == "out_of_scope")):
+                return {"intent": self.intents[i], "score": score, "response": self.responses[i], "section": None}
+
+        if self.sections:
+            ranked = np.argsort(-section_scores)
+            runner_up = float(section_scores[ranked[1]]) if len(ranked) > 1 else -1.0
+            if best_section >= self.section_threshold and best_section - runner_up >= self.section_margin:
+                return {"intent": "best_practice", "score": best_section, "response": None,
+                        "section": self.sections[ranked[0]]}
+        return {"intent": "in_scope", "score": best_section, "response": None, "section": None}
@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+
+TOKEN_PATTERN = re.compile(r"\d+(?:[.,]\d+)?|[a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase, accent-free terms and numbers.
+
+    Numbers keep their decimal part ("1.5", "100") so millimetre values and
+    Best Practice numbers are matched exactly.
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    return TOKEN_PATTERN.findall(normalized)
+
+
+class BM25Index:
+    """
+    Inverted BM25 index over the same chunks as the FAISS index.
+
+    Stores only document IDs and term frequencies; documents themselves are
+    resolved through the vector store.
+    """
+
+    FILE_NAME = "bm25.json"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialize an empty BM25 index.
+
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+
+    def add_documents(self, documents: List[Document]):
+        """
+        Index chunks by their stable ID.
+
+        Args:
+            documents: Chunks with their ``id`` set
+        """
+        for doc in documents:
+            terms = tokenize(doc.page_content)
+            self.doc_lengths[doc.id] = len(terms)
+            for term, count in Counter(terms).items():
+                self.postings.setdefault(term, {})[doc.id] = count
+
+    def delete(self, ids: List[str]):
+        """
+        Remove chunks from the index.
+
+        Args:
+            ids: Stable IDs of the chunks to remove
+        """
+        removed = set(ids)
+        for doc_id in removed:
+            self.doc_lengths.pop(doc_id, None)
+        for term in list(self.postings):
+            plist = self.postings[term]
+            for doc_id in removed.intersection(plist):
+                del plist[doc_id]
+            if not plist:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """
+        Rank chunks by BM25 score for a query.
+
+        Args:
+            query: User query
+            k: Number of chunk IDs to return
+
+        Returns:
+            List of (chunk ID, score) tuples, best first
+        """
+        n_docs = len(self.doc_lengths)
+        if n_docs == 0:
+            return []
+        avg_length = sum(self.doc_lengths.values()) / n_docs
+
+        scores = Counter()
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, tf in plist.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def save(self, directory: str):
+        """Write the index to ``directory/bm25.json``."""
+        path = os.path.join(directory, self.FILE_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "doc_lengths": self.doc_lengths, "postings": self.postings}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        """Read an index written by save()."""
+        with open(os.path.join(directory, cls.FILE_NAME), encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = data["postings"]
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings of the same IDs with reciprocal rank fusion.
+
+    Args:
+        rankings: Lists of IDs, each ordered best first
+        k: RRF damping constant
+
+    Returns:
+        List of (ID, fused score) tuples, best first
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return scores.most_common()
@@ -0,0 +1,296 @@
+import asyncio
+import random
+import weakref
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import aiohttp
+from huggingface_hub import AsyncInferenceClient
+from huggingface_hub.errors import InferenceTimeoutError
+
+
+# Collects the sessions a streaming call opens, so it can close exactly those
+_owned_sessions: ContextVar[Optional[list]] = ContextVar("owned_sessions", default=None)
+
+
+class PooledAsyncInferenceClient(AsyncInferenceClient):
+    """
+    AsyncInferenceClient whose sessions share one keep-alive connector per event loop.
+
+    The stock client opens a new aiohttp session, and with it a new connection
+    pool, for every call. Sharing the connector lets calls reuse TCP/TLS
+    connections to the provider.
+    """
+
+    def __init__(self, *args, connection_limit: int = 100, keepalive_timeout: float = 60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self._connectors = weakref.WeakKeyDictionary()
+
+    def _get_connector(self) -> aiohttp.TCPConnector:
+        # Connectors are bound to the loop they were created on
+        loop = asyncio.get_running_loop()
+        connector = self._connectors.get(loop)
+        if connector is None or connector.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=self.keepalive_timeout)
+            self._connectors[loop] = connector
+        return connector
+
+    def _get_client_session(self, headers: Optional[Dict] = None) -> aiohttp.ClientSession:
+        # Mirrors AsyncInferenceClient._get_client_session, adding the shared connector
+        client_headers = self.headers.copy()
+        if headers is not None:
+            client_headers.update(headers)
+
+        session = aiohttp.ClientSession(
+            headers=client_headers,
+            cookies=self.cookies,
+            timeout=aiohttp.ClientTimeout(self.timeout),
+            trust_env=self.trust_env,
+            connector=self._get_connector(),
+            connector_owner=False,
+        )
+        self._sessions[session] = set()
+        owned = _owned_sessions.get()
+        if owned is not None:
+            owned.append(session)
+
+        session._wrapped_request = session._request
+
+        async def _request(method, url, **kwargs):
+            response = await session._wrapped_request(method, url, **kwargs)
+            self._sessions[session].add(response)
+            return response
+
+        session._request = _request
+        session._close = session.close
+
+        async def close_session():
+            for response in self._sessions[session]:
+                # Release instead of close so the connection goes back to the pool
+                response.release()
+            await session._close()
+            self._sessions.pop(session, None)
+
+        session.close = close_session
+        return session
+
+    async def close_sessions(self, sessions: List[aiohttp.ClientSession]):
+        """
+        Close the given sessions, returning their connections to the pool.
+
+        Streaming calls stop reading at the [DONE] event and never close their
+        session, which would otherwise accumulate in a long-lived client.
+        """
+        for session in sessions:
+            if session in self._sessions:
+                await session.close()
+
+
+class LLMClient:
+    """
+    Process-wide chat completion client with bounded concurrency, timeouts and retries.
+
+    Transient failures (timeouts, connection errors, 429 and 5xx responses)
+    are retried with exponential backoff and jitter. Streaming calls are only
+    retried until the first chunk has been received. A response_format the
+    provider rejects is dropped for that call, and for later ones once it
+    has been rejected several times in a row.
+    """
+
+    RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+    # Statuses with which providers reject an unsupported response_format
+    FORMAT_REJECTED_STATUS = {400, 422}
+    # Consecutive rejections after which response_format is no longer sent
+    FORMAT_REJECTIONS_TO_DISABLE = 3
+
+    def __init__(self, api_key: str, model: str, provider: str = "nebius", base_url: str = None,
+                 timeout: float = 60, max_concurrency: int = 32, max_retries: int = 2, backoff: float = 0.5):
+        """
+        Initialize the LLM client.
+
+        Args:
+            api_key: HuggingFace API token
+            model: Model used for chat completions
+            provider: Inference provider. Ignored when base_url is set
+            base_url: OpenAI-compatible endpoint to call instead of the provider
+            timeout: Seconds allowed per attempt (until the first chunk when streaming)
+            max_concurrency: Maximum simultaneous requests per event loop
+            max_retries: Retries after the first failed attempt
+            backoff: Base delay in seconds for exponential backoff
+        """
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = PooledAsyncInferenceClient(
+            provider=None if base_url else provider,
+            base_url=base_url,
+            api_key=api_key,
+            timeout=timeout,
+        )
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.response_format_supported = True
+        self._format_rejections = 0
+
+    async def chat(self, messages: List[Dict], **params) -> Any:
+        """
+        Create a chat completion.
+
+        Args:
+            messages: Chat messages
+            **params: Extra completion parameters (max_tokens, temperature,
+                response_format, ...)
+
+        Returns:
+            ChatCompletionOutput from huggingface_hub
+        """
+        params = self._supported_params(params)
+        async with self._semaphore():
+            attempt = 0
+            while True:
+                sessions = []
+                token = _owned_sessions.set(sessions)
+                try:
+                    request = asyncio.ensure_future(
+                        self.client.chat.completions.create(model=self.model, messages=messages, **params)
+                    )
+                finally:
+                    _owned_sessions.reset(token)
+                try:
+                    response = await asyncio.wait_for(request, self.timeout)
+                    self._format_accepted(params)
+                    return response
+                except asyncio.CancelledError:
+                    # Cancelled mid-request (e.g. by a hedged request) the client leaves its session open
+                    await self.client.close_sessions(sessions)
+                    raise
+                except Exception as e:
+                    await self.client.close_sessions(sessions)
+                    if self._drop_rejected_format(e, params):
+                        continue
+                    if attempt == self.max_retries or not self.is_retryable(e):
+                        raise
+                    await self._sleep_before_retry(attempt, e)
+                    attempt += 1
+
+    async def chat_stream(self, messages: List[Dict], **params) -> AsyncIterator[Any]:
+        """
+        Create a streaming chat completion.
+
+        Args:
+            messages: Chat messages
+            **params: Extra completion parameters (max_tokens, temperature,
+                response_format, ...)
+
+        Yields:
+            ChatCompletionStreamOutput chunks as they arrive
+        """
+        params = self._supported_params(params)
+        async with self._semaphore():
+            attempt = 0
+            while True:
+                stream = None
+                sessions = []
+                # The task copies the context, so sessions it opens are recorded in this call's list
+                token = _owned_sessions.set(sessions)
+                try:
+                    request = asyncio.ensure_future(
+                        self.client.chat.completions.create(model=self.model, messages=messages, stream=True, **params)
+                    )
+                finally:
+                    _owned_sessions.reset(token)
+                try:
+                    stream = await asyncio.wait_for(request, self.timeout)
+                    first_chunk = await asyncio.wait_for(anext(stream), self.timeout)
+                    self._format_accepted(params)
+                    break
+                except StopAsyncIteration:
+                    await self.client.close_sessions(sessions)
+                    return
+                except asyncio.CancelledError:
+                    # E.g. a hedged request to another backend answered first
+                    if stream is not None:
+                        await stream.aclose()
+                    await self.client.close_sessions(sessions)
+                    raise
+                except Exception as e:
+                    if stream is not None:
+                        await stream.aclose()
+                    await self.client.close_sessions(sessions)
+                    if self._drop_rejected_format(e, params):
+                        continue
+                    if attempt == self.max_retries or not self.is_retryable(e):
+                        raise
+                    await self._sleep_before_retry(attempt, e)
+                    attempt += 1
+
+            try:
+                yield first_chunk
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+                await self.client.close_sessions(sessions)
+
+    async def close(self):
+        """Close open sessions and the connector of the current event loop."""
+        await self.client.close()
+        connector = self.client._connectors.pop(asyncio.get_running_loop(), None)
+        if connector is not None:
+            await connector.close()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def _supported_params(self, params: Dict) -> Dict:
+        params = dict(params)
+        if params.get("response_format") is None or not self.response_format_supported:
+            params.pop("response_format", None)
+        return params
+
+    def _drop_rejected_format(self, error: Exception, params: Dict) -> bool:
+        """
+        Remove response_format from params if the provider rejected the request over it.
+
+        Only errors whose body mentions the response format count, so that
+        e.g. a prompt that is too long is not retried without it.
+        """
+        if ("response_format" not in params or not isinstance(error, aiohttp.ClientResponseError)
+                or error.status not in self.FORMAT_REJECTED_STATUS):
+            return False
+        details = f"{getattr(error, 'response_error_payload', None) or ''} {error.message}".lower()
+        if "response_format" not in details and "json" not in details:
+            return False
+        del params["response_format"]
+        self._format_rejections += 1
+        if self._format_rejections >= self.FORMAT_REJECTIONS_TO_DISABLE:
+            self.response_format_supported = False
+            print(f"LLM provider rejected response_format {self._format_rejections} times in a row; no longer sending it")
+        else:
+            print(f"LLM provider rejected the request with response_format ({error.status}); retrying without it")
+        return True
+
+    def _format_accepted(self, params: Dict):
+        if "response_format" in params:
+            self._format_rejections = 0
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether an error is transient (timeout, connection error, 429 or 5xx)."""
+        if isinstance(error, (asyncio.TimeoutError, InferenceTimeoutError, aiohttp.ClientConnectionError)):
+            return True
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.RETRYABLE_STATUS
+        return False
+
+    async def _sleep_before_retry(self, attempt: int, error: Exception):
+        delay = self.backoff * (2 ** attempt) * (1 + random.random())
+        print(f"LLM request failed ({type(error).__name__}: {error}); retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
@@ -0,0 +1,323 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+from .llm_client import LLMClient
+
+
+class LatencyTracker:
+    """Percentiles of a backend's recent latencies."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Initialize the tracker.
+
+        Args:
+            window: Number of recent latencies considered
+            min_samples: Latencies observed before percentile() returns a value
+        """
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """The given percentile of the recent latencies, or None until min_samples were observed."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a backend after consecutive failures.
+
+    After failure_threshold failures in a row the circuit opens and the
+    backend is skipped for cooldown seconds. Then one probe request is let
+    through: if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize a closed circuit.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            cooldown: Seconds the circuit stays open before a probe
+            clock: Monotonic time source
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """"closed", "open" or "half_open" (cooldown elapsed, waiting for a probe)."""
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self.clock() - self._opened_at >= self.cooldown else "open"
+
+    def available(self) -> bool:
+        """Whether allow() would currently let a request through."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def allow(self) -> bool:
+        """Let a request through, marking it as the probe when the circuit is half-open."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """Count a failure. Returns True if it opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            was_open = self._opened_at is not None
+            if self._probing or self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._probing = False
+            return self._opened_at is not None and not was_open
+
+    def release(self):
+        """End a request that neither succeeded nor failed (e.g. cancelled by the caller)."""
+        with self._lock:
+            self._probing = False
+
+
+class LLMBackend:
+    """One provider/model endpoint with its latency statistics and circuit breaker."""
+
+    def __init__(self, name: str, client: LLMClient, breaker: CircuitBreaker = None,
+                 window: int = 200, min_samples: int = 20):
+        """
+        Initialize the backend.
+
+        Args:
+            name: Label used in metrics and logs
+            client: Client calling the endpoint. Build it with max_retries=0:
+                the dispatcher fails over to the next backend instead
+            breaker: Circuit breaker. Defaults to CircuitBreaker()
+            window: Recent latencies kept for the hedging deadline
+            min_samples: Latencies observed before the deadline adapts
+        """
+        self.name = name
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = {
+            "first_token": LatencyTracker(window, min_samples),
+            "completion": LatencyTracker(window, min_samples),
+        }
+
+
+class HedgedLLMClient:
+    """
+    Chat completions over several LLM backends with hedging, failover and circuit breaking.
+
+    Each request goes to the first backend whose circuit is closed. If it has
+    not returned its first token (or, without streaming, its completion) by
+    a deadline, the p95 of that backend's recent latencies, the same request
+    is also sent to the next backend and whichever answers first is used; the
+    other request is cancelled. Hedges are limited by a budget, a fraction of
+    all requests, so a slow provider cannot double the load. A backend that
+    fails with a transient error is replaced by the next one immediately.
+    Once a stream has produced its first token it is not switched.
+
+    Exposes the LLMClient API (chat, chat_stream and close).
+    """
+
+    def __init__(self, backends: List[LLMBackend], hedge_percentile: float = 95, hedge_delay: float = 2.0,
+                 min_hedge_delay: float = 0.25, hedge_budget: float = 0.1, max_hedge_burst: float = 10):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            backends: Backends in order of preference
+            hedge_percentile: Percentile of the backend's recent latencies after
+                which a hedged request is sent
+            hedge_delay: Deadline used until the backend has enough latencies
+            min_hedge_delay: Lower bound of the deadline
+            hedge_budget: Hedged requests allowed per request, on average
+            max_hedge_burst: Hedged requests allowed in a row when the budget
+                has been saved up
+        """
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = backends
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.hedge_budget = hedge_budget
+        self.max_hedge_burst = max_hedge_burst
+        self._hedge_tokens = max_hedge_burst
+        self._lock = threading.Lock()
+
+    def hedge_deadline(self, backend: LLMBackend, kind: str) -> float:
+        """Seconds to wait for a backend before hedging."""
+        observed = backend.latency[kind].percentile(self.hedge_percentile)
+        return max(self.hedge_delay if observed is None else observed, self.min_hedge_delay)
+
+    async def chat(self, messages: List[Dict], **params) -> Any:
+        """Create a chat completion, see LLMClient.chat()."""
+        return await self._dispatch(
+            "completion",
+            lambda client: client.chat(messages, **params),
+            None
+        )
+
+    async def chat_stream(self, messages: List[Dict], **params) -> AsyncIterator[Any]:
+        """Create a streaming chat completion, see LLMClient.chat_stream()."""
+        async def start(client):
+            stream = client.chat_stream(messages, **params)
+            try:
+                return stream, await anext(stream)
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def discard(result):
+            await result[0].aclose()
+
+        stream, first_chunk = await self._dispatch("first_token", start, discard)
+        try:
+            if first_chunk is None:
+                return
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def close(self):
+        """Close every backend's sessions."""
+        for backend in self.backends:
+            await backend.client.close()
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self._hedge_tokens < 1:
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+    def _candidates(self) -> List[LLMBackend]:
+        available = [backend for backend in self.backends if backend.breaker.available()]
+        # With every circuit open, trying the backends is better than failing outright
+        return available or list(self.backends)
+
+    async def _dispatch(self, kind: str, start: Callable[[LLMClient], Awaitable],
+                        discard: Optional[Callable[[Any], Awaitable]]) -> Any:
+        with self._lock:
+            self._hedge_tokens = min(self._hedge_tokens + self.hedge_budget, self.max_hedge_burst)
+
+        candidates = self._candidates()
+        running: Dict[asyncio.Task, Tuple[LLMBackend, float]] = {}
+
+        def launch() -> Optional[LLMBackend]:
+            while candidates:
+                backend = candidates.pop(0)
+                if backend.breaker.allow() or not any(b.breaker.available() for b in self.backends):
+                    running[asyncio.ensure_future(start(backend.client))] = (backend, time.perf_counter())
+                    return backend
+            return None
+
+        primary = launch()
+        if primary is None:
+            raise RuntimeError("No LLM backend accepted the request")
+        primary_started = time.perf_counter()
+        hedge_checked = False
+        hedged = False
+        answered = False
+        error = None
+        fatal = None
+        try:
+            while running:
+                timeout = None
+                if not hedge_checked and candidates:
+                    timeout = max(0.0, self.hedge_deadline(primary, kind) - (time.perf_counter() - primary_started))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The first backend is slower than usual: race it against the next one
+                    hedge_checked = True
+                    if self._take_hedge() and launch() is not None:
+                        hedged = True
+                    continue
+
+                for task in done:
+                    backend, started = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        metrics.record_llm_backend(backend.name, "error")
+                        if backend.client.is_retryable(e):
+                            if backend.breaker.record_failure():
+                                print(f"LLM backend '{backend.name}' failing ({type(e).__name__}: {e}); circuit open")
+                        else:
+                            # The request itself was rejected: no other backend is tried for it
+                            backend.breaker.release()
+                            fatal = fatal or e
+                        error = fatal or e
+                        # Fail over right away unless another request is already running, which may still answer
+                        if not running and fatal is None:
+                            launch()
+                        continue
+
+                    seconds = time.perf_counter() - started
+                    backend.breaker.record_success()
+                    backend.latency[kind].observe(seconds)
+                    metrics.record_llm_backend(backend.name, "ok", kind, seconds)
+                    if hedged:
+                        metrics.record_hedge(won=backend is not primary)
+                    answered = True
+                    return result
+            raise error
+        finally:
+            # Requests still running (or finished at the same time as the winner) lost the race
+            await self._cancel(running, primary if answered else None, discard)
+
+    async def _cancel(self, running: Dict[asyncio.Task, Tuple[LLMBackend, float]], overtaken: Optional[LLMBackend],
+                      discard: Optional[Callable[[Any], Awaitable]]):
+        """
+        Cancel the given requests, discarding any that answered meanwhile.
+
+        Args:
+            running: Requests to cancel
+            overtaken: The first backend, if a hedged request answered before it.
+                Counts as a failure, so a stalled backend ends up with an open circuit
+            discard: Releases an answer that will not be used
+        """
+        for task in running:
+            task.cancel()
+        results = await asyncio.gather(*running, return_exceptions=True)
+        for (backend, started), result in zip(running.values(), results):
+            if discard is not None and not isinstance(result, BaseException):
+                await discard(result)
+            metrics.record_llm_backend(backend.name, "cancelled")
+            if backend is overtaken:
+                backend.breaker.record_failure()
+            else:
+                backend.breaker.release()
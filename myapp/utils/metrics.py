@@ -0,0 +1,350 @@
+import os
+import glob
+import json
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+slow_request_logger = logging.getLogger("myapp.slow_requests")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, le: str = None) -> str:
+    pairs = list(zip(names, values))
+    if le is not None:
+        pairs.append(("le", le))
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels, in Prometheus exposition format."""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total: Dict, values: Dict):
+        """Add the values of another process to total."""
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self, values: Dict[Tuple[str, ...], float] = None) -> List[str]:
+        """Exposition lines for this process's values, or for the given (merged) ones."""
+        values = self.snapshot() if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with optional labels, in Prometheus exposition format."""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            # Per-bucket counts, then sum and count
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    @staticmethod
+    def merge(total: Dict, series: Dict):
+        """Add the series of another process to total."""
+        for key, values in series.items():
+            if key in total:
+                total[key] = [a + b for a, b in zip(total[key], values)]
+            else:
+                total[key] = list(values)
+
+    def render(self, series_by_key: Dict[Tuple[str, ...], List[float]] = None) -> List[str]:
+        """Exposition lines for this process's series, or for the given (merged) ones."""
+        series_by_key = self.snapshot() if series_by_key is None else series_by_key
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(series_by_key.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le=str(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le='+Inf')} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_duration_seconds", "Total time spent answering a chat request", ("endpoint",)
+)
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_duration_seconds", "Time spent in each stage of the chat path", ("stage",)
+)
+LLM_TOKENS = Counter(
+    "chatbot_llm_tokens_total", "Tokens sent to and generated by the LLM", ("kind",)
+)
+CACHE_REQUESTS = Counter(
+    "chatbot_response_cache_requests_total", "Semantic response cache lookups by result", ("result",)
+)
+QUERY_BATCH_SIZE = Histogram(
+    "chatbot_query_batch_size", "Queries processed together by the retrieval micro-batcher", ("stage",),
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+LLM_BACKEND_SECONDS = Histogram(
+    "chatbot_llm_backend_duration_seconds",
+    "Time until each LLM backend returned its first token or its completion", ("backend", "kind")
+)
+LLM_BACKEND_REQUESTS = Counter(
+    "chatbot_llm_backend_requests_total", "LLM backend requests by result", ("backend", "result")
+)
+LLM_HEDGES = Counter(
+    "chatbot_llm_hedged_requests_total", "Duplicate requests sent to a second backend, by which one answered", ("result",)
+)
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, LLM_TOKENS, CACHE_REQUESTS, QUERY_BATCH_SIZE,
+            LLM_BACKEND_SECONDS, LLM_BACKEND_REQUESTS, LLM_HEDGES]
+
+
+_multiprocess_dir: Optional[str] = None
+_multiprocess_lock = threading.Lock()
+
+
+def enable_multiprocess(directory: str, interval: float = 5):
+    """
+    Share metrics between the worker processes of a server.
+
+    Each process writes its metrics to a file in directory every interval
+    seconds and at exit, and render_metrics() adds up the files of every
+    process, so any worker answers a scrape with the totals. Files of
+    processes that have exited are kept, so counters do not go back when a
+    worker restarts; empty the directory when the server is redeployed.
+    Calling it again has no effect.
+
+    Args:
+        directory: Directory shared by the worker processes
+        interval: Seconds between writes of this process's metrics
+    """
+    global _multiprocess_dir
+    with _multiprocess_lock:
+        if _multiprocess_dir is not None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        _multiprocess_dir = directory
+
+    def run():
+        while True:
+            time.sleep(interval)
+            _write_snapshot()
+
+    threading.Thread(target=run, name="metrics-writer", daemon=True).start()
+    atexit.register(_write_snapshot)
+
+
+def _write_snapshot():
+    path = os.path.join(_multiprocess_dir, f"metrics-{os.getpid()}.json")
+    snapshot = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()] for metric in REGISTRY}
+    try:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Error writing metrics to {path}: {str(e)}")
+
+
+def _merged_snapshots() -> Dict[str, Dict]:
+    """Values of every metric added up over the files of all processes."""
+    _write_snapshot()
+    merged = {metric.name: {} for metric in REGISTRY}
+    for path in glob.glob(os.path.join(_multiprocess_dir, "metrics-*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric in REGISTRY:
+            metric.merge(merged[metric.name], {tuple(key): value for key, value in snapshot.get(metric.name, [])})
+    return merged
+
+
+def render_metrics() -> str:
+    """
+    All metrics in Prometheus text format: those of this process, or of
+    every process once enable_multiprocess() has been called.
+    """
+    if _multiprocess_dir is None:
+        values = {metric.name: metric.snapshot() for metric in REGISTRY}
+    else:
+        values = _merged_snapshots()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(values[metric.name]))
+    cache_requests = values[CACHE_REQUESTS.name]
+    hits, misses = cache_requests.get(("hit",), 0), cache_requests.get(("miss",), 0)
+    lines.append("# HELP chatbot_response_cache_hit_ratio Fraction of cache lookups answered from the cache")
+    lines.append("# TYPE chatbot_response_cache_hit_ratio gauge")
+    lines.append(f"chatbot_response_cache_hit_ratio {hits / (hits + misses) if hits + misses else 0.0}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """Stage timings and attributes of one chat request."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.attributes: Dict[str, object] = {}
+
+    def record(self, stage: str, seconds: float):
+        # Stages that run more than once (e.g. retries) accumulate
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_request(endpoint: str, slow_threshold: float = None) -> Iterator[RequestTrace]:
+    """
+    Time a chat request and make its trace current for the stages it runs.
+
+    The trace follows the request into sync_to_async threads, since those
+    copy the calling context.
+
+    Args:
+        endpoint: Label for the request histogram
+        slow_threshold: Seconds after which the stage breakdown is logged to
+            the "myapp.slow_requests" logger. None disables the log
+    """
+    trace = RequestTrace(endpoint)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streaming response closed from another context; nothing to restore
+            pass
+        total = trace.elapsed()
+        REQUEST_SECONDS.observe(total, endpoint=endpoint)
+        if slow_threshold and total >= slow_threshold:
+            slow_request_logger.warning(json.dumps({
+                "endpoint": endpoint,
+                "total_s": round(total, 4),
+                "stages_s": {stage: round(seconds, 4) for stage, seconds in trace.stages.items()},
+                **trace.attributes,
+            }, ensure_ascii=False))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage of the chat path, adding it to the current request trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_stage(stage: str, seconds: float):
+    """Record a stage duration measured by the caller."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    """Count LLM token usage, as reported by the provider."""
+    LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, kind="completion")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes["prompt_tokens"] = prompt_tokens
+        trace.attributes["completion_tokens"] = completion_tokens
+
+
+def record_cache_lookup(hit: bool):
+    CACHE_REQUESTS.inc(result="hit" if hit else "miss")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes["cache_hit"] = hit
+
+
+def record_batch(stage: str, size: int):
+    QUERY_BATCH_SIZE.observe(size, stage=stage)
+
+
+def record_llm_backend(backend: str, result: str, kind: str = None, seconds: float = None):
+    """
+    Count an LLM backend request and, if it answered, its latency.
+
+    Args:
+        backend: Backend name
+        result: "ok", "error" or "cancelled" (another backend answered first)
+        kind: "first_token" for streams, "completion" otherwise
+        seconds: Latency of a successful request
+    """
+    LLM_BACKEND_REQUESTS.inc(backend=backend, result=result)
+    if seconds is not None:
+        LLM_BACKEND_SECONDS.observe(seconds, backend=backend, kind=kind)
+    trace = _current_trace.get()
+    if trace is not None and result == "ok":
+        trace.attributes["llm_backend"] = backend
+
+
+def record_hedge(won: bool):
+    """Count a hedged request; won means the duplicate answered first."""
+    LLM_HEDGES.inc(result="won" if won else "lost")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes["hedged"] = True
@@ -0,0 +1,142 @@
+import time
+import queue
+import inspect
+import weakref
+import threading
+import concurrent.futures
+from typing import Any, Callable, List
+
+
+# Queued by close() to stop the background thread
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Groups concurrent calls into batches processed by one background thread.
+
+    Callers block in submit() until their item's result is ready. The thread
+    takes the first waiting item and, if other callers are active, keeps
+    collecting items for up to max_wait seconds or until max_batch_size is
+    reached, then processes them with a single call. A lone caller is
+    processed immediately, so batching adds no latency at low load.
+
+    A bound method passed as process_batch is only referenced weakly, so the
+    batcher does not keep its object alive; the thread stops when that object
+    is garbage collected or when close() is called.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait: float = 0.005, name: str = "micro-batcher", on_batch: Callable[[int], None] = None):
+        """
+        Initialize the batcher. The thread starts with the first call.
+
+        Args:
+            process_batch: Maps a list of items to the list of their results, in order
+            max_batch_size: Maximum items per batch
+            max_wait: Seconds to wait for more items once a batch has started
+            name: Name of the background thread
+            on_batch: Called with the size of every processed batch, e.g. for metrics
+        """
+        if inspect.ismethod(process_batch):
+            self._process_batch = weakref.WeakMethod(process_batch)
+            weakref.finalize(process_batch.__self__, self.close)
+        else:
+            self._process_batch = lambda: process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.on_batch = on_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        # Reentrant: the owner's finalizer may call close() from any thread, even inside submit()
+        self._lock = threading.RLock()
+        self._active = 0
+        self._closed = False
+
+    def submit(self, item: Any) -> Any:
+        """
+        Process an item as part of the next batch.
+
+        Args:
+            item: Input for process_batch
+
+        Returns:
+            The item's result. Errors raised by process_batch are re-raised
+            in every caller of the batch
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} batcher is closed")
+            self._start()
+            self._active += 1
+        try:
+            self._queue.put((item, future))
+            return future.result()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def close(self):
+        """Stop the background thread once the items already submitted are processed."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            # close() may run in the thread itself, when its owner is collected there
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _start(self):
+        # Called with self._lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    # Every active caller is already in the batch: nothing more is coming soon
+                    remaining = deadline - time.monotonic()
+                    if self._active <= len(batch) or remaining <= 0:
+                        break
+                    try:
+                        entry = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._process(batch)
+
+    def _process(self, batch: List):
+        items = [item for item, _ in batch]
+        try:
+            process_batch = self._process_batch()
+            if process_batch is None:
+                raise RuntimeError(f"{self.name} batcher's owner was garbage collected")
+            results = process_batch(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            process_batch = None
+        if self.on_batch is not None:
+            self.on_batch(len(batch))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,199 @@
+import re
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from .conversation import estimate_tokens
+
+
+# Sentence or line boundary; PDF pages break lines mid-sentence, so lines count as units too
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?;])\s+|\n+')
+WORD = re.compile(r'\w+')
+
+MIN_OVERLAP = 20
+# Characters (whitespace the splitter dropped) allowed between adjacent chunks
+MAX_GAP = 2
+# Shorter lines ("Criteria", "Consequences") are headings, repeated on purpose
+MIN_DUPLICATE_WORDS = 4
+
+
+class TokenCounter:
+    """
+    Counts tokens with the LLM's own tokenizer.
+
+    The tokenizer is loaded with transformers, either the one requested or
+    the first candidate already in the local cache; if none can be loaded
+    (e.g. offline), tokens are estimated from the text length instead.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str] = None, local_tokenizers: Sequence[str] = ()):
+        """
+        Load the tokenizer.
+
+        Args:
+            tokenizer_name: Hugging Face model id whose tokenizer to use,
+                downloaded if it is not cached
+            local_tokenizers: Model ids tried in order when tokenizer_name is
+                None, only from the local Hugging Face cache so that nothing
+                is downloaded. Tokens are estimated if none is cached
+        """
+        self.tokenizer = None
+        if tokenizer_name:
+            self.tokenizer = self._load(tokenizer_name)
+        else:
+            for name in local_tokenizers:
+                self.tokenizer = self._load(name, local_files_only=True)
+                if self.tokenizer is not None:
+                    break
+        if self.tokenizer is None:
+            print("No tokenizer loaded; estimating prompt tokens from length")
+
+    @staticmethod
+    def _load(tokenizer_name: str, local_files_only: bool = False):
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(tokenizer_name, local_files_only=local_files_only)
+        except Exception as e:
+            if not local_files_only:
+                print(f"Could not load tokenizer '{tokenizer_name}': {str(e)}")
+            return None
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+
+def _merge_overlap(first: str, second: str) -> Optional[str]:
+    """Join two chunks if the end of the first repeats the start of the second."""
+    if second in first:
+        return first
+    probe = second[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return None
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first[:start] + second
+        start = first.find(probe, start + 1)
+    return None
+
+
+def _merge_by_offset(first: Document, second: Document) -> Optional[str]:
+    """Join two chunks whose start offsets on the page show they touch or overlap."""
+    if second.metadata["start_index"] < first.metadata["start_index"]:
+        first, second = second, first
+    end = first.metadata["start_index"] + len(first.page_content)
+    offset = second.metadata["start_index"]
+    if offset > end + MAX_GAP:
+        return None
+    if offset + len(second.page_content) <= end:
+        return first.page_content
+    if offset >= end:
+        # Stand in for the dropped whitespace so offsets stay consistent for later merges
+        gap = " " * (offset - end - 1) + "\n" if offset > end else ""
+        return first.page_content + gap + second.page_content
+    return first.page_content + second.page_content[end - offset:]
+
+
+def _merge(first: Document, second: Document) -> Optional[Document]:
+    if "start_index" in first.metadata and "start_index" in second.metadata:
+        merged = _merge_by_offset(first, second)
+        start = min(first.metadata["start_index"], second.metadata["start_index"])
+        metadata = {**first.metadata, "start_index": start}
+    else:
+        # Indexes built before chunks recorded their offsets
+        merged = _merge_overlap(first.page_content, second.page_content) or _merge_overlap(second.page_content, first.page_content)
+        metadata = first.metadata
+    return Document(page_content=merged, metadata=metadata) if merged is not None else None
+
+
+def merge_chunks(documents: List[Document]) -> List[Document]:
+    """
+    Merge chunks of the same page that are adjacent, overlap or contain each other.
+
+    The merged passage keeps the position of its best-ranked chunk.
+
+    Args:
+        documents: Retrieved chunks, best first
+
+    Returns:
+        Passages, best first
+    """
+    passages: List[Document] = []
+    for doc in documents:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        for i, passage in enumerate(passages):
+            if (passage.metadata.get("source"), passage.metadata.get("page")) != key:
+                continue
+            merged = _merge(passage, doc)
+            if merged is not None:
+                passages[i] = merged
+                break
+        else:
+            passages.append(doc)
+    return passages
+
+
+def _words(sentence: str) -> frozenset:
+    return frozenset(word.lower() for word in WORD.findall(sentence))
+
+
+def _is_near_duplicate(words: frozenset, seen: List[frozenset], threshold: float) -> bool:
+    for other in seen:
+        if len(words & other) / len(words | other) >= threshold:
+            return True
+    return False
+
+
+def build_context(docs_with_scores: List[Tuple[Document, float]], max_tokens: int,
+                  count_tokens: Callable[[str], int] = estimate_tokens,
+                  duplicate_threshold: float = 0.9) -> Tuple[str, int]:
+    """
+    Assemble the prompt context from retrieved chunks within a token budget.
+
+    Overlapping chunks of the same page are merged, sentences that repeat
+    (or nearly repeat) earlier ones are dropped, and passages are added in
+    retrieval order until the budget is spent. The passage that crosses the
+    budget is cut at a sentence boundary.
+
+    Args:
+        docs_with_scores: Result of get_relevant_context_with_scores(), best
+            first (whatever the score scale, L2 distance or RRF)
+        max_tokens: Token budget for the whole context
+        count_tokens: Token counter, e.g. TokenCounter.count
+        duplicate_threshold: Word-set Jaccard similarity from which a
+            sentence counts as a repeat
+
+    Returns:
+        Tuple of (context string, tokens used)
+    """
+    passages = merge_chunks([doc for doc, score in docs_with_scores])
+
+    seen: List[frozenset] = []
+    parts = []
+    used = 0
+    full = False
+    for passage in passages:
+        kept = []
+        for sentence in SENTENCE_BOUNDARY.split(passage.page_content):
+            sentence = sentence.strip()
+            words = _words(sentence)
+            if not words:
+                continue
+            if len(words) >= MIN_DUPLICATE_WORDS and _is_near_duplicate(words, seen, duplicate_threshold):
+                continue
+            # Separators between sentences cost about a token each
+            cost = count_tokens(sentence) + 1
+            if used + cost > max_tokens:
+                full = True
+                break
+            if len(words) >= MIN_DUPLICATE_WORDS:
+                seen.append(words)
+            kept.append(sentence)
+            used += cost
+        if kept:
+            parts.append("\n".join(kept))
+        if full:
+            break
+    return "\n\n".join(parts), used
@@ -1,17 +1,35 @@
 import os
 import glob
-from typing import List, Tuple
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+import json
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from filelock import FileLock, Timeout
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from . import metrics
+from .index_store import CompactFaissStore
+from .lexical_index import BM25Index, reciprocal_rank_fusion
+from .micro_batch import MicroBatcher
+from .chunking import is_source_file, load_source
+from .embeddings import create_embeddings
+from .ingestion import IngestionPipeline, file_hash
 
 
 class RAGService:
     """Service for Retrieval-Augmented Generation using FAISS vector store."""
+
+    # Candidates searched before applying a metadata filter
+    FILTER_FETCH_K = 200
     
-    def __init__(self, data_dir: str = None, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, data_dir: str = None, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 batch_size: int = 64, ingest_workers: int = None, torch_threads: int = None,
+                 index_type: str = None, nprobe: int = 16, retrieval_mode: str = "vector",
+                 chunker: str = "recursive", query_batch_size: int = 1, query_batch_wait_ms: float = 5,
+                 embedding_backend: str = "torch", embedding_model_dir: str = None,
+                 embeddings: Embeddings = None):
         """
         Initialize RAG service.
         
@@ -19,6 +37,25 @@ class RAGService:
             data_dir: Directory containing PDF files. Defaults to myapp/data
             chunk_size: Size of text chunks for splitting
             chunk_overlap: Overlap between chunks
+            batch_size: Number of chunks embedded per batch when indexing
+            ingest_workers: Processes used to parse PDFs. Defaults to the CPU count
+            torch_threads: Threads used by torch (or ONNX Runtime) when embedding. Defaults
+                to the runtime's own setting
+            index_type: Compact FAISS index type (see index_store.INDEX_TYPES). None keeps
+                the LangChain flat index with its pickled docstore
+            nprobe: Search breadth for IVF and HNSW index types
+            retrieval_mode: "vector" for FAISS only, or "hybrid" to fuse FAISS and
+                BM25 results with reciprocal rank fusion
+            chunker: "recursive" for fixed-size overlapping chunks, or "sections"
+                for one chunk per Best Practice section with a "section" metadata entry
+            query_batch_size: Maximum queries embedded and searched together when
+                called concurrently. 1 disables micro-batching
+            query_batch_wait_ms: Milliseconds a batch waits for more concurrent queries
+            embedding_backend: "torch" for sentence-transformers on PyTorch, or "onnx"
+                for the int8 model exported by the export_embeddings command
+            embedding_model_dir: Directory of the exported ONNX model
+            embeddings: Already loaded embedding model to use instead of creating
+                one, e.g. shared between corpora
         """
         if data_dir is None:
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -28,17 +65,52 @@ class RAGService:
         self.data_dir = data_dir
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self.ingest_workers = ingest_workers
+        self.torch_threads = torch_threads
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.retrieval_mode = retrieval_mode
+        self.chunker = chunker
+        self.embedding_backend = embedding_backend
+        self.embedding_model_dir = embedding_model_dir
+        self.shared_embeddings = embeddings
         self.vector_store = None
+        self.lexical_index = None
         self.embeddings = None
+        self.index_version = None
+        self._index_lock = None
+        self._reload_lock = threading.Lock()
+
+        self._embed_batcher = None
+        self._search_batcher = None
+        if query_batch_size > 1:
+            self._embed_batcher = MicroBatcher(
+                self._embed_queries, query_batch_size, query_batch_wait_ms / 1000,
+                name="query-embedding", on_batch=lambda size: metrics.record_batch("embedding", size)
+            )
+            self._search_batcher = MicroBatcher(
+                self._search_vectors, query_batch_size, query_batch_wait_ms / 1000,
+                name="vector-search", on_batch=lambda size: metrics.record_batch("search", size)
+            )
         
+    def close(self):
+        """Stop the query batching threads and release the index."""
+        for batcher in (self._embed_batcher, self._search_batcher):
+            if batcher is not None:
+                batcher.close()
+        self._close_store(self.vector_store)
+        self.vector_store = None
+        self.lexical_index = None
+
     def load_documents(self) -> List[Document]:
         """
-        Load all PDF documents from the data directory.
+        Load all PDF and DOCX documents from the data directory.
         
         Returns:
             List of Document objects
         """
-        pdf_files = glob.glob(os.path.join(self.data_dir, "*.pdf"))
+        pdf_files = self._list_source_files()
         
         if not pdf_files:
             raise FileNotFoundError(f"No PDF files found in {self.data_dir}")
@@ -48,8 +120,7 @@ class RAGService:
         all_documents = []
         for pdf_file in pdf_files:
             try:
-                loader = PyPDFLoader(pdf_file)
-                documents = loader.load()
+                documents = load_source(pdf_file)
                 print(f"Loaded {len(documents)} pages from {os.path.basename(pdf_file)}")
                 all_documents.extend(documents)
             except Exception as e:
@@ -58,99 +129,563 @@ class RAGService:
         
         return all_documents
     
-    def initialize_vector_store(self, force_rebuild: bool = False):
+    def initialize_vector_store(self, force_rebuild: bool = False, sync: bool = True):
         """
         Initialize the FAISS vector store with document embeddings.
+
+        A missing or outdated index is built under a file lock shared by every
+        process, so concurrent workers build it once and the others load the
+        result.
         
         Args:
             force_rebuild: If True, rebuild the vector store even if it exists
+            sync: If True, apply new, changed or deleted PDFs to a loaded index.
+                Web and retrieval workers pass False and only read the index;
+                update_index keeps it in sync
         """
-        vector_store_path = os.path.join(self.data_dir, "faiss_index")
-        
-        # Try to load existing vector store
-        if not force_rebuild and os.path.exists(vector_store_path):
-            try:
-                print("Loading existing FAISS index...")
-                self.embeddings = HuggingFaceEmbeddings(
-                    model_name="sentence-transformers/all-MiniLM-L6-v2"
-                )
-                self.vector_store = FAISS.load_local(
-                    vector_store_path, 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                print("FAISS index loaded successfully")
+        # Loading needs no lock: the index directory is only ever replaced whole
+        if not force_rebuild and not sync and self._load_existing() in ("current", "legacy"):
+            return
+
+        with self._write_lock():
+            state = None if force_rebuild else self._load_existing()
+            # Another process may have built or synced the index while this one waited
+            if state == "legacy" or (state == "current" and not sync):
                 return
-            except Exception as e:
-                print(f"Error loading existing index: {str(e)}. Rebuilding...")
-        
+            if state == "current":
+                try:
+                    self.sync_documents()
+                except Exception as e:
+                    print(f"Error syncing index with manifest: {str(e)}. Rebuilding...")
+                    self.build_vector_store()
+                return
+            self.build_vector_store()
+
+    def _load_existing(self) -> Optional[str]:
+        """
+        Load the saved index, if any.
+
+        Returns:
+            "current" if it matches the settings, "legacy" for an index saved
+            without a manifest, or None if it has to be (re)built
+        """
+        if not os.path.exists(self._index_path()):
+            return None
+        try:
+            print("Loading existing FAISS index...")
+            manifest = self.read_manifest()
+            self._load_index(manifest)
+            print("FAISS index loaded successfully")
+        except Exception as e:
+            print(f"Error loading existing index: {str(e)}. Rebuilding...")
+            return None
+
+        if manifest is None:
+            print("FAISS index has no manifest; run 'python manage.py update_index --rebuild' to enable incremental updates")
+            return "legacy"
+        if self.lexical_index is None:
+            print("FAISS index has no BM25 index. Rebuilding...")
+            return None
+        if not self._manifest_matches_settings(manifest):
+            print("Index settings changed since the index was built. Rebuilding...")
+            return None
+        return "current"
+
+    def reload_if_changed(self) -> bool:
+        """
+        Load the index again if another process (e.g. update_index) has swapped in a new one.
+
+        Costs one stat() when nothing changed, so it can run before every
+        search. The new index is loaded under the file lock, so never while a
+        swap is in progress; if an update holds the lock, the current index
+        keeps serving and the check is repeated on the next call. The previous
+        index is not closed: searches still using it finish normally and it is
+        released once they are done.
+
+        Returns:
+            True if the index was reloaded
+        """
+        if self.vector_store is None or self._disk_index_version() in (None, self.index_version):
+            return False
+        with self._reload_lock:
+            if self._disk_index_version() in (None, self.index_version):
+                return False
+            lock = self._write_lock()
+            try:
+                lock.acquire(blocking=False)
+            except Timeout:
+                return False
+            try:
+                self._load_index(self.read_manifest(), close_previous=False)
+            finally:
+                lock.release()
+        print(f"FAISS index changed on disk; reloaded version {self.index_version}")
+        return True
+
+    def _disk_index_version(self) -> Optional[str]:
+        try:
+            return self._read_index_version(self._index_path())
+        except OSError:
+            # Missing, or being swapped right now
+            return None
+
+    def build_vector_store(self):
+        """
+        Build the FAISS vector store from scratch and write its manifest.
+
+        The index is built in a staging directory and swapped in once it is
+        complete, so readers of the current index never see a partial one.
+        Other processes wait for the build to finish before writing the index.
+        """
         # Build new vector store
         print("Building new FAISS index...")
         
-        # Load documents
-        documents = self.load_documents()
+        pdf_files = self._list_source_files()
+        if not pdf_files:
+            raise FileNotFoundError(f"No PDF files found in {self.data_dir}")
+        print(f"Found {len(pdf_files)} PDF file(s): {[os.path.basename(f) for f in pdf_files]}")
+        
+        manifest = self._new_manifest()
+
+        def record(pdf_file, entry):
+            if entry is not None:
+                manifest["files"][os.path.basename(pdf_file)] = entry
         
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
+        # Parse, split, embed and index the documents as a stream of batches
+        if self.embeddings is None:
+            self.embeddings = self._create_embeddings()
+        with self._write_lock():
+            self._build(pdf_files, manifest, record)
+
+    def _build(self, pdf_files: List[str], manifest: Dict, record):
+        staging_path = self._new_staging_dir()
+        vector_store = None
+        try:
+            if self.index_type:
+                vector_store = CompactFaissStore(self.embeddings, staging_path, index_type=self.index_type, nprobe=self.nprobe)
+            lexical_index = BM25Index()
+            vector_store, total = self._create_pipeline().run(
+                pdf_files,
+                vector_store=vector_store,
+                on_file=record,
+                on_batch=lexical_index.add_documents
+            )
+            if total == 0:
+                raise ValueError(f"No text could be extracted from the PDF files in {self.data_dir}")
+            print(f"Split into {total} chunks")
+            self._save(vector_store, lexical_index, manifest, staging_path)
+        except BaseException:
+            self._close_store(vector_store)
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+        self._close_store(vector_store)
+
+        # Save vector store
+        self._swap_in(staging_path)
+        self._load_index(manifest)
+
+    def sync_documents(self, manifest: Dict = None) -> Dict[str, List[str]]:
+        """
+        Apply new, changed and deleted PDFs to the loaded index.
+
+        Only files whose content hash differs from the manifest are re-split
+        and re-embedded; their previous chunks are removed by document ID.
+        Indexes that cannot remove vectors (hnsw_sq8) are rebuilt instead when
+        files were changed or deleted.
+
+        Args:
+            manifest: Manifest of the loaded index. Read from disk (after
+                acquiring the write lock) if omitted
+
+        Returns:
+            Dict with the file names that were added, updated and deleted
+        """
+        if self.vector_store is None:
+            raise RuntimeError("Vector store not initialized. Call initialize_vector_store() first.")
+
+        with self._write_lock():
+            return self._sync(manifest)
+
+    def _sync(self, manifest: Optional[Dict]) -> Dict[str, List[str]]:
+        if manifest is None:
+            manifest = self.read_manifest()
+        if manifest is None:
+            raise RuntimeError("FAISS index has no manifest. Rebuild it with build_vector_store() first.")
+
+        current = {os.path.basename(f): f for f in self._list_source_files()}
+        indexed = manifest["files"]
+        changes = {"added": [], "updated": [], "deleted": []}
+
+        deleted = sorted(set(indexed) - set(current))
+        modified = [pdf_file for name, pdf_file in sorted(current.items())
+                    if name not in indexed or indexed[name]["sha256"] != file_hash(pdf_file)]
+        if not deleted and not modified:
+            print("FAISS index is up to date")
+            return changes
+
+        updated = [os.path.basename(f) for f in modified if os.path.basename(f) in indexed]
+        if (deleted or updated) and not getattr(self.vector_store, "supports_delete", True):
+            print(f"{self.index_type} indexes cannot remove vectors. Rebuilding...")
+            self.build_vector_store()
+            return {
+                "added": [os.path.basename(f) for f in modified if os.path.basename(f) not in indexed],
+                "updated": updated,
+                "deleted": deleted,
+            }
+
+        # Changes are applied to a copy of the index, swapped in once saved
+        staging_path = self._new_staging_dir(copy_from=self._index_path())
+        vector_store = self._open_store(manifest, staging_path, mmap=False)
+        lexical_index = BM25Index.load(staging_path)
+
+        def delete_ids(ids):
+            if ids:
+                vector_store.delete(ids)
+                lexical_index.delete(ids)
+
+        def apply(pdf_file, entry):
+            # Old chunks are only removed once the new version parsed successfully
+            if entry is None:
+                return
+            name = os.path.basename(pdf_file)
+            if name in indexed:
+                delete_ids(indexed[name]["ids"])
+                changes["updated"].append(name)
+            else:
+                changes["added"].append(name)
+            indexed[name] = entry
+
+        try:
+            for name in deleted:
+                delete_ids(indexed.pop(name)["ids"])
+                changes["deleted"].append(name)
+
+            self._create_pipeline().run(
+                modified,
+                vector_store=vector_store,
+                on_file=apply,
+                on_batch=lexical_index.add_documents
+            )
+            if any(changes.values()):
+                self._save(vector_store, lexical_index, manifest, staging_path)
+        except BaseException:
+            self._close_store(vector_store)
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+        self._close_store(vector_store)
+
+        if not any(changes.values()):
+            shutil.rmtree(staging_path, ignore_errors=True)
+            print("FAISS index is up to date")
+            return changes
+
+        print(f"Synced FAISS index: {changes}")
+        self._swap_in(staging_path)
+        self._load_index(manifest)
+        return changes
+
+    def _list_source_files(self) -> List[str]:
+        # PDFs and DOCX files
+        return sorted(path for path in glob.glob(os.path.join(self.data_dir, "*")) if is_source_file(path))
+
+    def _create_embeddings(self) -> Embeddings:
+        if self.shared_embeddings is not None:
+            return self.shared_embeddings
+        return create_embeddings(
+            self.embedding_backend, self.embedding_model_dir,
+            batch_size=self.batch_size, threads=self.torch_threads
+        )
+
+    def _create_pipeline(self) -> IngestionPipeline:
+        return IngestionPipeline(
+            self.embeddings,
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
-            length_function=len,
+            batch_size=self.batch_size,
+            workers=self.ingest_workers,
+            torch_threads=self.torch_threads,
+            chunker=self.chunker
         )
-        chunks = text_splitter.split_documents(documents)
-        print(f"Split into {len(chunks)} chunks")
-        
-        # Create embeddings
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        
-        # Create vector store
-        self.vector_store = FAISS.from_documents(chunks, self.embeddings)
-        
-        # Save vector store
-        self.vector_store.save_local(vector_store_path)
+
+    def _index_path(self) -> str:
+        return os.path.join(self.data_dir, "faiss_index")
+
+    def _write_lock(self) -> FileLock:
+        """Serializes index builds and syncs across processes (reentrant)."""
+        if self._index_lock is None:
+            self._index_lock = FileLock(self._index_path() + ".lock")
+        return self._index_lock
+
+    def _new_staging_dir(self, copy_from: str = None) -> str:
+        """Create an empty directory (or a copy of copy_from) next to the live index."""
+        staging_path = f"{self._index_path()}.tmp-{os.getpid()}"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        if copy_from is not None:
+            shutil.copytree(copy_from, staging_path)
+        else:
+            os.makedirs(staging_path)
+        return staging_path
+
+    def _swap_in(self, staging_path: str):
+        """
+        Replace the live index directory with a completely written one.
+
+        Processes that already opened the previous index keep reading its
+        (unlinked) files until they reload.
+        """
+        vector_store_path = self._index_path()
+        old_path = f"{vector_store_path}.old-{os.getpid()}"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(vector_store_path):
+            os.replace(vector_store_path, old_path)
+        os.replace(staging_path, vector_store_path)
+        shutil.rmtree(old_path, ignore_errors=True)
         print(f"FAISS index saved to {vector_store_path}")
+
+    def _open_store(self, manifest: Optional[Dict], path: str, mmap: bool = True):
+        if manifest is not None and manifest.get("index_type"):
+            return CompactFaissStore.load_local(
+                path,
+                self.embeddings,
+                index_type=manifest["index_type"],
+                nprobe=self.nprobe,
+                mmap=mmap
+            )
+        return FAISS.load_local(
+            path, 
+            self.embeddings,
+            allow_dangerous_deserialization=True
+        )
+
+    def _load_index(self, manifest: Optional[Dict], close_previous: bool = True):
+        """
+        Load the vector store, BM25 index and version from the live index directory.
+
+        Args:
+            manifest: Manifest of the live index, or None for a legacy index
+            close_previous: Close the store loaded before. False when other
+                threads may still be searching it
+        """
+        vector_store_path = self._index_path()
+        if self.embeddings is None:
+            self.embeddings = self._create_embeddings()
+        vector_store = self._open_store(manifest, vector_store_path)
+        lexical_index = None
+        if os.path.exists(os.path.join(vector_store_path, BM25Index.FILE_NAME)):
+            lexical_index = BM25Index.load(vector_store_path)
+        if close_previous:
+            self._close_store(self.vector_store)
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.index_version = self._read_index_version(vector_store_path)
+
+    @staticmethod
+    def _close_store(vector_store):
+        if isinstance(vector_store, CompactFaissStore):
+            vector_store.close()
+
+    def _new_manifest(self) -> Dict:
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "index_type": self.index_type,
+            "chunker": self.chunker,
+            "files": {}
+        }
+
+    def _manifest_matches_settings(self, manifest: Dict) -> bool:
+        return (manifest.get("chunk_size") == self.chunk_size
+                and manifest.get("chunk_overlap") == self.chunk_overlap
+                and manifest.get("index_type") == self.index_type
+                and manifest.get("chunker", "recursive") == self.chunker)
+
+    def read_manifest(self) -> Optional[Dict]:
+        """
+        Read the manifest of per-file hashes and chunk IDs saved with the index.
+
+        Returns:
+            Manifest dict, or None for indexes built before manifests existed
+        """
+        manifest_path = os.path.join(self._index_path(), "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, vector_store, lexical_index: BM25Index, manifest: Dict, path: str):
+        """Save a vector store together with its BM25 index and manifest."""
+        vector_store.save_local(path)
+        lexical_index.save(path)
+
+        manifest_path = os.path.join(path, "manifest.json")
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    @staticmethod
+    def _read_index_version(vector_store_path: str) -> str:
+        """
+        Identify the saved index so dependent caches can detect rebuilds.
+
+        Args:
+            vector_store_path: Directory the FAISS index was saved to
+
+        Returns:
+            Version string derived from the index file's size and mtime
+        """
+        stat = os.stat(os.path.join(vector_store_path, "index.faiss"))
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embed a query with the same model used to build the index.
+
+        Args:
+            query: User query
+
+        Returns:
+            Query embedding, reusable for retrieval and caching
+        """
+        if self.embeddings is None:
+            raise RuntimeError("Vector store not initialized. Call initialize_vector_store() first.")
+
+        if self._embed_batcher is not None:
+            return self._embed_batcher.submit(query)
+        return self.embeddings.embed_query(query)
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed concurrent queries in one forward pass."""
+        if getattr(self.embeddings, "query_encode_kwargs", None):
+            # Query-specific encoding (e.g. an instruction prefix) has no batched entry point
+            return [self.embeddings.embed_query(query) for query in queries]
+        return self.embeddings.embed_documents(queries)
     
-    def get_relevant_context(self, query: str, k: int = 4) -> Tuple[str, List[Document]]:
+    def get_relevant_context(self, query: str, k: int = 4, query_embedding: List[float] = None,
+                             section: str = None) -> Tuple[str, List[Document]]:
         """
         Retrieve relevant context for a query.
         
         Args:
             query: User query
             k: Number of relevant chunks to retrieve
+            query_embedding: Precomputed embedding of the query, if available
+            section: Restrict the search to chunks of this section (e.g. "BP3").
+                Falls back to the whole index if the section has no chunks
             
         Returns:
             Tuple of (concatenated context string, list of retrieved documents)
         """
-        if self.vector_store is None:
-            raise RuntimeError("Vector store not initialized. Call initialize_vector_store() first.")
-        
         # Retrieve relevant documents
-        retrieved_docs = self.vector_store.similarity_search(query, k=k)
+        retrieved_docs = [doc for doc, score in self._search_in_section(query, k, query_embedding, section)]
         
         # Concatenate context
         context = "\n\n".join([doc.page_content for doc in retrieved_docs])
         
         return context, retrieved_docs
     
-    def get_relevant_context_with_scores(self, query: str, k: int = 4) -> Tuple[str, List[Tuple[Document, float]]]:
+    def get_relevant_context_with_scores(self, query: str, k: int = 4, query_embedding: List[float] = None,
+                                         section: str = None) -> Tuple[str, List[Tuple[Document, float]]]:
         """
         Retrieve relevant context with similarity scores.
         
         Args:
             query: User query
             k: Number of relevant chunks to retrieve
+            query_embedding: Precomputed embedding of the query, if available
+            section: Restrict the search to chunks of this section (e.g. "BP3").
+                Falls back to the whole index if the section has no chunks
             
         Returns:
-            Tuple of (concatenated context string, list of (document, score) tuples)
+            Tuple of (concatenated context string, list of (document, score) tuples).
+            Scores are L2 distances (lower is better) in vector mode and fused
+            RRF scores (higher is better) in hybrid mode.
         """
-        if self.vector_store is None:
-            raise RuntimeError("Vector store not initialized. Call initialize_vector_store() first.")
-        
         # Retrieve relevant documents with scores
-        docs_with_scores = self.vector_store.similarity_search_with_score(query, k=k)
+        docs_with_scores = self._search_in_section(query, k, query_embedding, section)
         
         # Concatenate context
         context = "\n\n".join([doc.page_content for doc, score in docs_with_scores])
         
         return context, docs_with_scores
+
+    def _search_in_section(self, query: str, k: int, query_embedding: List[float] = None,
+                           section: str = None) -> List[Tuple[Document, float]]:
+        if section is not None:
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+            results = self._search(query, k, query_embedding, metadata_filter={"section": section})
+            if results:
+                return results
+            # No chunks carry this section, e.g. an index built with the recursive chunker
+        return self._search(query, k, query_embedding)
+
+    def _search(self, query: str, k: int, query_embedding: List[float] = None,
+                metadata_filter: Dict = None) -> List[Tuple[Document, float]]:
+        if self.vector_store is None:
+            raise RuntimeError("Vector store not initialized. Call initialize_vector_store() first.")
+
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        if self.retrieval_mode != "hybrid" or self.lexical_index is None:
+            with metrics.span("faiss_search"):
+                return self._vector_search(query_embedding, k, metadata_filter)
+
+        # Hybrid: fuse a wider candidate list from each retriever
+        candidates = max(4 * k, 20)
+        with metrics.span("faiss_search"):
+            vector_hits = self._vector_search(query_embedding, candidates, metadata_filter)
+        with metrics.span("bm25_search"):
+            lexical_hits = self.lexical_index.search(query, k=candidates)
+            if metadata_filter:
+                allowed = {doc.id for doc in self.vector_store.get_by_ids([doc_id for doc_id, score in lexical_hits])
+                           if self._matches(doc, metadata_filter)}
+                lexical_hits = [(doc_id, score) for doc_id, score in lexical_hits if doc_id in allowed]
+        with metrics.span("rank_fusion"):
+            fused = reciprocal_rank_fusion([
+                [doc.id for doc, score in vector_hits],
+                [doc_id for doc_id, score in lexical_hits],
+            ])[:k]
+
+            documents = {doc.id: doc for doc, score in vector_hits}
+            missing = [doc_id for doc_id, score in fused if doc_id not in documents]
+            documents.update({doc.id: doc for doc in self.vector_store.get_by_ids(missing)})
+        return [(documents[doc_id], score) for doc_id, score in fused if doc_id in documents]
+
+    def _vector_search(self, query_embedding: List[float], k: int, metadata_filter: Dict = None) -> List[Tuple[Document, float]]:
+        if metadata_filter is None:
+            if self._search_batcher is not None:
+                return self._search_batcher.submit((query_embedding, k))
+            return self.vector_store.similarity_search_with_score_by_vector(query_embedding, k=k)
+        # Filtering happens after the search, so look further than k
+        return self.vector_store.similarity_search_with_score_by_vector(
+            query_embedding, k=k, filter=metadata_filter, fetch_k=max(self.FILTER_FETCH_K, 10 * k)
+        )
+
+    def _search_vectors(self, requests: List[Tuple[List[float], int]]) -> List[List[Tuple[Document, float]]]:
+        """Run concurrent unfiltered searches as one multi-query FAISS search."""
+        k = max(request_k for _, request_k in requests)
+        embeddings = [embedding for embedding, _ in requests]
+        if isinstance(self.vector_store, CompactFaissStore):
+            results = self.vector_store.similarity_search_with_score_by_vectors(embeddings, k=k)
+        else:
+            results = self._search_langchain_vectors(embeddings, k)
+        return [hits[:request_k] for hits, (_, request_k) in zip(results, requests)]
+
+    def _search_langchain_vectors(self, embeddings: List[List[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        # Same lookup as FAISS.similarity_search_with_score_by_vector, for a matrix of queries
+        store = self.vector_store
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if store._normalize_L2:
+            import faiss
+            faiss.normalize_L2(vectors)
+        scores, indices = store.index.search(vectors, k)
+        return [
+            [(store.docstore.search(store.index_to_docstore_id[i]), float(score))
+             for i, score in zip(row_indices, row_scores) if i != -1]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    @staticmethod
+    def _matches(doc: Document, metadata_filter: Dict) -> bool:
+        return all(doc.metadata.get(key) == value for key, value in metadata_filter.items())
@@ -0,0 +1,216 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .document_processor import section_for_query
+
+
+class SemanticResponseCache:
+    """
+    Cache of chat answers keyed on query embeddings.
+
+    A new query is served from the cache when its embedding is within a cosine
+    similarity threshold of a cached query. Entries are persisted in SQLite so
+    they survive restarts and are shared between workers, and evicted by TTL
+    and least-recent use. Each answer records the FAISS index version it was
+    retrieved from and is only served for that version, so workers still on
+    the previous index during an update keep their entries; only the answers
+    of the KEEP_INDEX_VERSIONS most recent versions are kept. Questions about
+    different Best Practices can be worded almost alike, so a cached answer
+    is only served to a query naming the same Best Practice (or none, like
+    the cached query).
+    """
+
+    # Index versions whose answers are kept, e.g. the old and new one during a rolling restart
+    KEEP_INDEX_VERSIONS = 2
+    # Seconds between writes of the last use of hits; every write makes other workers reload
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, db_path: str, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: int = 7 * 24 * 3600):
+        """
+        Initialize the response cache.
+
+        Args:
+            db_path: SQLite file used to persist the cache
+            threshold: Minimum cosine similarity to consider two queries equal
+            max_entries: Maximum number of cached answers (LRU eviction)
+            ttl_seconds: Maximum age of a cached answer
+        """
+        self.db_path = db_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                section TEXT,
+                index_version TEXT
+            );
+            CREATE INDEX IF NOT EXISTS response_cache_last_used ON response_cache (last_used_at);
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(response_cache)")}
+        if "section" not in columns:
+            # Caches created before sections were recorded
+            self._conn.execute("ALTER TABLE response_cache ADD COLUMN section TEXT")
+            self._conn.executemany(
+                "UPDATE response_cache SET section = ? WHERE id = ?",
+                [(section_for_query(query), row_id)
+                 for row_id, query in self._conn.execute("SELECT id, query FROM response_cache").fetchall()]
+            )
+        if "index_version" not in columns:
+            # Caches that kept a single index version in cache_meta
+            self._conn.execute("ALTER TABLE response_cache ADD COLUMN index_version TEXT")
+            self._conn.execute(
+                "UPDATE response_cache SET index_version = "
+                "(SELECT value FROM cache_meta WHERE key = 'index_version')"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_version ON response_cache (index_version)")
+        self._conn.commit()
+
+        # In-memory copy of the embeddings, reloaded when another connection writes
+        self._ids = np.empty(0, dtype=np.int64)
+        self._created_at = np.empty(0, dtype=np.float64)
+        self._sections: List[Optional[str]] = []
+        self._versions: List[Optional[str]] = []
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._data_version = None
+        self._dirty = True
+        # Last use of recent hits, written in batches
+        self._touched: Dict[int, float] = {}
+        self._touched_written_at = time.monotonic()
+
+    def lookup(self, query_embedding: List[float], index_version: str, section: str = None) -> Optional[Dict]:
+        """
+        Find a cached answer for a semantically equivalent query.
+
+        Args:
+            query_embedding: Embedding of the incoming query
+            index_version: Version of the FAISS index used for retrieval
+            section: Best Practice the query names, as returned by
+                section_for_query(). Only queries naming the same one match
+
+        Returns:
+            Cached response dict or None on a miss
+        """
+        with self._lock:
+            self._refresh()
+            if len(self._ids) == 0:
+                return None
+
+            now = time.time()
+            similarities = self._matrix @ self._normalize(query_embedding)
+            # Expired answers, other index versions and other sections must not hide a valid match behind them
+            similarities[self._created_at < now - self.ttl_seconds] = -np.inf
+            similarities[[entry_version != (index_version or "") for entry_version in self._versions]] = -np.inf
+            similarities[[entry_section != section for entry_section in self._sections]] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            row = self._conn.execute(
+                "SELECT response FROM response_cache WHERE id = ? AND created_at >= ?",
+                (int(self._ids[best]), now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._touched[int(self._ids[best])] = now
+            if time.monotonic() - self._touched_written_at >= self.TOUCH_INTERVAL:
+                self._write_touched()
+                self._conn.commit()
+            return json.loads(row[0])
+
+    def store(self, query: str, query_embedding: List[float], response: Dict, index_version: str):
+        """
+        Cache the answer produced for a query.
+
+        Args:
+            query: Original user query
+            query_embedding: Embedding of the query
+            response: Response dict returned to the client
+            index_version: Version of the FAISS index used for retrieval
+        """
+        now = time.time()
+        embedding = self._normalize(query_embedding)
+
+        with self._lock:
+            self._write_touched()
+            self._conn.execute(
+                "INSERT INTO response_cache (query, embedding, response, created_at, last_used_at, section, index_version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (query, embedding.tobytes(), json.dumps(response, ensure_ascii=False), now, now,
+                 section_for_query(query), index_version or "")
+            )
+            self._conn.execute("DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            # Answers of index versions no worker uses any more
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE index_version IS NULL OR index_version NOT IN "
+                "(SELECT index_version FROM response_cache WHERE index_version IS NOT NULL "
+                "GROUP BY index_version ORDER BY MAX(created_at) DESC LIMIT ?)",
+                (self.KEEP_INDEX_VERSIONS,)
+            )
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE id NOT IN "
+                "(SELECT id FROM response_cache ORDER BY last_used_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+            self._dirty = True
+
+    def clear(self):
+        """Remove every cached answer."""
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+            self._dirty = True
+
+    def _write_touched(self):
+        # Called with self._lock held; the caller commits
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE response_cache SET last_used_at = MAX(last_used_at, ?) WHERE id = ?",
+                [(used_at, row_id) for row_id, used_at in self._touched.items()]
+            )
+            self._touched.clear()
+        self._touched_written_at = time.monotonic()
+
+    def _refresh(self):
+        # data_version only changes on commits from other connections
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version and not self._dirty:
+            return
+
+        rows = self._conn.execute("SELECT id, embedding, created_at, section, index_version FROM response_cache").fetchall()
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._created_at = np.array([row[2] for row in rows], dtype=np.float64)
+        self._sections = [row[3] for row in rows]
+        self._versions = [row[4] for row in rows]
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._data_version = data_version
+        self._dirty = False
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
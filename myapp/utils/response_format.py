@@ -0,0 +1,91 @@
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+# Structure of the answer when the model chooses the images
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "texto": {"type": "string"},
+        "imagenes": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["texto", "imagenes"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT_STYLES = ("json_schema", "json", "none")
+
+
+def answer_response_format(style: str = "json_schema") -> Optional[Dict]:
+    """
+    response_format parameter constraining the completion to ANSWER_SCHEMA.
+
+    Args:
+        style: "json_schema" for OpenAI-compatible providers (Nebius, vLLM),
+            "json" for Text Generation Inference grammars, or "none" to rely
+            on the prompt alone
+
+    Returns:
+        The parameter value, or None when structured output is not requested
+    """
+    if style == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": "respuesta", "schema": ANSWER_SCHEMA, "strict": True}}
+    if style == "json":
+        return {"type": "json", "value": ANSWER_SCHEMA}
+    return None
+
+
+class AnswerTokenLimit:
+    """
+    max_tokens for answers, adapted to the length of recent answers.
+
+    Until min_samples answers have been observed the default is used; after
+    that the limit is a high percentile of the recent completion lengths plus
+    headroom, kept between minimum and maximum. Answers cut off by the limit
+    count as maximum-length answers, so frequent truncation raises the limit
+    again.
+    """
+
+    def __init__(self, default: int = 600, minimum: int = 150, maximum: int = 800, headroom: float = 1.3,
+                 percentile: float = 95, window: int = 200, min_samples: int = 20):
+        """
+        Initialize the limit.
+
+        Args:
+            default: Limit used until enough answers have been observed
+            minimum: Lowest limit ever returned
+            maximum: Highest limit ever returned
+            headroom: Factor applied to the observed percentile
+            percentile: Percentile of recent completion lengths to cover
+            window: Number of recent answers considered
+            min_samples: Answers observed before adapting
+        """
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.headroom = headroom
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, completion_tokens: int, truncated: bool = False):
+        """
+        Record the length of a finished answer.
+
+        Args:
+            completion_tokens: Tokens generated for the answer
+            truncated: The answer stopped at max_tokens (finish_reason "length")
+        """
+        with self._lock:
+            self._samples.append(self.maximum if truncated else completion_tokens)
+
+    def limit(self) -> int:
+        """max_tokens for the next answer."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return self.default
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return int(min(max(samples[index] * self.headroom, self.minimum), self.maximum))
@@ -0,0 +1,194 @@
+import os
+import queue
+import secrets
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Any, List, Tuple, Union
+
+from langchain_core.documents import Document
+
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """
+    Parse a worker address: "host:port" for TCP, anything else is a Unix socket path.
+
+    Args:
+        address: Address string from the settings
+
+    Returns:
+        Address in the format expected by multiprocessing.connection
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+def worker_authkey(address: str, authkey: bytes = None, create: bool = False) -> bytes:
+    """
+    Key authenticating connections to a retrieval worker.
+
+    Calls are exchanged as pickles, so anyone who can connect can run code in
+    the worker. A TCP address therefore requires an explicit key. A Unix
+    socket without one uses a random key generated when the worker starts
+    and stored next to the socket, readable only by the user running it.
+
+    Args:
+        address: "host:port" or Unix socket path
+        authkey: Key from the settings, if any
+        create: Generate a new key (the worker) instead of reading it (clients)
+
+    Returns:
+        Key to pass to Listener or Client
+    """
+    if authkey:
+        return authkey
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        raise ValueError("RETRIEVAL_WORKER_AUTHKEY must be set to serve retrieval over TCP")
+
+    key_path = address + ".key"
+    if not create:
+        with open(key_path, "rb") as f:
+            return f.read()
+    key = secrets.token_bytes(32)
+    if os.path.exists(key_path + ".tmp"):
+        os.remove(key_path + ".tmp")
+    fd = os.open(key_path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    os.replace(key_path + ".tmp", key_path)
+    return key
+
+
+class RetrievalServer:
+    """
+    Serve embedding and search calls from a single loaded RAGService.
+
+    The model and FAISS index live in this process only; Django workers call
+    it through RetrievalClient instead of loading their own copies.
+    """
+
+    METHODS = ("embed_query", "get_relevant_context", "get_relevant_context_with_scores")
+    ATTRIBUTES = ("index_version",)
+
+    def __init__(self, rag_service, address: str, authkey: bytes):
+        """
+        Initialize the retrieval server.
+
+        Args:
+            rag_service: Initialized RAGService used to answer requests
+            address: "host:port" or Unix socket path to listen on
+            authkey: Shared secret clients must present. Required for TCP;
+                generated for a Unix socket if empty (see worker_authkey)
+        """
+        self.rag_service = rag_service
+        self.address = parse_address(address)
+        self.authkey = worker_authkey(address, authkey, create=True)
+
+    def serve_forever(self):
+        """Accept connections and handle each one in its own thread."""
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"Retrieval worker listening on {listener.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Error accepting retrieval connection: {str(e)}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    name, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    conn.send(("ok", self._dispatch(name, args, kwargs)))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+
+    def _dispatch(self, name: str, args: tuple, kwargs: dict) -> Any:
+        if name in self.METHODS or name in self.ATTRIBUTES:
+            # Pick up an index swapped in by update_index
+            self.rag_service.reload_if_changed()
+        if name in self.METHODS:
+            return getattr(self.rag_service, name)(*args, **kwargs)
+        if name in self.ATTRIBUTES:
+            return getattr(self.rag_service, name)
+        if name == "ping":
+            return "pong"
+        raise ValueError(f"Unknown retrieval call: {name}")
+
+
+class RetrievalClient:
+    """
+    Thin client exposing the retrieval part of the RAGService API.
+
+    Connections to the worker are pooled so concurrent requests in the same
+    Django process do not serialize on one socket.
+    """
+
+    def __init__(self, address: str, authkey: bytes, pool_size: int = 8):
+        """
+        Initialize the retrieval client.
+
+        Args:
+            address: "host:port" or Unix socket path of the retrieval worker
+            authkey: Shared secret configured on the worker. Required for TCP;
+                read from the worker's key file for a Unix socket if empty
+            pool_size: Maximum number of idle connections kept open
+        """
+        if not authkey and isinstance(parse_address(address), tuple):
+            raise ValueError("RETRIEVAL_WORKER_AUTHKEY must be set to use a retrieval worker over TCP")
+        self.address = parse_address(address)
+        self._address = address
+        self.authkey = authkey
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    @property
+    def index_version(self) -> str:
+        return self._call("index_version")
+
+    def ping(self) -> bool:
+        return self._call("ping") == "pong"
+
+    def embed_query(self, query: str) -> List[float]:
+        return self._call("embed_query", query)
+
+    def get_relevant_context(self, query: str, k: int = 4, **kwargs) -> Tuple[str, List[Document]]:
+        return self._call("get_relevant_context", query, k=k, **kwargs)
+
+    def get_relevant_context_with_scores(self, query: str, k: int = 4, **kwargs) -> Tuple[str, List[Tuple[Document, float]]]:
+        return self._call("get_relevant_context_with_scores", query, k=k, **kwargs)
+
+    def _call(self, name: str, *args, **kwargs) -> Any:
+        while True:
+            try:
+                conn, pooled = self._pool.get_nowait(), True
+            except queue.Empty:
+                # Read per connection: a restarted worker generates a new key
+                authkey = worker_authkey(self._address, self.authkey)
+                conn, pooled = Client(self.address, authkey=authkey), False
+
+            try:
+                conn.send((name, args, kwargs))
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError):
+                conn.close()
+                # A pooled connection may predate a worker restart: retry on a fresh one
+                if not pooled:
+                    raise
+
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+        if status == "error":
+            raise RuntimeError(f"Retrieval worker error: {result}")
+        return result
@@ -0,0 +1,225 @@
+import json
+import re
+from typing import List, Optional, Tuple
+
+
+# Markdown code fence around the answer, e.g. ```json ... ```
+_OPENING_FENCE = re.compile(r'^\s*```[A-Za-z]*\s*')
+_CLOSING_FENCE = re.compile(r'\s*```\s*$')
+
+
+def parse_llm_output(llm_output_str: str) -> Tuple[str, List[str]]:
+    """
+    Parse the JSON answer produced by the LLM.
+
+    Tolerates a Markdown fence around the JSON, text before it and output
+    truncated by max_tokens: the ``texto`` decoded so far and the complete
+    ``imagenes`` entries are kept.
+
+    Args:
+        llm_output_str: Raw completion text
+
+    Returns:
+        Tuple of (texto, list of image filenames). Falls back to the raw text
+        and no images when the output contains no ``texto`` field, and to the
+        raw text when ``texto`` is not a string.
+    """
+    clean_json_str = _CLOSING_FENCE.sub('', _OPENING_FENCE.sub('', llm_output_str))
+    start = clean_json_str.find('{')
+    if start == -1:
+        return llm_output_str, []
+
+    try:
+        response_data, _ = json.JSONDecoder().raw_decode(clean_json_str, start)
+        text_response = response_data.get("texto", "No se pudo parsear la respuesta del modelo.")
+        if not isinstance(text_response, str):
+            text_response = llm_output_str
+        image_filenames = response_data.get("imagenes", [])
+        if not isinstance(image_filenames, list):
+            image_filenames = []
+        return text_response, [f for f in image_filenames if isinstance(f, str)]
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        pass
+
+    # Truncated or otherwise invalid JSON: recover what the incremental parser can
+    parser = JsonStreamParser()
+    text_response = parser.feed(clean_json_str[start:])
+    if not parser.has_text:
+        return llm_output_str, []
+    return text_response.strip(), parser.partial_images()
+
+
+def is_complete_answer(llm_output_str: str) -> bool:
+    """
+    Whether the LLM output is a complete JSON answer with a ``texto`` string.
+
+    parse_llm_output() also accepts raw text and truncated JSON; answers
+    recovered that way should be shown but not cached.
+    """
+    clean_json_str = _CLOSING_FENCE.sub('', _OPENING_FENCE.sub('', llm_output_str))
+    start = clean_json_str.find('{')
+    if start == -1:
+        return False
+    try:
+        response_data, _ = json.JSONDecoder().raw_decode(clean_json_str, start)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(response_data, dict) and isinstance(response_data.get("texto"), str)
+
+
+class JsonStreamParser:
+    """
+    Incremental parser for the {"texto": ..., "imagenes": [...]} answer.
+
+    Completion deltas are fed as they arrive; the decoded content of the
+    ``texto`` string is returned piece by piece, and the ``imagenes`` list
+    becomes available as soon as its closing bracket has been received.
+    """
+
+    _TEXT_KEY = re.compile(r'"texto"\s*:\s*"')
+    _IMAGES_KEY = re.compile(r'"imagenes"\s*:\s*\[')
+    _STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.buffer = ""
+        self._text_pos = None
+        self._text_done = False
+        self._images = None
+
+    def feed(self, delta: str) -> str:
+        """
+        Add a completion delta to the buffer.
+
+        Args:
+            delta: New text received from the model
+
+        Returns:
+            Newly decoded characters of the ``texto`` field (may be empty)
+        """
+        self.buffer += delta or ""
+
+        if self._text_pos is None:
+            match = self._TEXT_KEY.search(self.buffer)
+            if match:
+                self._text_pos = match.end()
+
+        text = ""
+        if self._text_pos is not None and not self._text_done:
+            text = self._decode_text()
+
+        if self._images is None:
+            self._images = self._scan_images()
+
+        return text
+
+    @property
+    def has_text(self) -> bool:
+        """Whether the ``texto`` field has started."""
+        return self._text_pos is not None
+
+    @property
+    def images(self) -> Optional[List[str]]:
+        """Image filenames once the ``imagenes`` array is closed, otherwise None."""
+        return self._images
+
+    def result(self) -> Tuple[str, List[str]]:
+        """Parse the complete buffer once the stream has ended."""
+        return parse_llm_output(self.buffer)
+
+    def partial_images(self) -> List[str]:
+        """Image filenames received so far, including those of an unclosed ``imagenes`` array."""
+        if self._images is not None:
+            return self._images
+        match = self._IMAGES_KEY.search(self.buffer)
+        if not match:
+            return []
+        values = []
+        for literal in self._STRING.findall(self.buffer, match.end()):
+            try:
+                values.append(json.loads(literal))
+            except json.JSONDecodeError:
+                pass
+        return values
+
+    def _decode_text(self) -> str:
+        out = []
+        pos = self._text_pos
+        buf = self.buffer
+        while pos < len(buf):
+            char = buf[pos]
+            if char == '"':
+                self._text_done = True
+                pos += 1
+                break
+            if char != '\\':
+                out.append(char)
+                pos += 1
+                continue
+
+            # Escape sequence: wait until it is complete before decoding it
+            if pos + 1 >= len(buf):
+                break
+            code = buf[pos + 1]
+            if code in self._ESCAPES:
+                out.append(self._ESCAPES[code])
+                pos += 2
+            elif code == 'u':
+                decoded, consumed = self._decode_unicode(buf, pos)
+                if consumed == 0:
+                    break
+                out.append(decoded)
+                pos += consumed
+            else:
+                out.append(code)
+                pos += 2
+
+        self._text_pos = pos
+        return "".join(out)
+
+    @staticmethod
+    def _decode_unicode(buf: str, pos: int) -> Tuple[str, int]:
+        if pos + 6 > len(buf):
+            return "", 0
+        try:
+            code_point = int(buf[pos + 2:pos + 6], 16)
+        except ValueError:
+            return buf[pos + 2:pos + 6], 6
+
+        if 0xD800 <= code_point <= 0xDBFF:
+            # High surrogate: needs the following \uXXXX to form a character
+            if pos + 12 > len(buf):
+                return "", 0
+            try:
+                low = int(buf[pos + 8:pos + 12], 16)
+            except ValueError:
+                return "", 6
+            code_point = 0x10000 + ((code_point - 0xD800) << 10) + (low - 0xDC00)
+            return chr(code_point), 12
+        return chr(code_point), 6
+
+    def _scan_images(self) -> Optional[List[str]]:
+        match = self._IMAGES_KEY.search(self.buffer)
+        if not match:
+            return None
+
+        in_string = False
+        escaped = False
+        for pos in range(match.end(), len(self.buffer)):
+            char = self.buffer[pos]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == ']':
+                try:
+                    values = json.loads(self.buffer[match.end() - 1:pos + 1])
+                except json.JSONDecodeError:
+                    return []
+                return [v for v in values if isinstance(v, str)]
+        return None
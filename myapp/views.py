@@ -1,12 +1,34 @@
 import os
+import re
 import json
+import time
+import threading
+from functools import lru_cache
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.templatetags.static import static
-from huggingface_hub import InferenceClient
 from dotenv import load_dotenv
-from .utils.rag_service import RAGService
+from .models import ChatMessage
+from .utils import metrics
+from .utils.coalescing import RequestCoalescer, normalize_query
+from .utils.corpora import create_rag_service
+from .utils.conversation import BatchWriter, SessionStore, estimate_tokens, history_messages, is_follow_up
+from .utils.document_processor import section_for_query
+from .utils.embeddings import EMBEDDING_MODEL
+from .utils.faq_store import FaqStore
+from .utils.image_index import ImageIndex
+from .utils.image_variants import load_manifest, responsive_sources
+from .utils.intent_router import IntentRouter, load_intent_centroids
+from .utils.llm_client import LLMClient
+from .utils.llm_dispatch import CircuitBreaker, HedgedLLMClient, LLMBackend
+from .utils.prompt_context import TokenCounter, build_context
+from .utils.response_cache import SemanticResponseCache
+from .utils.response_format import AnswerTokenLimit, answer_response_format
+from .utils.retrieval_worker import RetrievalClient
+from .utils.stream_parser import JsonStreamParser, is_complete_answer, parse_llm_output
 
 IMAGE_METADATA = {
     "bp1_map_pocket_clearance.png": {
@@ -57,60 +79,43 @@ IMAGE_METADATA = {
 
 load_dotenv()
 
-# Initialize RAG service
-rag_service = None
-try:
-    rag_service = RAGService()
-    rag_service.initialize_vector_store()
-    print("RAG service initialized successfully")
-except Exception as e:
-    print(f"Error initializing RAG service: {str(e)}")
 
-@csrf_exempt
-def get_bot_response(request):
-    global rag_service
-    
-    if request.method == 'POST':
-        try:
-            # Verificar configuración
-            hf_token = os.getenv('HF_API_TOKEN')
-            if not hf_token:
-                return JsonResponse({'response': "Error: Token de API no configurado"})
+NO_INFO_ANSWER = "No encuentro esta información"
 
-            # Initialize RAG service if not already done
-            if rag_service is None:
-                try:
-                    rag_service = RAGService()
-                    rag_service.initialize_vector_store()
-                except Exception as e:
-                    return JsonResponse({
-                        'response': "Error: No puedo acceder a los documentos. Por favor verifica que los archivos PDF estén correctamente ubicados."
-                    })
-
-            data = json.loads(request.body)
-            user_message = data.get('message', '').strip()
-            
-            if not user_message:
-                return JsonResponse({'response': "Por favor ingresa una pregunta."})
-
-            # Use RAG to get relevant context
-            try:
-                context, retrieved_docs = rag_service.get_relevant_context(user_message, k=3)
-                print(f"Retrieved {len(retrieved_docs)} relevant chunks for query: {user_message}")
-            except Exception as e:
-                return JsonResponse({'response': f"Error al buscar información: {str(e)}"})
-
-            # Generar respuesta con el modelo
-            client = InferenceClient(provider="nebius", api_key=hf_token)
-            
-            # List of available images for the LLM to use
-            image_files = [f for f in os.listdir(os.path.join('static', 'images', 'BP')) if f.endswith('.png')]
-            
-            # Optimized prompt - reduced from ~150 tokens to ~50 tokens
-            prompt = f"""Responde en JSON: {{"texto": "...", "imagenes": [...]}}
+
+@lru_cache(maxsize=None)
+def available_images():
+    """Imágenes de static/images/BP, leídas una sola vez por proceso."""
+    return sorted(f for f in os.listdir(os.path.join('static', 'images', 'BP')) if f.endswith('.png'))
+
+
+def build_prompt(context, user_message):
+    """
+    Construye el prompt para el modelo a partir del contexto recuperado.
+
+    Con IMAGE_SELECTION='index' las imágenes las elige el índice de imágenes y
+    el modelo responde solo texto; con 'llm' el modelo devuelve un JSON con
+    el texto y las imágenes elegidas de la lista disponible.
+    """
+    if settings.IMAGE_SELECTION == 'index':
+        return f"""Responde en texto plano basándote SOLO en el contexto.
+Si no hay info, responde exactamente: {NO_INFO_ANSWER}
+
+CONTEXTO:
+{context}
+
+PREGUNTA: {user_message}
+
+RESPUESTA:"""
+
+    # List of available images for the LLM to use
+    image_files = available_images()
+
+    # Optimized prompt - reduced from ~150 tokens to ~50 tokens
+    return f"""Responde en JSON: {{"texto": "...", "imagenes": [...]}}
 - texto: respuesta basada SOLO en el contexto
 - imagenes: nombres de archivos relevantes de {image_files} (vacío si no aplica)
-- Si no hay info: {{"texto": "No encuentro esta información", "imagenes": []}}
+- Si no hay info: {{"texto": "{NO_INFO_ANSWER}", "imagenes": []}}
 
 CONTEXTO:
 {context}
@@ -118,52 +123,795 @@ CONTEXTO:
 PREGUNTA: {user_message}
 
 JSON:"""
-            
-            response = client.chat.completions.create(
-                model="deepseek-ai/DeepSeek-V3-0324",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=600,  # Reduced from 800
-                temperature=0.3,
-                top_p=0.9
-            )
-            
-            llm_output_str = response.choices[0].message.content
-            
-            # Parse the JSON response from the LLM
-            try:
-                # The model might wrap the JSON in ```json ... ```, so we clean it
-                if llm_output_str.strip().startswith('```json'):
-                    clean_json_str = llm_output_str.strip().replace('```json', '').replace('```', '')
-                else:
-                    clean_json_str = llm_output_str
-                
-                response_data = json.loads(clean_json_str)
-                text_response = response_data.get("texto", "No se pudo parsear la respuesta del modelo.")
-                image_filenames = response_data.get("imagenes", [])
-
-                images_with_metadata = []
-                for filename in image_filenames:
-                    if isinstance(filename, str):
-                        metadata = IMAGE_METADATA.get(filename, {})
-                        images_with_metadata.append({
-                            "url": static(f"images/BP/{filename}"),
-                            "title": metadata.get("title", ""),
-                            "description": metadata.get("description", "")
-                        })
-
-            except (json.JSONDecodeError, AttributeError) as e:
-                # Fallback if the LLM fails to produce valid JSON
-                text_response = llm_output_str
-                images_with_metadata = []
-
-            return JsonResponse({'text_response': text_response, 'images': images_with_metadata})
-            
-        except json.JSONDecodeError:
-            return JsonResponse({'response': "Error: Formato de solicitud inválido."})
+
+
+@lru_cache(maxsize=None)
+def image_variants():
+    """Miniaturas WebP/AVIF generadas por build_image_variants, leídas una sola vez por proceso."""
+    return load_manifest(settings.IMAGE_VARIANTS_DIR)
+
+
+def images_with_metadata_for(image_filenames):
+    """
+    Devuelve URL, título y descripción de cada imagen seleccionada.
+
+    Si existen variantes, añade las dimensiones originales y los srcset de
+    las miniaturas para que el navegador descargue la más ligera que admita.
+    """
+    images_with_metadata = []
+    for filename in image_filenames:
+        if isinstance(filename, str):
+            metadata = IMAGE_METADATA.get(filename, {})
+            image = {
+                "url": static(f"images/BP/{filename}"),
+                "title": metadata.get("title", ""),
+                "description": metadata.get("description", "")
+            }
+            variants = image_variants().get(filename)
+            if variants is not None:
+                image.update(
+                    width=variants["width"],
+                    height=variants["height"],
+                    **responsive_sources(variants, lambda name: static(f"images/BP/variants/{name}"))
+                )
+            images_with_metadata.append(image)
+    return images_with_metadata
+
+
+# RAG service, created on first use so importing the views stays fast
+rag_service = None
+rag_service_lock = threading.Lock()
+
+DOCUMENTS_ERROR = "Error: No puedo acceder a los documentos. Por favor verifica que los archivos PDF estén correctamente ubicados."
+
+
+def new_rag_service():
+    """Crea el servicio de recuperación del corpus principal y de los corpus de RAG_CORPORA_DIR (sin cargarlo)."""
+    return create_rag_service(
+        settings.RAG_SERVICE_OPTIONS,
+        settings.RAG_CORPORA_DIR,
+        primary_name=settings.RAG_PRIMARY_CORPUS,
+        max_loaded=settings.RAG_MAX_LOADED_CORPORA,
+        fanout_workers=settings.RAG_CORPUS_FANOUT_WORKERS
+    )
+
+
+def get_rag_service():
+    """
+    Devuelve el servicio de recuperación.
+
+    Usa el worker de recuperación compartido si RETRIEVAL_WORKER_ADDRESS está
+    configurado; si no, carga el modelo y el índice en este proceso. Un
+    índice local se vuelve a cargar si update_index lo ha sustituido, para
+    que la búsqueda, la FAQ y la caché usen la versión nueva.
+    """
+    global rag_service
+
+    if rag_service is None:
+        with rag_service_lock:
+            if rag_service is None:
+                try:
+                    if settings.RETRIEVAL_WORKER_ADDRESS:
+                        service = RetrievalClient(settings.RETRIEVAL_WORKER_ADDRESS, settings.RETRIEVAL_WORKER_AUTHKEY)
+                    else:
+                        service = new_rag_service()
+                        service.initialize_vector_store(sync=False)
+                    rag_service = service
+                    print("RAG service initialized successfully")
+                except Exception as e:
+                    print(f"Error initializing RAG service: {str(e)}")
+    elif not settings.RETRIEVAL_WORKER_ADDRESS:
+        try:
+            rag_service.reload_if_changed()
         except Exception as e:
-            return JsonResponse({'response': f"Error: {str(e)}"})
-    
+            print(f"Error reloading FAISS index: {str(e)}")
+    return rag_service
+
+
+response_cache = None
+
+
+def get_response_cache():
+    """Devuelve la caché semántica de respuestas, o None si está deshabilitada."""
+    global response_cache
+
+    if response_cache is None and settings.RESPONSE_CACHE_ENABLED:
+        response_cache = SemanticResponseCache(
+            settings.RESPONSE_CACHE_PATH,
+            threshold=settings.RESPONSE_CACHE_THRESHOLD,
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.RESPONSE_CACHE_TTL
+        )
+    return response_cache
+
+
+faq_store = None
+
+
+def get_faq_store():
+    """Devuelve las respuestas precalculadas con build_faq, o None si están deshabilitadas."""
+    global faq_store
+
+    if faq_store is None and settings.FAQ_ENABLED:
+        faq_store = FaqStore(settings.FAQ_STORE_PATH, threshold=settings.FAQ_THRESHOLD)
+    return faq_store
+
+
+image_index = None
+image_index_lock = threading.Lock()
+
+
+def get_image_index(service):
+    """Devuelve el índice de imágenes, calculando sus embeddings en el primer uso."""
+    global image_index
+
+    if image_index is None:
+        with image_index_lock:
+            if image_index is None:
+                image_index = ImageIndex(
+                    IMAGE_METADATA,
+                    service.embed_query,
+                    min_score=settings.IMAGE_MIN_SCORE,
+                    max_images=settings.IMAGE_MAX_RESULTS
+                )
+    return image_index
+
+
+intent_router = None
+intent_router_lock = threading.Lock()
+
+
+def new_intent_router(centroids):
+    """Crea el router de intenciones con los umbrales de settings."""
+    return IntentRouter(
+        centroids,
+        threshold=settings.INTENT_THRESHOLD,
+        margin=settings.INTENT_MARGIN,
+        section_threshold=settings.INTENT_SECTION_THRESHOLD,
+        section_margin=settings.INTENT_SECTION_MARGIN,
+        max_canned_words=settings.INTENT_MAX_CANNED_WORDS
+    )
+
+
+def get_intent_router():
+    """Devuelve el router de intenciones precalculado con build_intents, o None si está deshabilitado o no existe."""
+    global intent_router
+
+    if intent_router is None and settings.INTENT_ROUTER_ENABLED:
+        with intent_router_lock:
+            if intent_router is None:
+                centroids = load_intent_centroids(settings.INTENT_CENTROIDS_PATH)
+                if centroids is None:
+                    print(f"Intent centroids not found at {settings.INTENT_CENTROIDS_PATH}; run 'python manage.py build_intents'")
+                    centroids = {}
+                intent_router = new_intent_router(centroids)
+    return intent_router
+
+
+def route_intent(user_message, query_embedding):
+    """
+    Clasifica la pregunta antes de la recuperación.
+
+    Returns:
+        Dict de IntentRouter.classify(), o None si el router está deshabilitado
+    """
+    router = get_intent_router()
+    if router is None:
+        return None
+    with metrics.span("intent_routing"):
+        route = router.classify(user_message, query_embedding)
+    trace = metrics.current_trace()
+    if trace is not None:
+        trace.attributes["intent"] = route['intent']
+    return route
+
+
+def images_for_answer(text_response, image_filenames):
+    """Descarta las imágenes elegidas por el índice si el modelo no encontró la respuesta."""
+    if text_response.strip().startswith(NO_INFO_ANSWER):
+        return []
+    return image_filenames
+
+
+request_coalescer = None
+
+
+def get_request_coalescer():
+    """Devuelve el coalescedor de preguntas idénticas en curso, o None si está deshabilitado."""
+    global request_coalescer
+
+    if request_coalescer is None and settings.REQUEST_COALESCING_ENABLED:
+        request_coalescer = RequestCoalescer(
+            settings.REQUEST_COALESCING_DIR or None,
+            wait_timeout=settings.REQUEST_COALESCING_WAIT_TIMEOUT
+        )
+    return request_coalescer
+
+
+llm_client = None
+
+
+def _new_llm_client(hf_token, backend, max_retries=None):
+    """
+    Cliente de un backend de LLM_BACKENDS; los campos que falten se toman de LLM_PROVIDER, LLM_MODEL, etc.
+
+    max_retries=None usa LLM_MAX_RETRIES.
+    """
+    return LLMClient(
+        api_key=os.getenv(backend['api_key_env'], '') if backend.get('api_key_env') else hf_token,
+        model=backend.get('model', settings.LLM_MODEL),
+        provider=backend.get('provider', settings.LLM_PROVIDER),
+        base_url=backend.get('base_url'),
+        timeout=backend.get('timeout', settings.LLM_TIMEOUT),
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        max_retries=settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+    )
+
+
+def get_llm_client(hf_token):
+    """
+    Devuelve el cliente LLM compartido por todo el proceso.
+
+    Con varios backends en LLM_BACKENDS, las peticiones lentas se duplican en
+    el siguiente backend y los que fallan se excluyen temporalmente.
+    """
+    global llm_client
+
+    if llm_client is None:
+        backends = settings.LLM_BACKENDS or [{'base_url': settings.LLM_BASE_URL}]
+        if len(backends) == 1:
+            llm_client = _new_llm_client(hf_token, backends[0])
+        else:
+            llm_client = HedgedLLMClient(
+                [
+                    LLMBackend(
+                        backend.get('name') or backend.get('base_url') or backend.get('provider', settings.LLM_PROVIDER),
+                        # Sin reintentos: un backend que falla se sustituye al momento por el siguiente
+                        _new_llm_client(hf_token, backend, max_retries=0),
+                        CircuitBreaker(settings.LLM_CIRCUIT_FAILURES, settings.LLM_CIRCUIT_COOLDOWN)
+                    )
+                    for backend in backends
+                ],
+                hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+                hedge_delay=settings.LLM_HEDGE_DELAY,
+                min_hedge_delay=settings.LLM_HEDGE_MIN_DELAY,
+                hedge_budget=settings.LLM_HEDGE_BUDGET
+            )
+    return llm_client
+
+
+answer_token_limit = None
+
+
+def get_answer_token_limit():
+    """Devuelve el límite de max_tokens adaptado a la longitud de las respuestas recientes."""
+    global answer_token_limit
+
+    if answer_token_limit is None:
+        answer_token_limit = AnswerTokenLimit(
+            default=settings.LLM_MAX_TOKENS,
+            minimum=settings.LLM_MAX_TOKENS_MIN,
+            maximum=settings.LLM_MAX_TOKENS_MAX
+        )
+    return answer_token_limit
+
+
+def _completion_params(selected_images):
+    """Parámetros de la llamada al modelo: max_tokens adaptativo y, si responde en JSON, el esquema."""
+    params = {'max_tokens': get_answer_token_limit().limit(), 'temperature': 0.3, 'top_p': 0.9}
+    # With the image index the model answers plain text
+    if selected_images is None:
+        params['response_format'] = answer_response_format(settings.LLM_RESPONSE_FORMAT)
+    return params
+
+
+def _observe_answer_length(usage, finish_reason, llm_output_str):
+    """Registra la longitud de la respuesta para ajustar max_tokens."""
+    completion_tokens = usage.completion_tokens if usage is not None and usage.completion_tokens else estimate_tokens(llm_output_str)
+    truncated = finish_reason == "length"
+    get_answer_token_limit().observe(completion_tokens, truncated)
+    trace = metrics.current_trace()
+    if trace is not None and truncated:
+        trace.attributes["truncated"] = True
+
+
+token_counter = None
+token_counter_lock = threading.Lock()
+
+
+def get_token_counter():
+    """Devuelve el contador de tokens del tokenizador del modelo (PROMPT_TOKENIZER)."""
+    global token_counter
+
+    if token_counter is None:
+        with token_counter_lock:
+            if token_counter is None:
+                # Sin PROMPT_TOKENIZER: el del LLM o el del modelo de embeddings si ya están descargados
+                token_counter = TokenCounter(
+                    settings.PROMPT_TOKENIZER or None, local_tokenizers=[settings.LLM_MODEL, EMBEDDING_MODEL]
+                )
+    return token_counter
+
+
+session_store = None
+history_writer = None
+history_lock = threading.Lock()
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def get_session_store():
+    """Devuelve los turnos recientes y la última recuperación de cada conversación."""
+    global session_store
+
+    if session_store is None:
+        with history_lock:
+            if session_store is None:
+                session_store = SessionStore(max_turns=settings.CHAT_HISTORY_MAX_TURNS)
+    return session_store
+
+
+def _write_chat_messages(messages):
+    ChatMessage.objects.bulk_create(messages)
+
+
+def get_history_writer():
+    """Devuelve el escritor en lote del historial, que guarda los mensajes fuera de la petición."""
+    global history_writer
+
+    if history_writer is None:
+        with history_lock:
+            if history_writer is None:
+                history_writer = BatchWriter(
+                    _write_chat_messages,
+                    batch_size=settings.CHAT_HISTORY_BATCH_SIZE,
+                    flush_interval=settings.CHAT_HISTORY_FLUSH_INTERVAL
+                )
+    return history_writer
+
+
+def _session_id_from(data):
+    """session_id enviado por el navegador, o None si no hay historial."""
+    session_id = data.get('session_id')
+    if settings.CHAT_HISTORY_ENABLED and isinstance(session_id, str) and SESSION_ID_PATTERN.match(session_id):
+        return session_id
+    return None
+
+
+def _load_turns(session_id):
+    """
+    Turnos recientes de la conversación.
+
+    Una sola consulta indexada lee los últimos turnos guardados (también los
+    respondidos por otros workers) y se completan con los de este proceso que
+    el escritor en lote aún no ha guardado.
+    """
+    with metrics.span("history_load"):
+        rows = list(ChatMessage.objects.filter(session_id=session_id)
+                    .order_by('-created_at').values('message', 'response', 'created_at')[:settings.CHAT_HISTORY_MAX_TURNS])
+    return get_session_store().merge_turns(session_id, rows[::-1])
+
+
+def _history_for(session_id):
+    """Mensajes de los turnos anteriores que caben en CHAT_HISTORY_MAX_TOKENS ([] sin sesión)."""
+    if not session_id:
+        return []
+    return history_messages(_load_turns(session_id), settings.CHAT_HISTORY_MAX_TOKENS, get_token_counter().count)
+
+
+async def _record_turn(request, session_id, user_message, text_response):
+    """
+    Guarda el turno en ChatMessage.
+
+    Los mensajes se encolan y se escriben en lote fuera de la petición; los
+    turnos de una conversación se añaden además a la memoria del proceso, para
+    que el siguiente mensaje los vea antes de que se escriban.
+    """
+    if not settings.CHAT_HISTORY_ENABLED:
+        return
+    user = await request.auser()
+    message = ChatMessage(
+        user=user if user.is_authenticated else None,
+        session_id=session_id or '',
+        message=user_message,
+        response=text_response
+    )
+    get_history_writer().add(message)
+    if session_id:
+        get_session_store().add_turn(session_id, user_message, text_response, message.created_at)
+
+
+def _retrieve(service, user_message, session_id=None, history=()):
+    """
+    Busca una respuesta en caché o, si no la hay, el contexto relevante.
+
+    Se ejecuta en un hilo del executor para no bloquear el event loop.
+
+    Returns:
+        Tupla (query_embedding, respuesta en caché o None, contexto, imágenes).
+        Las imágenes son None cuando las elige el modelo (IMAGE_SELECTION='llm')
+    """
+    with metrics.span("embedding"):
+        query_embedding = service.embed_query(user_message)
+    # Greetings, thanks and off-topic questions get their fixed answer without retrieval or LLM
+    route = route_intent(user_message, query_embedding)
+    if route is not None and route['response'] is not None:
+        return query_embedding, {'text_response': route['response'], 'images': []}, None, None
+    # get_rag_service() ya ha cargado el índice actual: la FAQ y la caché se consultan con su versión
+    index_version = service.index_version
+    faq = get_faq_store()
+    if faq is not None and not history:
+        with metrics.span("faq_lookup"):
+            answer = faq.lookup(query_embedding, index_version, section_for_query(user_message))
+        trace = metrics.current_trace()
+        if trace is not None:
+            trace.attributes["faq_hit"] = answer is not None
+        if answer is not None:
+            return query_embedding, answer, None, None
+    cache = get_response_cache()
+    # A follow-up depends on the conversation, so only opening questions use the cache
+    if cache is not None and not history:
+        with metrics.span("cache_lookup"):
+            cached = cache.lookup(query_embedding, index_version, section_for_query(user_message))
+        metrics.record_cache_lookup(cached is not None)
+        if cached is not None:
+            return query_embedding, cached, None, None
+
+    previous = get_session_store().get_retrieval(session_id) if session_id and history else None
+    if (previous is not None and section_for_query(user_message) is None
+            and is_follow_up(query_embedding, previous['query_embedding'], settings.CHAT_HISTORY_REUSE_THRESHOLD)):
+        # Follow-up on the same topic: answer from the chunks already retrieved
+        context, retrieved_docs = previous['context'], previous['documents']
+        trace = metrics.current_trace()
+        if trace is not None:
+            trace.attributes["context_reused"] = True
+    else:
+        context, retrieved_docs = retrieve_context(
+            service, user_message, query_embedding, routed_section=route['section'] if route else None
+        )
+        if session_id:
+            get_session_store().set_retrieval(session_id, query_embedding, context, retrieved_docs)
+
+    return query_embedding, None, context, select_images(service, query_embedding, retrieved_docs)
+
+
+def retrieve_context(service, user_message, query_embedding, routed_section=None):
+    """
+    Recupera los fragmentos relevantes para una pregunta.
+
+    Si RAG_SECTION_FILTER está activo, la búsqueda se limita a la sección de
+    la Best Practice que nombra la pregunta o, si no nombra ninguna, a la que
+    eligió el router de intenciones (routed_section).
+
+    Returns:
+        Tupla (contexto, documentos recuperados)
+    """
+    section = (section_for_query(user_message) or routed_section) if settings.RAG_SECTION_FILTER else None
+    with metrics.span("retrieval"):
+        _, docs_with_scores = service.get_relevant_context_with_scores(
+            user_message, k=settings.RAG_TOP_K, query_embedding=query_embedding, section=section
+        )
+    print(f"Retrieved {len(docs_with_scores)} relevant chunks for query: {user_message}")
+
+    # Merge overlapping chunks and drop repeated sentences within the token budget
+    with metrics.span("context_build"):
+        context, context_tokens = build_context(
+            docs_with_scores, settings.PROMPT_CONTEXT_MAX_TOKENS, get_token_counter().count
+        )
+    trace = metrics.current_trace()
+    if trace is not None:
+        trace.attributes["context_tokens"] = context_tokens
+    return context, [doc for doc, score in docs_with_scores]
+
+
+def select_images(service, query_embedding, retrieved_docs):
+    """Imágenes elegidas por el índice de imágenes, o None si las elige el modelo (IMAGE_SELECTION='llm')."""
+    if settings.IMAGE_SELECTION != 'index':
+        return None
+    with metrics.span("image_selection"):
+        return get_image_index(service).select(query_embedding, [doc.page_content for doc in retrieved_docs])
+
+
+def _store_in_cache(service, user_message, query_embedding, result, history=None):
+    cache = get_response_cache()
+    if cache is not None and not history:
+        with metrics.span("cache_store"):
+            cache.store(user_message, query_embedding, result, service.index_version)
+
+
+def _record_usage(usage):
+    """Cuenta los tokens de prompt y respuesta si el proveedor los informa."""
+    if usage is not None:
+        metrics.record_tokens(usage.prompt_tokens or 0, usage.completion_tokens or 0)
+
+
+def _trace_request(endpoint):
+    """Traza de una petición de chat; con METRICS_MULTIPROC_DIR sus métricas se comparten entre workers."""
+    if settings.METRICS_MULTIPROC_DIR:
+        metrics.enable_multiprocess(settings.METRICS_MULTIPROC_DIR)
+    return metrics.trace_request(endpoint, settings.SLOW_REQUEST_SECONDS)
+
+
+@csrf_exempt
+async def get_bot_response(request):
+    if request.method == 'POST':
+        with _trace_request("get_response"):
+            return await _get_bot_response(request)
+
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
+
+async def _get_bot_response(request):
+    """Cuerpo de get_bot_response, medido por su traza de petición."""
+    try:
+        # Verificar configuración
+        hf_token = os.getenv('HF_API_TOKEN')
+        if not hf_token:
+            return JsonResponse({'response': "Error: Token de API no configurado"})
+
+        # Initialize RAG service if not already done
+        service = await sync_to_async(get_rag_service, thread_sensitive=False)()
+        if service is None:
+            return JsonResponse({'response': DOCUMENTS_ERROR})
+
+        data = json.loads(request.body)
+        user_message = data.get('message', '').strip()
+        
+        if not user_message:
+            return JsonResponse({'response': "Por favor ingresa una pregunta."})
+        session_id = _session_id_from(data)
+        history = await sync_to_async(_history_for, thread_sensitive=False)(session_id)
+
+        generated = []
+
+        async def produce():
+            generated.append(True)
+            return await _answer(service, hf_token, user_message, session_id, history)
+
+        # Identical opening questions asked at the same time share one generation
+        coalescer = get_request_coalescer()
+        if coalescer is not None and not history:
+            result = await coalescer.run(normalize_query(user_message), produce)
+            if not generated:
+                _mark_coalesced()
+        else:
+            result = await produce()
+
+        if 'text_response' in result:
+            await _record_turn(request, session_id, user_message, result['text_response'])
+        return JsonResponse(result)
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'response': "Error: Formato de solicitud inválido."})
+    except Exception as e:
+        return JsonResponse({'response': f"Error: {str(e)}"})
+
+
+async def _answer(service, hf_token, user_message, session_id, history):
+    """Respuesta completa (o mensaje de error) a una pregunta, desde caché o generada por el modelo."""
+    # Use RAG to get relevant context
+    try:
+        query_embedding, cached, context, selected_images = await sync_to_async(_retrieve, thread_sensitive=False)(service, user_message, session_id, history)
+    except Exception as e:
+        return {'response': f"Error al buscar información: {str(e)}"}
+    if cached is not None:
+        return cached
+
+    result, complete = await generate_answer(hf_token, context, user_message, selected_images, history)
+    if complete:
+        await sync_to_async(_store_in_cache, thread_sensitive=False)(service, user_message, query_embedding, result, history)
+    return result
+
+
+def _mark_coalesced():
+    trace = metrics.current_trace()
+    if trace is not None:
+        trace.attributes["coalesced"] = True
+
+
+async def generate_answer(hf_token, context, user_message, selected_images, history=()):
+    """
+    Genera la respuesta completa del modelo (sin streaming) para el contexto recuperado.
+
+    Returns:
+        Tupla (dict con 'text_response' e 'images', el formato que recibe el
+        cliente; si la respuesta se recibió y parseó completa y puede guardarse)
+    """
+    with metrics.span("prompt_build"):
+        prompt = build_prompt(context, user_message)
+
+    # Generar respuesta con el modelo
+    with metrics.span("llm"):
+        response = await get_llm_client(hf_token).chat(
+            messages=list(history) + [{"role": "user", "content": prompt}],
+            **_completion_params(selected_images)
+        )
+    _record_usage(response.usage)
+
+    llm_output_str = response.choices[0].message.content
+    finish_reason = response.choices[0].finish_reason
+    _observe_answer_length(response.usage, finish_reason, llm_output_str)
+
+    # Parse the JSON response from the LLM
+    with metrics.span("parse"):
+        text_response, image_filenames = parse_llm_output(llm_output_str)
+        if selected_images is not None:
+            image_filenames = images_for_answer(text_response, selected_images)
+        images_with_metadata = images_with_metadata_for(image_filenames)
+
+    result = {'text_response': text_response, 'images': images_with_metadata}
+    return result, _is_complete(finish_reason, llm_output_str, selected_images)
+
+
+def _is_complete(finish_reason, llm_output_str, selected_images):
+    """
+    Si la respuesta del modelo llegó entera y, en modo JSON, se parseó sin recurrir al texto crudo.
+
+    Las respuestas recuperadas de una salida truncada o mal formada se muestran,
+    pero no se guardan en la caché.
+    """
+    if finish_reason == "length":
+        return False
+    return selected_images is not None or is_complete_answer(llm_output_str)
+
+
+def _sse(event, data):
+    """Formatea un evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_events(user_message, session_id, history, hf_token):
+    """Genera los eventos de una respuesta como (evento, datos): token*, images, done | error."""
+    service = await sync_to_async(get_rag_service, thread_sensitive=False)()
+    if service is None:
+        yield "error", {'response': DOCUMENTS_ERROR}
+        return
+
+    try:
+        query_embedding, cached, context, selected_images = await sync_to_async(_retrieve, thread_sensitive=False)(service, user_message, session_id, history)
+    except Exception as e:
+        yield "error", {'response': f"Error al buscar información: {str(e)}"}
+        return
+    if cached is not None:
+        yield "token", {'text': cached['text_response']}
+        yield "images", {'images': cached['images']}
+        yield "done", cached
+        return
+
+    try:
+        with metrics.span("prompt_build"):
+            prompt = build_prompt(context, user_message)
+
+        stream = get_llm_client(hf_token).chat_stream(
+            messages=list(history) + [{"role": "user", "content": prompt}],
+            stream_options={"include_usage": True},
+            **_completion_params(selected_images)
+        )
+
+        # The image index already chose the images, so the model streams plain text
+        parser = JsonStreamParser() if selected_images is None else None
+        plain_text = []
+        images_sent = False
+        llm_started = time.perf_counter()
+        first_chunk = True
+        usage = None
+        finish_reason = None
+        async for chunk in stream:
+            if first_chunk:
+                first_chunk = False
+                metrics.record_stage("llm_first_token", time.perf_counter() - llm_started)
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+                _record_usage(usage)
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content or ""
+            if parser is None:
+                plain_text.append(delta)
+                text = delta
+            else:
+                text = parser.feed(delta)
+            if text:
+                yield "token", {'text': text}
+            if parser is not None and not images_sent and parser.images is not None:
+                images_sent = True
+                yield "images", {'images': images_with_metadata_for(parser.images)}
+
+        metrics.record_stage("llm", time.perf_counter() - llm_started)
+        llm_output_str = "".join(plain_text) if parser is None else parser.buffer
+        _observe_answer_length(usage, finish_reason, llm_output_str)
+
+        # The complete answer lets the client fix up non-JSON or truncated output
+        with metrics.span("parse"):
+            if parser is None:
+                text_response, _ = parse_llm_output("".join(plain_text))
+                image_filenames = images_for_answer(text_response, selected_images)
+            else:
+                text_response, image_filenames = parser.result()
+            result = {'text_response': text_response, 'images': images_with_metadata_for(image_filenames)}
+        if not images_sent:
+            yield "images", {'images': result['images']}
+        if _is_complete(finish_reason, llm_output_str, selected_images):
+            await sync_to_async(_store_in_cache, thread_sensitive=False)(service, user_message, query_embedding, result, history)
+        yield "done", result
+    except Exception as e:
+        yield "error", {'response': f"Error: {str(e)}"}
+
+
+async def _traced_stream_events(request, user_message, session_id, hf_token):
+    """_stream_events dentro de una traza de petición que cubre todo el streaming."""
+    with _trace_request("stream_response"):
+        try:
+            history = await sync_to_async(_history_for, thread_sensitive=False)(session_id)
+        except Exception as e:
+            yield _sse("error", {'response': f"Error: {str(e)}"})
+            return
+
+        generated = []
+
+        def produce():
+            generated.append(True)
+            return _stream_events(user_message, session_id, history, hf_token)
+
+        # Identical opening questions asked at the same time share one stream
+        coalescer = get_request_coalescer()
+        if coalescer is not None and not history:
+            events = coalescer.stream(normalize_query(user_message), produce)
+        else:
+            events = produce()
+
+        try:
+            async for event, data in events:
+                if event == "done":
+                    if not generated:
+                        _mark_coalesced()
+                    await _record_turn(request, session_id, user_message, data['text_response'])
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {'response': f"Error: {str(e)}"})
+
+
+@csrf_exempt
+async def stream_bot_response(request):
+    """Versión en streaming de get_bot_response usando Server-Sent Events."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    hf_token = os.getenv('HF_API_TOKEN')
+    if not hf_token:
+        return JsonResponse({'response': "Error: Token de API no configurado"})
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'response': "Error: Formato de solicitud inválido."})
+
+    user_message = data.get('message', '').strip()
+    if not user_message:
+        return JsonResponse({'response': "Por favor ingresa una pregunta."})
+
+    session_id = _session_id_from(data)
+    response = StreamingHttpResponse(_traced_stream_events(request, user_message, session_id, hf_token), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def metrics_view(request):
+    """
+    Métricas en formato de texto de Prometheus: las de este proceso o, con
+    METRICS_MULTIPROC_DIR, la suma de todos los workers.
+
+    Solo con METRICS_ENABLED y desde METRICS_ALLOWED_IPS.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_ALLOWED_IPS and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    if settings.METRICS_MULTIPROC_DIR:
+        metrics.enable_multiprocess(settings.METRICS_MULTIPROC_DIR)
+    return HttpResponse(metrics.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def chat_view(request):
     return render(request, 'index.html')
\ No newline at end of file
@@ -1,4 +1,6 @@
 import os
+import json
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -18,17 +20,18 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 
 # Application definition
 INSTALLED_APPS = [
+    'myapp',  # Tu aplicación (antes de staticfiles: su collectstatic genera también las variantes de las imágenes)
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'myapp',  # Tu aplicación
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'myapp.middleware.StaticCacheControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,9 +65,32 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # El modo WAL (lecturas del historial mientras el hilo de escritura guarda lotes)
+        # lo activa una vez la migración 0003_sqlite_wal, no cada conexión
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Logging: el desglose de las peticiones lentas (SLOW_REQUEST_SECONDS) se escribe en la consola
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'myapp.slow_requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -90,6 +116,132 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.getenv('STATIC_ROOT') or os.path.join(BASE_DIR, 'staticfiles')  # Destino de collectstatic
+STATIC_URL_PATH = '/' + STATIC_URL.lstrip('/')
+# Sirve los estáticos desde Django (p. ej. con uvicorn sin proxy delante)
+SERVE_STATIC = os.getenv('SERVE_STATIC', 'False') == 'True'
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '3600'))  # Segundos de caché de los estáticos sin hash en el nombre
+
+# Imágenes de las Best Practices y sus variantes generadas con build_image_variants
+IMAGE_DIR = os.path.join(BASE_DIR, 'static', 'images', 'BP')
+IMAGE_VARIANTS_DIR = os.path.join(IMAGE_DIR, 'variants')
+
+# Opciones del servicio RAG (ver RAGService)
+# Modelo ONNX int8 exportado con 'python manage.py export_embeddings'
+EMBEDDING_MODEL_DIR = os.getenv('EMBEDDING_MODEL_DIR') or os.path.join(BASE_DIR, 'myapp', 'data', 'embeddings_onnx')
+
+RAG_SERVICE_OPTIONS = {
+    # torch (sentence-transformers) u onnx (modelo int8 local, sin torch ni descargas)
+    'embedding_backend': os.getenv('EMBEDDING_BACKEND', 'torch'),
+    'embedding_model_dir': EMBEDDING_MODEL_DIR,
+    # Índice FAISS compacto: flat, ivf_sq8, ivf_pq o hnsw_sq8 (vacío = índice plano de LangChain)
+    'index_type': os.getenv('FAISS_INDEX_TYPE') or None,
+    'nprobe': int(os.getenv('FAISS_NPROBE', '16')),
+    # vector (solo FAISS) o hybrid (FAISS + BM25 con reciprocal rank fusion)
+    'retrieval_mode': os.getenv('RETRIEVAL_MODE', 'vector'),
+    # sections (un chunk por Best Practice) o recursive (chunks de tamaño fijo con solapamiento)
+    'chunker': os.getenv('CHUNKER', 'sections'),
+    # Consultas simultáneas que se agrupan en un solo embedding y una sola búsqueda FAISS (1 = sin agrupar)
+    'query_batch_size': int(os.getenv('QUERY_BATCH_SIZE', '32')),
+    'query_batch_wait_ms': float(os.getenv('QUERY_BATCH_WAIT_MS', '5')),  # Espera máxima para completar un lote
+}
+
+# Corpus adicionales (asientos, IP, otros programas): un subdirectorio por corpus, cada uno con su propio índice
+RAG_CORPORA_DIR = os.getenv('RAG_CORPORA_DIR') or os.path.join(BASE_DIR, 'myapp', 'data', 'corpora')
+RAG_PRIMARY_CORPUS = os.getenv('RAG_PRIMARY_CORPUS', 'gm')  # Nombre del corpus de myapp/data
+RAG_MAX_LOADED_CORPORA = int(os.getenv('RAG_MAX_LOADED_CORPORA', '4'))  # Corpus adicionales en memoria (LRU)
+RAG_CORPUS_FANOUT_WORKERS = int(os.getenv('RAG_CORPUS_FANOUT_WORKERS', '4'))  # Hilos de búsqueda en paralelo
+
+# Limita la búsqueda a la sección de la Best Practice nombrada en la pregunta ("BP3", "Best Practice 3")
+RAG_SECTION_FILTER = os.getenv('RAG_SECTION_FILTER', 'True') == 'True'
+
+
+# Número de chunks de contexto enviados al LLM
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '3'))
+
+# Modelo de lenguaje
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'nebius')
+LLM_MODEL = os.getenv('LLM_MODEL', 'deepseek-ai/DeepSeek-V3-0324')
+LLM_BASE_URL = os.getenv('LLM_BASE_URL') or None  # Endpoint compatible con OpenAI (sustituye al proveedor)
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))  # Segundos por intento
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '32'))  # Peticiones simultáneas por worker
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+# Varios backends en orden de preferencia (JSON), cada uno con name, provider o base_url, model y opcionalmente
+# api_key_env y timeout. Vacío = un solo backend con LLM_PROVIDER, LLM_MODEL y LLM_BASE_URL
+LLM_BACKENDS = json.loads(os.getenv('LLM_BACKENDS') or '[]')
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))  # Sin primer token a este percentil, se duplica la petición en el siguiente backend
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '2.0'))  # Segundos de espera mientras no hay latencias suficientes
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.25'))
+LLM_HEDGE_BUDGET = float(os.getenv('LLM_HEDGE_BUDGET', '0.1'))  # Fracción máxima de peticiones duplicadas
+LLM_CIRCUIT_FAILURES = int(os.getenv('LLM_CIRCUIT_FAILURES', '5'))  # Fallos seguidos que excluyen un backend
+LLM_CIRCUIT_COOLDOWN = float(os.getenv('LLM_CIRCUIT_COOLDOWN', '30'))  # Segundos antes de volver a probarlo
+# Salida estructurada con IMAGE_SELECTION=llm: json_schema (proveedores compatibles con OpenAI), json (TGI) o none
+LLM_RESPONSE_FORMAT = os.getenv('LLM_RESPONSE_FORMAT', 'json_schema')
+# max_tokens inicial; después se ajusta al percentil 95 de la longitud de las respuestas recientes
+LLM_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', '600'))
+LLM_MAX_TOKENS_MIN = int(os.getenv('LLM_MAX_TOKENS_MIN', '150'))
+LLM_MAX_TOKENS_MAX = int(os.getenv('LLM_MAX_TOKENS_MAX', '800'))
+
+# Contexto del prompt: fragmentos fusionados y sin frases repetidas, dentro de un presupuesto de tokens
+PROMPT_CONTEXT_MAX_TOKENS = int(os.getenv('PROMPT_CONTEXT_MAX_TOKENS', '1200'))
+# Tokenizador usado para contar tokens, descargado del Hub si hace falta. Vacío (por defecto) = el de LLM_MODEL
+# o el del modelo de embeddings si ya están en la caché local (sin descargas); si no, estimación por longitud
+PROMPT_TOKENIZER = os.getenv('PROMPT_TOKENIZER', '')
+
+# Selección de imágenes: index (similitud de embeddings, el LLM responde solo texto) o llm (el LLM elige en su JSON)
+IMAGE_SELECTION = os.getenv('IMAGE_SELECTION', 'index')
+IMAGE_MIN_SCORE = float(os.getenv('IMAGE_MIN_SCORE', '0.4'))  # Similitud mínima para mostrar una imagen
+IMAGE_MAX_RESULTS = int(os.getenv('IMAGE_MAX_RESULTS', '3'))
+
+# Caché semántica de respuestas del chatbot
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True'
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', os.path.join(BASE_DIR, 'myapp', 'data', 'response_cache.sqlite3'))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.95'))  # Similitud coseno mínima
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', str(7 * 24 * 3600)))  # Segundos
+
+# Respuestas precalculadas a preguntas frecuentes (python manage.py build_faq)
+FAQ_ENABLED = os.getenv('FAQ_ENABLED', 'True') == 'True'
+FAQ_STORE_PATH = os.getenv('FAQ_STORE_PATH', os.path.join(BASE_DIR, 'myapp', 'data', 'faq_answers.sqlite3'))
+FAQ_QUESTIONS_PATH = os.getenv('FAQ_QUESTIONS_PATH', os.path.join(BASE_DIR, 'myapp', 'data', 'faq_questions.json'))
+FAQ_THRESHOLD = float(os.getenv('FAQ_THRESHOLD', '0.92'))  # Similitud coseno mínima con una pregunta precalculada
+
+# Router de intenciones previo a la recuperación (python manage.py build_intents)
+INTENT_ROUTER_ENABLED = os.getenv('INTENT_ROUTER_ENABLED', 'True') == 'True'
+INTENTS_PATH = os.getenv('INTENTS_PATH', os.path.join(BASE_DIR, 'myapp', 'data', 'intents.json'))  # Ejemplos y respuestas fijas
+INTENT_CENTROIDS_PATH = os.getenv('INTENT_CENTROIDS_PATH', os.path.join(BASE_DIR, 'myapp', 'data', 'intent_centroids.json'))
+INTENT_THRESHOLD = float(os.getenv('INTENT_THRESHOLD', '0.6'))  # Similitud mínima con un saludo, agradecimiento o tema ajeno
+INTENT_MARGIN = float(os.getenv('INTENT_MARGIN', '0.05'))  # Ventaja mínima sobre la Best Practice más cercana
+INTENT_SECTION_THRESHOLD = float(os.getenv('INTENT_SECTION_THRESHOLD', '0.5'))  # Similitud mínima para limitar la búsqueda a una Best Practice
+INTENT_SECTION_MARGIN = float(os.getenv('INTENT_SECTION_MARGIN', '0.03'))  # Ventaja mínima sobre la segunda Best Practice
+INTENT_MAX_CANNED_WORDS = int(os.getenv('INTENT_MAX_CANNED_WORDS', '8'))  # Palabras máximas de un saludo o agradecimiento
+
+# Preguntas idénticas en curso comparten una sola generación (entre workers mediante archivos de bloqueo)
+REQUEST_COALESCING_ENABLED = os.getenv('REQUEST_COALESCING_ENABLED', 'True') == 'True'
+REQUEST_COALESCING_DIR = os.getenv('REQUEST_COALESCING_DIR', os.path.join(tempfile.gettempdir(), 'chatbot-coalescing'))  # Vacío = solo dentro de cada proceso
+REQUEST_COALESCING_WAIT_TIMEOUT = float(os.getenv('REQUEST_COALESCING_WAIT_TIMEOUT', '90'))  # Segundos de espera a otro worker antes de generar la respuesta
+
+# Worker de recuperación compartido (vacío = cada proceso carga su propio índice)
+# Las llamadas viajan como pickle: quien pueda conectarse puede ejecutar código en el worker
+RETRIEVAL_WORKER_ADDRESS = os.getenv('RETRIEVAL_WORKER_ADDRESS', '')  # Ruta de socket Unix (recomendado) o host:puerto
+# Obligatoria con host:puerto. Con un socket Unix, vacía = clave aleatoria en <socket>.key, legible solo por su usuario
+RETRIEVAL_WORKER_AUTHKEY = os.getenv('RETRIEVAL_WORKER_AUTHKEY', '').encode()
+
+# Métricas de latencia por etapa (endpoint /metrics/ en formato Prometheus)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'  # Publica /metrics/ (desactivado por defecto)
+# IPs que pueden leer /metrics/, separadas por comas (vacío = cualquiera). Detrás de un proxy, la del proxy
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+# Directorio compartido por los workers para sumar sus métricas (vacío = cada worker publica solo las suyas)
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '0'))  # Registra el desglose por etapa de las peticiones más lentas (0 = desactivado)
+
+# Historial de conversación (ChatMessage), escrito en lotes fuera de la petición
+CHAT_HISTORY_ENABLED = os.getenv('CHAT_HISTORY_ENABLED', 'True') == 'True'
+CHAT_HISTORY_MAX_TURNS = int(os.getenv('CHAT_HISTORY_MAX_TURNS', '6'))  # Turnos recientes que se conservan por sesión
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv('CHAT_HISTORY_MAX_TOKENS', '1000'))  # Presupuesto de tokens del historial en el prompt
+CHAT_HISTORY_REUSE_THRESHOLD = float(os.getenv('CHAT_HISTORY_REUSE_THRESHOLD', '0.6'))  # Similitud con la pregunta anterior para reutilizar sus fragmentos
+CHAT_HISTORY_BATCH_SIZE = int(os.getenv('CHAT_HISTORY_BATCH_SIZE', '100'))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL', '1.0'))  # Segundos máximos antes de escribir un lote
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.contrib.staticfiles.views import serve
+from django.urls import path, include, re_path
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('myapp.urls')),
-]
\ No newline at end of file
+]
+
+if settings.SERVE_STATIC:
+    urlpatterns.append(re_path(r'^' + settings.STATIC_URL.lstrip('/') + r'(?P<path>.*)$', serve, {'insecure': True}))
\ No newline at end of file